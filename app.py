@@ -3,22 +3,41 @@ Microservicio FastAPI para Interpretación Astrológica RAG
 Puerto: 8002
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 import uvicorn
 import os
 import sys
+import json
+import asyncio
 from pathlib import Path
 
 # Importar la lógica del interpretador RAG refactorizado
-from interpretador_refactored import InterpretadorRAG
+from interpretador_refactored import InterpretadorRAG, LatenciaExcedidaError
+from llm_client import get_pool_stats, shared_clients
+from resiliencia import get_resilience_stats
+from limitador import get_limiter_stats
+from trabajos import AlmacenTrabajos, ColaTrabajos, ColaLlenaError, CallbackNoPermitidoError, vista_publica
+from planificador import planificador, CALENDARIO
+from presupuesto_tokens import get_token_stats
+from etapas import get_stage_stats
+from embeddings import get_embedding_stats
+from desconexion import (
+    ClienteDesconectadoError,
+    STATUS_CLIENTE_DESCONECTADO,
+    cancelar_si_desconecta,
+    get_disconnect_stats
+)
 from strict_models import (
     CartaNatalData,
     InterpretacionRequest,
+    InterpretacionJobRequest,
     InterpretacionResponse,
     InterpretacionItem,
+    TrabajoInterpretacionResponse,
     EventoCalendario,
     InterpretacionEventoRequest,
     InterpretacionEventosResponse,
@@ -44,10 +63,13 @@ app.add_middleware(
 # Instancia global del interpretador RAG
 interpretador = None
 
+# Cola de trabajos asíncronos (/interpretar/jobs)
+cola_trabajos = None
+
 @app.on_event("startup")
 async def startup_event():
     """Inicializar el interpretador RAG al arrancar el servidor"""
-    global interpretador
+    global interpretador, cola_trabajos
     try:
         print("🚀 Inicializando Interpretador RAG...")
         interpretador = InterpretadorRAG()
@@ -55,6 +77,17 @@ async def startup_event():
     except Exception as e:
         print(f"❌ Error al inicializar Interpretador RAG: {e}")
         sys.exit(1)
+    
+    cola_trabajos = ColaTrabajos(interpretador, AlmacenTrabajos())
+    await cola_trabajos.iniciar()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Detener los workers de trabajos y cerrar los clientes HTTP compartidos del LLM"""
+    if cola_trabajos is not None:
+        await cola_trabajos.detener()
+    planificador.shutdown()
+    await shared_clients.aclose_all()
 
 # --- Endpoints ---
 
@@ -73,10 +106,55 @@ async def health_check():
         "commit_sha": os.getenv("COMMIT_SHA")
     }
 
+@app.get("/metrics")
+async def metrics():
+    """Métricas internas para dimensionar el servicio (pool LLM, cachés de narrativas y párrafos)"""
+    cache = interpretador.cache_narrativas if interpretador is not None else None
+    cache_parrafos = interpretador.cache_parrafos if interpretador is not None else None
+    pregenerados = interpretador.parrafos_pregenerados if interpretador is not None else None
+    return {
+        "llm_pool": get_pool_stats(),
+        "llm_resilience": get_resilience_stats(),
+        "llm_providers": interpretador.proveedores_llm.stats() if interpretador is not None else None,
+        "llm_stages": get_stage_stats(),
+        "rag_index": interpretador.rag_index_report if interpretador is not None else None,
+        "embeddings": get_embedding_stats(),
+        "rag_sections": (
+            interpretador.secciones_rag.stats()
+            if interpretador is not None and interpretador.secciones_rag is not None else None
+        ),
+        "llm_limiter": get_limiter_stats(),
+        "scheduler": planificador.stats(),
+        "narrative_tokens": get_token_stats(),
+        "narrative_cache": cache.stats() if cache is not None else None,
+        "paragraph_cache": cache_parrafos.stats() if cache_parrafos is not None else None,
+        "pregenerated_paragraphs": pregenerados.stats() if pregenerados is not None else None,
+        "single_flight": (
+            interpretador.vuelos_interpretacion.stats()
+            if interpretador is not None and interpretador.vuelos_interpretacion is not None else None
+        ),
+        "jobs": cola_trabajos.stats() if cola_trabajos is not None else None,
+        "latency_budget": interpretador.degradaciones if interpretador is not None else None,
+        "cancellations": _cancellation_stats()
+    }
+
+def _cancellation_stats() -> Dict[str, Any]:
+    """Trabajo abortado por clientes desconectados (capacidad de Baseten recuperada)"""
+    scheduler = planificador.stats()
+    vuelos = interpretador.vuelos_interpretacion if interpretador is not None else None
+    return {
+        **get_disconnect_stats(),
+        "single_flight_cancelled": vuelos.stats()["cancelled"] if vuelos is not None else 0,
+        "rag_tasks_cancelled_queued": sum(clase["cancelled_queued"] for clase in scheduler.values()),
+        "rag_tasks_cancelled_running": sum(clase["cancelled_running"] for clase in scheduler.values()),
+        "llm_calls_cancelled": sum(r["cancelled"] for r in get_resilience_stats().values())
+    }
+
 @app.post("/interpretar", response_model=InterpretacionResponse)
-async def generar_interpretacion(request: InterpretacionRequest):
+async def generar_interpretacion(request: InterpretacionRequest, http_request: Request):
     """
-    Generar interpretación astrológica completa
+    Generar interpretación astrológica completa.
+    Si el cliente se desconecta, se cancela el trabajo en curso (RAG y LLM).
     """
     global interpretador
     if interpretador is None:
@@ -93,24 +171,120 @@ async def generar_interpretacion(request: InterpretacionRequest):
         # print("📝 JSON de carta natal guardado en last_carta_received.json")
         
         # Generar interpretaciones usando el RAG
-        resultado = await interpretador.generar_interpretacion_completa(
+        resultado = await cancelar_si_desconecta(http_request, interpretador.generar_interpretacion_completa(
             carta_natal_data=request.carta_natal.dict(),
             genero=request.genero,
-            tipo_carta=request.tipo
-        )
+            tipo_carta=request.tipo,
+            modo_narrativa=request.modo_narrativa,
+            profundidad=request.profundidad,
+            max_latency_ms=request.max_latency_ms
+        ))
         
         print(f"✅ Interpretación generada en {resultado['tiempo_generacion']:.2f} segundos")
         
         return InterpretacionResponse(
             interpretacion_narrativa=resultado["interpretacion_narrativa"],
             interpretaciones_individuales=resultado["interpretaciones_individuales"],
-            tiempo_generacion=resultado["tiempo_generacion"]
+            tiempo_generacion=resultado["tiempo_generacion"],
+            tokens=resultado.get("tokens"),
+            degradada=resultado.get("degradada", False),
+            motivo_degradacion=resultado.get("motivo_degradacion")
         )
         
+    except LatenciaExcedidaError as e:
+        print(f"⏱️ {e}")
+        raise HTTPException(status_code=504, detail=str(e))
+    except ClienteDesconectadoError as e:
+        # Nadie va a leer esta respuesta; el código queda en los logs de acceso
+        raise HTTPException(status_code=STATUS_CLIENTE_DESCONECTADO, detail=str(e))
     except Exception as e:
         print(f"❌ Error al generar interpretación: {e}")
         raise HTTPException(status_code=500, detail=f"Error al generar interpretación: {str(e)}")
 
+def _evento_sse(evento: str, datos: Any) -> str:
+    """Formatear un evento Server-Sent Events con payload JSON"""
+    return f"event: {evento}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+@app.post("/interpretar/stream")
+async def generar_interpretacion_stream(request: InterpretacionRequest):
+    """
+    Generar interpretación astrológica completa en streaming (Server-Sent Events)
+
+    Eventos: `interpretaciones_individuales` (primero), `token` (fragmentos de la
+    narrativa a medida que llegan), `fin` (tiempos y degradación) o `error`.
+    Solo modo_narrativa "completa" llega token a token; los demás modos en un único `token`.
+    """
+    global interpretador
+    if interpretador is None:
+        raise HTTPException(status_code=503, detail="Interpretador RAG no inicializado")
+
+    print(f"🔍 Generando interpretación (stream) para: {request.carta_natal.nombre}")
+
+    async def eventos():
+        try:
+            async for evento, datos in interpretador.generar_interpretacion_stream(
+                carta_natal_data=request.carta_natal.model_dump(),
+                genero=request.genero,
+                tipo_carta=request.tipo,
+                modo_narrativa=request.modo_narrativa,
+                profundidad=request.profundidad,
+                max_latency_ms=request.max_latency_ms
+            ):
+                if evento == "interpretaciones_individuales":
+                    datos = [InterpretacionItem(**item).model_dump(exclude_none=True) for item in datos]
+                elif evento == "fin":
+                    print(f"✅ Interpretación (stream) generada en {datos['tiempo_generacion']:.2f} segundos")
+                yield _evento_sse(evento, datos)
+        except LatenciaExcedidaError as e:
+            print(f"⏱️ {e}")
+            yield _evento_sse("error", {"detail": str(e)})
+        except Exception as e:
+            print(f"❌ Error al generar interpretación (stream): {e}")
+            yield _evento_sse("error", {"detail": f"Error al generar interpretación: {str(e)}"})
+
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/interpretar/jobs", response_model=TrabajoInterpretacionResponse, status_code=202)
+async def crear_trabajo_interpretacion(request: InterpretacionJobRequest):
+    """
+    Encolar una interpretación completa y responder enseguida.
+
+    La respuesta ya trae las interpretaciones individuales deterministas (motor JSON); la narrativa
+    (y el RAG de respaldo, si hace falta) se calcula en los workers y se consulta en
+    GET /interpretar/jobs/{job_id} o llega al callback_url.
+    """
+    if interpretador is None or cola_trabajos is None:
+        raise HTTPException(status_code=503, detail="Interpretador RAG no inicializado")
+
+    pedido = request.model_dump(exclude={"callback_url"})
+    callback_url = str(request.callback_url) if request.callback_url else None
+    try:
+        trabajo = await cola_trabajos.encolar(pedido, callback_url)
+    except CallbackNoPermitidoError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except ColaLlenaError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    except Exception as e:
+        print(f"❌ Error al crear trabajo de interpretación: {e}")
+        raise HTTPException(status_code=500, detail=f"Error al crear trabajo de interpretación: {str(e)}")
+
+    print(f"🧾 Trabajo {trabajo['id']} encolado para: {request.carta_natal.nombre}")
+    return vista_publica(trabajo)
+
+@app.get("/interpretar/jobs/{job_id}", response_model=TrabajoInterpretacionResponse)
+async def obtener_trabajo_interpretacion(job_id: str):
+    """Estado de un trabajo: pendiente, en_curso, completado (con la narrativa) o error"""
+    if cola_trabajos is None:
+        raise HTTPException(status_code=503, detail="Interpretador RAG no inicializado")
+    trabajo = cola_trabajos.almacen.obtener(job_id)
+    if trabajo is None:
+        raise HTTPException(status_code=404, detail=f"Trabajo {job_id} no encontrado")
+    return vista_publica(trabajo)
+
 @app.post("/interpretar-eventos", response_model=InterpretacionEventosResponse)
 async def interpretar_eventos_calendario(request: InterpretacionEventoRequest):
     """
@@ -132,15 +306,16 @@ async def interpretar_eventos_calendario(request: InterpretacionEventoRequest):
             json.dump(eventos_completos, f, indent=2, ensure_ascii=False)
         print("📝 JSON con eventos completos guardado en last_events_received.json")
 
-        # Lógica de interpretación (a implementar en Fase 2)
-        eventos_interpretados = []
-        for evento in request.eventos:
-            # Llamar a la nueva función de búsqueda en el interpretador
-            interpretacion = interpretador.buscar_interpretacion_evento(evento.model_dump())
-            eventos_interpretados.append(EventoInterpretado(
-                descripcion=evento.descripcion,
-                interpretacion=interpretacion
-            ))
+        # Búsquedas en el pool de la clase "calendario": no esperan detrás de las narrativas
+        # (ni por hilos ni por lugares en el limitador del LLM) y no bloquean el event loop
+        interpretaciones = await asyncio.gather(*[
+            planificador.ejecutar(CALENDARIO, interpretador.buscar_interpretacion_evento, evento.model_dump())
+            for evento in request.eventos
+        ])
+        eventos_interpretados = [
+            EventoInterpretado(descripcion=evento.descripcion, interpretacion=interpretacion)
+            for evento, interpretacion in zip(request.eventos, interpretaciones)
+        ]
 
         tiempo_generacion = time.time() - start_time
         print(f"✅ {len(eventos_interpretados)} eventos procesados en {tiempo_generacion:.2f} segundos")
@@ -163,6 +338,9 @@ async def root():
         "endpoints": {
             "health": "/health",
             "interpretar": "/interpretar",
+            "interpretar_stream": "/interpretar/stream",
+            "interpretar_jobs": "/interpretar/jobs",
+            "metrics": "/metrics",
             "docs": "/docs"
         }
     }
@@ -0,0 +1,184 @@
+"""
+Caché persistente (SQLite) de narrativas generadas por el LLM.
+- Clave: hash de los ítems (títulos + textos ordenados), género, tipo de carta,
+  modo narrativo, modelo y versión de prompts (ver FUENTES_PROMPTS)
+- Expulsión por antigüedad (TTL) y por tamaño (LRU sobre max_entries)
+- Si alguna fuente de prompts cambia, las entradas de la versión anterior se descartan al arrancar
+- Tablas independientes en el mismo archivo: "narrativas" (informe completo por carta)
+  y "parrafos" (párrafo re-escrito por ítem, compartido entre usuarios)
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Sequence
+
+# Todo lo que define el texto de los prompts narrativos o su extensión:
+# plantillas, instrucciones de género, tabla de oraciones (prompts.py), secciones y su
+# clasificación (narrativa_secciones.py) y el presupuesto de salida (presupuesto_tokens.py)
+FUENTES_PROMPTS = tuple(
+    Path(__file__).parent / nombre
+    for nombre in ("prompts.py", "narrativa_secciones.py", "presupuesto_tokens.py")
+)
+
+
+def hash_prompts(paths: Sequence[Path] = FUENTES_PROMPTS) -> str:
+    """Versión de los prompts: hash conjunto del contenido de todas sus fuentes."""
+    h = hashlib.sha256()
+    for path in paths:
+        try:
+            contenido = path.read_bytes()
+        except OSError:
+            contenido = b"sin-fuente"
+        h.update(path.name.encode("utf-8") + b"\0" + contenido + b"\0")
+    return h.hexdigest()[:16]
+
+
+def huella_interpretaciones(interpretaciones: List[Dict[str, Any]]) -> List[List[str]]:
+    """Ítems como pares [titulo, interpretacion] ordenados (independiente del orden de llegada)."""
+    return sorted([str(item.get("titulo", "")), str(item.get("interpretacion", ""))] for item in interpretaciones)
+
+
+class CacheNarrativas:
+    """Caché clave→narrativa en SQLite, segura para usar desde varios hilos."""
+
+    def __init__(self, path: Optional[str] = None, max_entries: Optional[int] = None,
+                 max_age_seconds: Optional[float] = None, prompt_version: Optional[str] = None,
+                 tabla: str = "narrativas"):
+        if not tabla.isidentifier():
+            raise ValueError(f"Nombre de tabla inválido: {tabla}")
+        self.tabla = tabla
+        self.path = path or os.getenv("NARRATIVE_CACHE_PATH", "cache/narrativas.sqlite3")
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("NARRATIVE_CACHE_MAX_ENTRIES", 5000))
+        self.max_age_seconds = max_age_seconds if max_age_seconds is not None else float(os.getenv("NARRATIVE_CACHE_MAX_AGE", 30 * 24 * 3600))
+        self.prompt_version = prompt_version or hash_prompts()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.tabla} ("
+            " clave TEXT PRIMARY KEY,"
+            " narrativa TEXT NOT NULL,"
+            " prompt_version TEXT NOT NULL,"
+            " creado REAL NOT NULL,"
+            " ultimo_acceso REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.tabla}_acceso ON {self.tabla} (ultimo_acceso)")
+        self._conn.commit()
+        self._invalidar_otras_versiones()
+
+    def clave(self, interpretaciones: List[Dict[str, Any]], genero: str, tipo_carta: str,
+              modelo: str, namespace: str = "completa") -> str:
+        """Huella determinista de todo lo que influye en el texto generado."""
+        payload = json.dumps({
+            "items": huella_interpretaciones(interpretaciones),
+            "genero": (genero or "").lower(),
+            "tipo_carta": (tipo_carta or "").lower(),
+            "modelo": modelo,
+            "namespace": namespace,
+            "prompts": self.prompt_version,
+        }, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def clave_parrafo(self, texto: str, genero: str, tipo_carta: str, modelo: str, profundidad: str = "profunda") -> str:
+        """Clave de un párrafo re-escrito: depende del texto fuente del ítem, no de la carta.
+
+        El texto identifica al ítem del vocabulario ("sol en aries", "venus en casa 7"...)
+        y cambia si se edita el dato fuente, lo que invalida el párrafo.
+        """
+        payload = json.dumps({
+            "texto": hashlib.sha256(texto.encode("utf-8")).hexdigest(),
+            "genero": (genero or "").lower(),
+            "tipo_carta": (tipo_carta or "").lower(),
+            "modelo": modelo,
+            "profundidad": profundidad,
+            "prompts": self.prompt_version,
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, clave: str) -> Optional[str]:
+        ahora = time.time()
+        with self._lock:
+            fila = self._conn.execute(
+                f"SELECT narrativa, creado FROM {self.tabla} WHERE clave = ?", (clave,)
+            ).fetchone()
+            if fila is None or ahora - fila[1] > self.max_age_seconds:
+                if fila is not None:
+                    self._conn.execute(f"DELETE FROM {self.tabla} WHERE clave = ?", (clave,))
+                    self._conn.commit()
+                    self.evictions += 1
+                self.misses += 1
+                return None
+            self._conn.execute(f"UPDATE {self.tabla} SET ultimo_acceso = ? WHERE clave = ?", (ahora, clave))
+            self._conn.commit()
+            self.hits += 1
+            return fila[0]
+
+    def set(self, clave: str, narrativa: str):
+        ahora = time.time()
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.tabla} (clave, narrativa, prompt_version, creado, ultimo_acceso)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (clave, narrativa, self.prompt_version, ahora, ahora)
+            )
+            self.stores += 1
+            self._expulsar(ahora)
+            self._conn.commit()
+
+    def _expulsar(self, ahora: float):
+        """Borrar entradas vencidas y, si se supera max_entries, las menos usadas recientemente."""
+        vencidas = self._conn.execute(
+            f"DELETE FROM {self.tabla} WHERE creado < ?", (ahora - self.max_age_seconds,)
+        ).rowcount
+        total = self._conn.execute(f"SELECT COUNT(*) FROM {self.tabla}").fetchone()[0]
+        sobrantes = 0
+        if total > self.max_entries:
+            sobrantes = self._conn.execute(
+                f"DELETE FROM {self.tabla} WHERE clave IN ("
+                f" SELECT clave FROM {self.tabla} ORDER BY ultimo_acceso ASC LIMIT ?)",
+                (total - self.max_entries,)
+            ).rowcount
+        self.evictions += vencidas + sobrantes
+
+    def _invalidar_otras_versiones(self):
+        with self._lock:
+            borradas = self._conn.execute(
+                f"DELETE FROM {self.tabla} WHERE prompt_version != ?", (self.prompt_version,)
+            ).rowcount
+            self._conn.commit()
+        if borradas:
+            print(f"🧹 Caché '{self.tabla}': {borradas} entradas invalidadas (cambiaron los prompts)")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entradas = self._conn.execute(f"SELECT COUNT(*) FROM {self.tabla}").fetchone()[0]
+        consultas = self.hits + self.misses
+        return {
+            "path": self.path,
+            "table": self.tabla,
+            "entries": entradas,
+            "max_entries": self.max_entries,
+            "max_age_seconds": self.max_age_seconds,
+            "prompt_version": self.prompt_version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / consultas, 3) if consultas else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,43 @@
+"""
+Fixtures compartidas de pytest: InterpretadorRAG apuntando a un LLM local falso.
+"""
+
+import json
+
+import pytest
+
+from fake_llm_server import FakeLLMServer
+from llm_client import shared_clients
+from resiliencia import reset_resiliencia
+from limitador import reset_limitador
+from proveedores import reset_proveedores
+
+
+@pytest.fixture
+def fake_llm():
+    reset_resiliencia()
+    reset_limitador()
+    reset_proveedores()
+    with FakeLLMServer() as server:
+        yield server
+    shared_clients.close_all()
+    reset_resiliencia()
+    reset_limitador()
+    reset_proveedores()
+
+
+@pytest.fixture
+def interpretador(fake_llm, monkeypatch, tmp_path):
+    """InterpretadorRAG real (motor JSON) cuyo LLM es el servidor falso y con caché aislada."""
+    monkeypatch.setenv("NARRATIVE_CACHE_PATH", str(tmp_path / "narrativas.sqlite3"))
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setenv("BASETEN_API_KEY", "test")
+    monkeypatch.setenv("BASETEN_BASE_URL", fake_llm.base_url)
+    from interpretador_refactored import InterpretadorRAG
+    return InterpretadorRAG()
+
+
+@pytest.fixture
+def carta_real():
+    with open("real_case_payload.json", encoding="utf-8") as f:
+        return json.load(f)
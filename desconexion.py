@@ -0,0 +1,66 @@
+"""
+Cancelación del trabajo de un pedido cuando el cliente HTTP se desconecta.
+
+FastAPI no cancela un endpoint normal si el navegador cierra la pestaña: la interpretación
+seguiría consultando el RAG y generando la narrativa de 16k tokens para nadie. Aquí el trabajo
+corre como tarea mientras se vigila el canal ASGI; si llega http.disconnect la tarea se cancela
+y la cancelación se propaga:
+- single_flight.py: la tarea compartida solo se aborta si no queda otro pedido coalescido esperándola
+- planificador.py: las consultas RAG en cola se descartan y las que corren abandonan antes de llamar al LLM
+- BasetenLLM: las llamadas async en curso cierran el request HTTP a Baseten
+"""
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Dict, TypeVar
+
+from starlette.requests import Request
+
+T = TypeVar("T")
+
+# Código no estándar (nginx) para "el cliente cerró la conexión antes de la respuesta"
+STATUS_CLIENTE_DESCONECTADO = 499
+
+
+class ClienteDesconectadoError(Exception):
+    """El cliente cerró la conexión mientras se generaba la respuesta."""
+
+
+_lock = threading.Lock()
+_desconexiones = 0
+
+
+async def _esperar_desconexion(request: Request):
+    """Consumir mensajes ASGI hasta http.disconnect (el cuerpo ya fue leído por FastAPI)."""
+    while True:
+        mensaje = await request.receive()
+        if mensaje["type"] == "http.disconnect":
+            return
+
+
+async def cancelar_si_desconecta(request: Request, trabajo: Awaitable[T]) -> T:
+    """Esperar el trabajo mientras el cliente siga conectado; si se desconecta, cancelarlo."""
+    global _desconexiones
+    tarea = asyncio.ensure_future(trabajo)
+    vigia = asyncio.ensure_future(_esperar_desconexion(request))
+    try:
+        await asyncio.wait({tarea, vigia}, return_when=asyncio.FIRST_COMPLETED)
+        if tarea.done():
+            return tarea.result()
+    finally:
+        # También si este endpoint es cancelado (apagado del servidor)
+        vigia.cancel()
+        if not tarea.done():
+            tarea.cancel()
+
+    with _lock:
+        _desconexiones += 1
+    print("🔌 Cliente desconectado: se cancela la generación en curso")
+    # Esperar a que la cancelación termine de propagarse (libera limitador y breaker)
+    await asyncio.wait({tarea})
+    raise ClienteDesconectadoError("El cliente cerró la conexión antes de recibir la respuesta")
+
+
+def get_disconnect_stats() -> Dict[str, Any]:
+    with _lock:
+        return {"client_disconnects": _desconexiones}
@@ -0,0 +1,193 @@
+"""
+Backend de embeddings del RAG, elegible por despliegue (EMBEDDING_BACKEND).
+- openai: OpenAIEmbedding (una llamada de red por consulta; requiere OPENAI_API_KEY)
+- local: vectorizador de n-gramas hasheados, solo CPU y sin red (no requiere OPENAI_API_KEY)
+
+Cualquiera de los dos se envuelve en una caché LRU en memoria de embeddings de consulta: las
+mismas consultas estandarizadas ("Sol en Aries", "Casa 7 en Libra"...) se repiten entre cartas.
+La identidad del backend entra en la huella del artefacto (indices_rag.describir_embeddings):
+cambiar de backend reconstruye el índice en lugar de mezclar vectores incompatibles.
+
+    EMBEDDING_BACKEND=local
+    EMBEDDING_LOCAL_DIM=1024
+    EMBEDDING_QUERY_CACHE_SIZE=2048
+"""
+
+import os
+import re
+import math
+import zlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+from llm_client import _env_int
+
+BACKEND_OPENAI = "openai"
+BACKEND_LOCAL = "local"
+BACKENDS = (BACKEND_OPENAI, BACKEND_LOCAL)
+
+
+def backend_configurado() -> str:
+    backend = os.getenv("EMBEDDING_BACKEND", BACKEND_OPENAI).strip().lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"EMBEDDING_BACKEND desconocido: {backend} (opciones: {', '.join(BACKENDS)})")
+    return backend
+
+
+def _normalizar(texto: str) -> str:
+    """Minúsculas y sin tildes: 'Plutón' y 'pluton' comparten n-gramas."""
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+
+class EmbeddingNgramLocal(BaseEmbedding):
+    """Bolsa de palabras y n-gramas de caracteres proyectada con hashing firmado, normalizada L2."""
+
+    dimension: int = 1024
+    ngram_min: int = 3
+    ngram_max: int = 5
+
+    def __init__(self, dimension: Optional[int] = None, **kwargs: Any):
+        dimension = dimension or _env_int("EMBEDDING_LOCAL_DIM", 1024)
+        kwargs.setdefault("model_name", f"ngram-hash-{kwargs.get('ngram_min', 3)}-{kwargs.get('ngram_max', 5)}-d{dimension}")
+        super().__init__(dimension=dimension, **kwargs)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "EmbeddingNgramLocal"
+
+    def _vectorizar(self, texto: str) -> List[float]:
+        vector = [0.0] * self.dimension
+        for palabra in re.findall(r"\w+", _normalizar(texto)):
+            # La palabra entera pesa más que cada uno de sus n-gramas
+            rasgos = [(f"w:{palabra}", 2.0)]
+            marcada = f"<{palabra}>"
+            for n in range(self.ngram_min, self.ngram_max + 1):
+                rasgos.extend((marcada[i:i + n], 1.0) for i in range(len(marcada) - n + 1))
+            for rasgo, peso in rasgos:
+                # crc32 es estable entre procesos (hash() de Python no): el artefacto sigue valiendo
+                h = zlib.crc32(rasgo.encode("utf-8"))
+                vector[h % self.dimension] += peso if (h >> 31) & 1 else -peso
+        norma = math.sqrt(sum(v * v for v in vector))
+        return [v / norma for v in vector] if norma else vector
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._vectorizar(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._vectorizar(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._vectorizar(text)
+
+
+class EmbeddingConCache(BaseEmbedding):
+    """Delegar en otro backend guardando en memoria (LRU) los embeddings de consulta."""
+
+    max_entradas: int = 2048
+    _base: BaseEmbedding = PrivateAttr()
+    _cache: "OrderedDict[str, List[float]]" = PrivateAttr()
+    _lock: Any = PrivateAttr()
+    _aciertos: int = PrivateAttr(default=0)
+    _fallos: int = PrivateAttr(default=0)
+
+    def __init__(self, base: BaseEmbedding, max_entradas: Optional[int] = None, **kwargs: Any):
+        max_entradas = max_entradas if max_entradas is not None else _env_int("EMBEDDING_QUERY_CACHE_SIZE", 2048)
+        super().__init__(model_name=base.model_name, embed_batch_size=base.embed_batch_size,
+                         max_entradas=max_entradas, **kwargs)
+        self._base = base
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "EmbeddingConCache"
+
+    def identidad(self) -> str:
+        """Identidad del backend real (la caché no cambia los vectores)."""
+        return f"{type(self._base).__name__}:{self._base.model_name}"
+
+    def _buscar(self, query: str) -> Optional[List[float]]:
+        with self._lock:
+            vector = self._cache.get(query)
+            if vector is None:
+                self._fallos += 1
+                return None
+            self._cache.move_to_end(query)
+            self._aciertos += 1
+            return vector
+
+    def _guardar(self, query: str, vector: List[float]):
+        if self.max_entradas <= 0:
+            return
+        with self._lock:
+            self._cache[query] = vector
+            self._cache.move_to_end(query)
+            while len(self._cache) > self.max_entradas:
+                self._cache.popitem(last=False)
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        vector = self._buscar(query)
+        if vector is None:
+            vector = self._base._get_query_embedding(query)
+            self._guardar(query, vector)
+        return vector
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        vector = self._buscar(query)
+        if vector is None:
+            vector = await self._base._aget_query_embedding(query)
+            self._guardar(query, vector)
+        return vector
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._base._get_text_embedding(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._base._get_text_embeddings(texts)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return await self._base._aget_text_embeddings(texts)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            consultas = self._aciertos + self._fallos
+            return {
+                "entries": len(self._cache),
+                "max_entries": self.max_entradas,
+                "hits": self._aciertos,
+                "misses": self._fallos,
+                "hit_rate": round(self._aciertos / consultas, 3) if consultas else None,
+            }
+
+
+_activo: Optional[EmbeddingConCache] = None
+
+
+def crear_embeddings(openai_key: Optional[str] = None) -> EmbeddingConCache:
+    """Modelo de embeddings del backend configurado, con caché de consultas."""
+    global _activo
+    backend = backend_configurado()
+    if backend == BACKEND_LOCAL:
+        base: BaseEmbedding = EmbeddingNgramLocal()
+    else:
+        openai_key = openai_key or os.getenv("OPENAI_API_KEY")
+        if not openai_key:
+            raise ValueError("OPENAI_API_KEY no encontrada en variables de entorno (o usar EMBEDDING_BACKEND=local)")
+        from llama_index.embeddings.openai import OpenAIEmbedding
+        base = OpenAIEmbedding(api_key=openai_key)
+    _activo = EmbeddingConCache(base)
+    return _activo
+
+
+def get_embedding_stats() -> Dict[str, Any]:
+    return {
+        "backend": os.getenv("EMBEDDING_BACKEND", BACKEND_OPENAI).strip().lower(),
+        "model": _activo.identidad() if _activo is not None else None,
+        "query_cache": _activo.stats() if _activo is not None else None,
+    }
@@ -0,0 +1,119 @@
+"""
+Modelo, temperatura y presupuesto de tokens por etapa del pipeline (configuración declarativa).
+- extraccion: consultas RAG de la carta (get_rag_extraction_prompt_str vía Settings.llm), salida corta
+- calendario: consultas RAG de un solo resultado de /interpretar-eventos
+- narrativa: informe final, secciones, párrafos y transiciones (llm_rewriter)
+
+Cada etapa puede usar otro modelo lógico (los proveedores de proveedores.py lo traducen a su
+nombre propio): modelos chicos y rápidos para extracción y calendario, el grande para la narrativa.
+Las latencias por etapa se exportan en /metrics para medir el ahorro.
+
+    LLM_STAGE_EXTRACCION_MODEL=openai/gpt-oss-120b
+    LLM_STAGE_EXTRACCION_TEMPERATURE=0.0
+    LLM_STAGE_EXTRACCION_MAX_TOKENS=4096
+    LLM_STAGE_EXTRACCION_LATENCY_THRESHOLD=20
+"""
+
+import os
+import threading
+from collections import deque
+from typing import Any, Deque, Dict
+
+from llm_client import _env_float, _env_int
+from proveedores import DEFAULT_MODEL
+
+ETAPA_EXTRACCION = "extraccion"
+ETAPA_CALENDARIO = "calendario"
+ETAPA_NARRATIVA = "narrativa"
+ETAPAS = (ETAPA_EXTRACCION, ETAPA_CALENDARIO, ETAPA_NARRATIVA)
+
+# Valores por defecto de cada etapa (modelo None = LLM_MODEL); cada campo se sobrescribe con
+# LLM_STAGE_<ETAPA>_MODEL / _TEMPERATURE / _MAX_TOKENS / _LATENCY_THRESHOLD
+# umbral_latencia: segundos a partir de los cuales una llamada de la etapa indica congestión al
+# limitador AIMD (limitador.py); una extracción de pocos segundos no puede medirse con los 180s de una narrativa
+CONFIG_POR_DEFECTO: Dict[str, Dict[str, Any]] = {
+    ETAPA_EXTRACCION: {"modelo": None, "temperatura": 0.0, "max_tokens": 4096, "umbral_latencia": 20.0},
+    ETAPA_CALENDARIO: {"modelo": None, "temperatura": 0.0, "max_tokens": 4096, "umbral_latencia": 20.0},
+    # El tope de la narrativa es también el de su presupuesto adaptativo (presupuesto_tokens.py);
+    # su umbral por defecto es el global LLM_LATENCY_THRESHOLD
+    ETAPA_NARRATIVA: {"modelo": None, "temperatura": 0.7, "max_tokens": None, "umbral_latencia": None},
+}
+
+
+class ConfigEtapa:
+    """Modelo lógico, temperatura y tope de salida de una etapa."""
+
+    def __init__(self, etapa: str):
+        if etapa not in ETAPAS:
+            raise ValueError(f"Etapa del pipeline desconocida: {etapa}")
+        defecto = CONFIG_POR_DEFECTO[etapa]
+        prefijo = f"LLM_STAGE_{etapa.upper()}"
+        self.etapa = etapa
+        self.modelo = os.getenv(f"{prefijo}_MODEL") or defecto["modelo"] or os.getenv("LLM_MODEL", DEFAULT_MODEL)
+        self.temperatura = _env_float(f"{prefijo}_TEMPERATURE", defecto["temperatura"])
+        self.max_tokens = _env_int(
+            f"{prefijo}_MAX_TOKENS", defecto["max_tokens"] or _env_int("NARRATIVE_MAX_TOKENS", 16000)
+        )
+        self.umbral_latencia = _env_float(
+            f"{prefijo}_LATENCY_THRESHOLD", defecto["umbral_latencia"] or _env_float("LLM_LATENCY_THRESHOLD", 180.0)
+        )
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"model": self.modelo, "temperature": self.temperatura, "max_tokens": self.max_tokens,
+                "latency_threshold": self.umbral_latencia}
+
+
+class MetricasEtapa:
+    """Llamadas, errores y latencias recientes de una etapa."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.llamadas = 0
+        self.errores = 0
+        self.latencia_total = 0.0
+        self._latencias: Deque[float] = deque(maxlen=500)
+
+    def registrar(self, segundos: float, error: bool = False):
+        with self._lock:
+            self.llamadas += 1
+            if error:
+                self.errores += 1
+                return
+            self.latencia_total += segundos
+            self._latencias.append(segundos)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            latencias = sorted(self._latencias)
+            exitosas = self.llamadas - self.errores
+
+            def percentil(p: float):
+                return round(latencias[min(int(p * len(latencias)), len(latencias) - 1)], 3) if latencias else None
+
+            return {
+                "calls": self.llamadas,
+                "errors": self.errores,
+                "latency_avg": round(self.latencia_total / exitosas, 3) if exitosas else None,
+                "latency_p50": percentil(0.5),
+                "latency_p95": percentil(0.95),
+            }
+
+
+_metricas: Dict[str, MetricasEtapa] = {etapa: MetricasEtapa() for etapa in ETAPAS}
+
+
+def registrar_latencia_etapa(etapa: str, segundos: float, error: bool = False):
+    """Registrar una llamada completa de la etapa (incluye reintentos y failover)."""
+    metricas = _metricas.get(etapa)
+    if metricas is not None:
+        metricas.registrar(segundos, error)
+
+
+def get_stage_stats() -> Dict[str, Any]:
+    return {etapa: {**ConfigEtapa(etapa).as_dict(), **_metricas[etapa].stats()} for etapa in ETAPAS}
+
+
+def reset_metricas_etapas():
+    """Olvidar las latencias por etapa (tests)."""
+    for etapa in ETAPAS:
+        _metricas[etapa] = MetricasEtapa()
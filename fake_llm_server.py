@@ -0,0 +1,128 @@
+"""
+Servidor local compatible con la API de OpenAI (/v1/chat/completions) para tests.
+Simula latencia, errores y streaming SSE sin tocar Baseten.
+
+Uso:
+    with FakeLLMServer(latency=0.5) as server:
+        llm = BasetenLLM(api_key="test", base_url=server.base_url)
+"""
+
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Any, List, Optional
+
+
+class _QuietServer(ThreadingHTTPServer):
+    """Ignora los cortes de conexión del cliente (timeouts y cancelaciones simuladas)."""
+
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass
+
+
+class FakeLLMServer:
+    """Servidor HTTP en un hilo que responde como un endpoint OpenAI-compatible."""
+
+    def __init__(self, latency: float = 0.0, responder: Optional[Callable[[str], str]] = None,
+                 fail_first: int = 0, error_status: int = 500, chunk_delay: float = 0.0):
+        self.latency = latency
+        self.responder = responder or (lambda prompt: f"Respuesta simulada ({len(prompt)} caracteres de prompt)")
+        self.fail_first = fail_first
+        self.error_status = error_status
+        self.chunk_delay = chunk_delay
+        self.requests: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    @property
+    def request_count(self) -> int:
+        with self._lock:
+            return len(self.requests)
+
+    def start(self) -> "FakeLLMServer":
+        server_ref = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                with server_ref._lock:
+                    server_ref.requests.append(body)
+                    n = len(server_ref.requests)
+                if server_ref.latency:
+                    time.sleep(server_ref.latency)
+                if n <= server_ref.fail_first:
+                    self._send_json(server_ref.error_status, {"error": {"message": "fallo simulado"}})
+                    return
+                prompt = "\n".join(m.get("content", "") for m in body.get("messages", []))
+                text = server_ref.responder(prompt)
+                if body.get("stream"):
+                    self._send_stream(body.get("model", "fake"), text)
+                else:
+                    self._send_json(200, {
+                        "id": f"fake-{n}",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": body.get("model", "fake"),
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": text}}],
+                        "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(text) // 4,
+                                  "total_tokens": (len(prompt) + len(text)) // 4},
+                    })
+
+            def _send_json(self, status: int, payload: Dict[str, Any]):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_stream(self, model: str, text: str):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                words = text.split(" ")
+                for i, word in enumerate(words):
+                    piece = word if i == 0 else " " + word
+                    chunk = {"id": "fake-stream", "object": "chat.completion.chunk", "created": int(time.time()),
+                             "model": model, "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    if server_ref.chunk_delay:
+                        time.sleep(server_ref.chunk_delay)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+        self._server = _QuietServer(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "FakeLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,284 @@
+"""
+Índice vectorial del RAG (uno solo, persistido en disco como artefacto versionado).
+
+Sin artefacto, el primer pedido RAG re-lee todos los .md de data/ y data/draco/ y vuelve a pedir
+al backend de embeddings (embeddings.py) los embeddings de todo el corpus en cada arranque de máquina. Con artefacto:
+- Un único almacén de nodos: cada chunk se embebe una sola vez y lleva `chart_type` (tropical | draco)
+  en su metadata; los motores tropical y dracónico son vistas filtradas (filtro_tipo_carta)
+- Huella: sha256 del contenido de los .md fuente + modelo de embeddings + parámetros de chunking
+- Build: `python indices_rag.py` guarda el índice en <RAG_INDEX_DIR>/<huella>/ con un manifest
+- Runtime: si hay un artefacto con la huella actual se carga de disco (sin llamadas de red);
+  si falta o quedó desactualizado se construye y se guarda (RAG_INDEX_PERSIST=false no lo guarda)
+- Re-indexado incremental: los embeddings del artefacto anterior se reutilizan por hash del texto
+  de cada chunk; solo se embeben los chunks nuevos o editados y los que ya no existen se descartan
+- Tiempo de arranque en frío (construcción vs carga) informado en /metrics
+
+Uso:
+    python indices_rag.py --directorio data/indices_rag
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import threading
+import hashlib
+import argparse
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from llama_index.core import SimpleDirectoryReader, VectorStoreIndex, Settings, StorageContext, load_index_from_storage
+from llama_index.core.ingestion import run_transformations
+from llama_index.core.schema import BaseNode, Document, MetadataMode
+from llama_index.core.vector_stores import ExactMatchFilter, MetadataFilters
+
+INDEX_ARTIFACT_VERSION = 2
+DATA_DIR = Path(__file__).parent / "data"
+DEFAULT_INDEX_DIR = str(DATA_DIR / "indices_rag")
+MANIFEST = "manifest.json"
+
+# Metadata de cada nodo con el tipo de carta de su archivo fuente
+CLAVE_TIPO_CARTA = "chart_type"
+TIPOS_CARTA = ("tropical", "draco")
+
+
+def archivos_corpus(data_dir: Optional[str] = None) -> Tuple[List[Path], List[Path]]:
+    """Archivos .md numerados de data/ (tropical) y data/draco/ (dracónica)."""
+    data_dir = Path(data_dir) if data_dir else Path("data")
+    tropical = sorted(data_dir.glob("[0-9]*.md"))
+    draco = sorted((data_dir / "draco").glob("[0-9]*.md"))
+    return tropical, draco
+
+
+def describir_embeddings(modelo: Any = None) -> str:
+    """Identidad del modelo de embeddings (backend + modelo): un cambio invalida el artefacto."""
+    modelo = modelo if modelo is not None else Settings.embed_model
+    if hasattr(modelo, "identidad"):
+        # EmbeddingConCache (embeddings.py): la identidad es la del backend envuelto
+        return modelo.identidad()
+    return f"{type(modelo).__name__}:{getattr(modelo, 'model_name', '')}"
+
+
+def huella_corpus(tropical_files: List[Path], draco_files: List[Path], modelo_embeddings: Optional[str] = None) -> str:
+    """Huella del contenido fuente y de todo lo que cambia los vectores resultantes."""
+    h = hashlib.sha256()
+    h.update(f"v{INDEX_ARTIFACT_VERSION}|{modelo_embeddings or describir_embeddings()}|"
+             f"{Settings.chunk_size}|{Settings.chunk_overlap}".encode("utf-8"))
+    for tipo, archivos in (("tropical", tropical_files), ("draco", draco_files)):
+        for archivo in sorted(archivos, key=lambda p: p.name):
+            h.update(f"|{tipo}/{archivo.name}|".encode("utf-8"))
+            h.update(Path(archivo).read_bytes())
+    return h.hexdigest()
+
+
+def filtro_tipo_carta(tipo_carta: str) -> MetadataFilters:
+    """Filtro de metadata para consultar solo los nodos de un tipo de carta."""
+    return MetadataFilters(filters=[ExactMatchFilter(key=CLAVE_TIPO_CARTA, value=tipo_carta)])
+
+
+def cargar_documentos(tropical_files: List[Path], draco_files: List[Path]) -> List[Document]:
+    """Leer cada .md una sola vez y etiquetar sus documentos con el tipo de carta."""
+    documentos: List[Document] = []
+    for tipo, archivos in (("tropical", tropical_files), ("draco", draco_files)):
+        if not archivos:
+            continue
+        for documento in SimpleDirectoryReader(input_files=archivos).load_data():
+            documento.metadata[CLAVE_TIPO_CARTA] = tipo
+            # La etiqueta sirve para filtrar: no cambia el texto que se embebe ni el que ve el LLM
+            documento.excluded_embed_metadata_keys.append(CLAVE_TIPO_CARTA)
+            documento.excluded_llm_metadata_keys.append(CLAVE_TIPO_CARTA)
+            documentos.append(documento)
+    return documentos
+
+
+def hash_chunk(nodo: BaseNode, modelo_embeddings: Optional[str] = None) -> str:
+    """Clave de caché de un chunk: el texto exacto que se embebe + el modelo que lo embebe."""
+    texto = nodo.get_content(metadata_mode=MetadataMode.EMBED)
+    return hashlib.sha256(f"{modelo_embeddings or describir_embeddings()}|{texto}".encode("utf-8")).hexdigest()
+
+
+def cache_embeddings(directorio: str, modelo_embeddings: Optional[str] = None) -> Dict[str, List[float]]:
+    """Embeddings de los artefactos previos del mismo modelo, indexados por hash de chunk."""
+    modelo_embeddings = modelo_embeddings or describir_embeddings()
+    base = Path(directorio)
+    cache: Dict[str, List[float]] = {}
+    if not base.is_dir():
+        return cache
+    for previo in base.iterdir():
+        try:
+            with open(previo / MANIFEST, encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if manifest.get("version") != INDEX_ARTIFACT_VERSION or manifest.get("modelo_embeddings") != modelo_embeddings:
+            continue
+        cargado = cargar_indice(directorio, previo.name)
+        if cargado is None:
+            continue
+        indice, _ = cargado
+        for nodo_id, nodo in indice.docstore.docs.items():
+            try:
+                cache[hash_chunk(nodo, modelo_embeddings)] = indice.vector_store.get(nodo_id)
+            except KeyError:
+                continue
+    return cache
+
+
+def construir_indice(tropical_files: List[Path], draco_files: List[Path],
+                     cache: Optional[Dict[str, List[float]]] = None) -> Tuple[VectorStoreIndex, Dict[str, int]]:
+    """Leer los .md y embeber solo los chunks que no están en la caché (llamadas al modelo de embeddings)."""
+    if not tropical_files and not draco_files:
+        raise ValueError("No hay archivos para crear el índice RAG")
+    cache = cache or {}
+    modelo_embeddings = describir_embeddings()
+    # Mismo chunking que VectorStoreIndex.from_documents (Settings.transformations)
+    nodos = run_transformations(cargar_documentos(tropical_files, draco_files), Settings.transformations)
+    claves = set()
+    reutilizados = 0
+    for nodo in nodos:
+        clave = hash_chunk(nodo, modelo_embeddings)
+        claves.add(clave)
+        if clave in cache:
+            nodo.embedding = cache[clave]
+            reutilizados += 1
+    # VectorStoreIndex solo embebe los nodos que todavía no tienen embedding
+    indice = VectorStoreIndex(nodos)
+    return indice, {
+        "reutilizados": reutilizados,
+        "embebidos": len(nodos) - reutilizados,
+        "descartados": len(set(cache) - claves),
+    }
+
+
+def tipos_indexados(indice: VectorStoreIndex) -> List[str]:
+    """Tipos de carta presentes en el índice (para no filtrar por uno que no tiene nodos)."""
+    tipos = {nodo.metadata.get(CLAVE_TIPO_CARTA) for nodo in indice.docstore.docs.values()}
+    return [tipo for tipo in TIPOS_CARTA if tipo in tipos]
+
+
+def guardar_indice(indice: VectorStoreIndex, directorio: str, huella: str, segundos_construccion: float,
+                   modelo_embeddings: Optional[str] = None, chunks: Optional[Dict[str, int]] = None) -> Path:
+    """Persistir el índice en <directorio>/<huella>/ y borrar artefactos de huellas anteriores."""
+    base = Path(directorio)
+    destino = base / huella
+    # Temporal propio de cada construcción: dos procesos que guardan a la vez no se pisan el directorio
+    temporal = base / f".{huella}.{os.getpid()}.{threading.get_ident()}.tmp"
+    shutil.rmtree(temporal, ignore_errors=True)
+    indice.storage_context.persist(persist_dir=str(temporal))
+    manifest = {
+        "version": INDEX_ARTIFACT_VERSION,
+        "huella": huella,
+        "modelo_embeddings": modelo_embeddings or describir_embeddings(),
+        "tipos_carta": tipos_indexados(indice),
+        "nodos": len(indice.docstore.docs),
+        "chunks": chunks or {},
+        "segundos_construccion": round(segundos_construccion, 3),
+        "creado": time.time(),
+    }
+    with open(temporal / MANIFEST, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    # Reemplazo atómico del directorio: un arranque concurrente nunca ve un artefacto a medias
+    shutil.rmtree(destino, ignore_errors=True)
+    os.replace(temporal, destino)
+    for viejo in base.iterdir():
+        if viejo.is_dir() and viejo.name != huella and (viejo / MANIFEST).exists():
+            shutil.rmtree(viejo, ignore_errors=True)
+    return destino
+
+
+def cargar_indice(directorio: str, huella: str) -> Optional[Tuple[VectorStoreIndex, Dict[str, Any]]]:
+    """Cargar de disco el artefacto con esta huella (None si falta, es de otra versión o está incompleto)."""
+    origen = Path(directorio) / huella
+    try:
+        with open(origen / MANIFEST, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != INDEX_ARTIFACT_VERSION or manifest.get("huella") != huella:
+        return None
+    try:
+        indice = load_index_from_storage(StorageContext.from_defaults(persist_dir=str(origen)))
+    except Exception as e:
+        print(f"⚠️ Artefacto del índice RAG ilegible en {origen}: {e}")
+        return None
+    return indice, manifest
+
+
+def _reporte_chunks(chunks: Dict[str, int]) -> Dict[str, Any]:
+    return {
+        "chunks_reused": chunks.get("reutilizados"),
+        "chunks_embedded": chunks.get("embebidos"),
+        "chunks_removed": chunks.get("descartados"),
+    }
+
+
+def cargar_o_construir(tropical_files: List[Path], draco_files: List[Path],
+                       directorio: Optional[str] = None) -> Tuple[VectorStoreIndex, Dict[str, Any]]:
+    """Índice del corpus actual: del artefacto si está al día, si no construido (y guardado)."""
+    directorio = directorio or os.getenv("RAG_INDEX_DIR", DEFAULT_INDEX_DIR)
+    inicio = time.monotonic()
+    huella = huella_corpus(tropical_files, draco_files)
+    cargado = cargar_indice(directorio, huella)
+    if cargado is not None:
+        indice, manifest = cargado
+        segundos = time.monotonic() - inicio
+        print(f"✅ Índice RAG cargado de disco en {segundos:.2f}s "
+              f"(construirlo tomó {manifest.get('segundos_construccion')}s)")
+        return indice, {
+            "source": "artifact",
+            "fingerprint": huella,
+            "nodes": manifest.get("nodos"),
+            "chart_types": manifest.get("tipos_carta", []),
+            **_reporte_chunks(manifest.get("chunks", {})),
+            "load_seconds": round(segundos, 3),
+            "build_seconds": manifest.get("segundos_construccion"),
+            "path": str(Path(directorio) / huella),
+        }
+
+    cache = cache_embeddings(directorio)
+    print(f"⚠️ Sin artefacto del índice RAG para el corpus actual: se construye "
+          f"({len(cache)} embeddings reutilizables de artefactos anteriores)")
+    indice, chunks = construir_indice(tropical_files, draco_files, cache)
+    segundos = time.monotonic() - inicio
+    print(f"♻️ Índice RAG: {chunks['reutilizados']} chunks reutilizados, {chunks['embebidos']} embebidos, "
+          f"{chunks['descartados']} descartados en {segundos:.2f}s")
+    reporte = {"source": "built", "fingerprint": huella, "nodes": len(indice.docstore.docs),
+               "chart_types": tipos_indexados(indice), **_reporte_chunks(chunks), "load_seconds": None,
+               "build_seconds": round(segundos, 3), "path": None}
+    if os.getenv("RAG_INDEX_PERSIST", "true").lower() == "true":
+        try:
+            reporte["path"] = str(guardar_indice(indice, directorio, huella, segundos, chunks=chunks))
+            print(f"💾 Índice RAG guardado en {reporte['path']}")
+        except OSError as e:
+            print(f"⚠️ No se pudo guardar el índice RAG: {e}")
+    return indice, reporte
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Construir y guardar el índice vectorial del RAG")
+    parser.add_argument("--directorio", default=os.getenv("RAG_INDEX_DIR", DEFAULT_INDEX_DIR))
+    parser.add_argument("--data", default="data", help="Directorio con los .md tropicales (y draco/)")
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+    from embeddings import crear_embeddings
+    load_dotenv()
+    Settings.embed_model = crear_embeddings()
+
+    tropical, draco = archivos_corpus(args.data)
+    huella = huella_corpus(tropical, draco)
+    if cargar_indice(args.directorio, huella) is not None:
+        print(f"✅ El artefacto {args.directorio}/{huella} ya está al día")
+        return 0
+    inicio = time.monotonic()
+    indice, chunks = construir_indice(tropical, draco, cache_embeddings(args.directorio))
+    destino = guardar_indice(indice, args.directorio, huella, time.monotonic() - inicio, chunks=chunks)
+    print(f"✅ Índice RAG guardado en {destino} ({len(tropical)} tropicales, {len(draco)} dracónicos, "
+          f"{len(indice.docstore.docs)} nodos: {chunks['reutilizados']} reutilizados, "
+          f"{chunks['embebidos']} embebidos, {chunks['descartados']} descartados)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,13 +10,30 @@ import json
 import re
 import time
 import asyncio
+import hashlib
+import threading
 import unicodedata
-from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from dotenv import load_dotenv
-from typing import Dict, List, Any, Optional
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 load_dotenv()
-from prompts import get_rag_extraction_prompt_str, get_tropical_narrative_prompt_str, get_draconian_narrative_prompt_str
+from prompts import (
+    get_rag_extraction_prompt_str,
+    get_tropical_narrative_prompt_str,
+    get_draconian_narrative_prompt_str,
+    get_section_narrative_prompt_str,
+    get_paragraph_rewrite_prompt_str,
+    get_connective_prompt_str,
+    get_instrucciones_narrativas,
+    combinar_interpretaciones_str,
+    PROFUNDIDADES,
+)
+from narrativa_secciones import agrupar_en_secciones
+from narrativa_plantilla import generar_narrativa_plantilla
+from cache_narrativas import CacheNarrativas
+from parrafos_pregenerados import ParrafosPregenerados, DEFAULT_ARTIFACT_PATH
+from single_flight import SingleFlight
 try:
     from interpretador_astrologico import InterpretadorAstrologico
 except ImportError:
@@ -28,107 +45,355 @@ try:
     from llama_index.core import SimpleDirectoryReader, VectorStoreIndex, Settings
     from llama_index.embeddings.openai import OpenAIEmbedding
     from llama_index.core.prompts import PromptTemplate
-    from llama_index.core.llms import LLM, ChatMessage, CompletionResponse
+    from llama_index.core.llms import LLM, LLMMetadata, ChatMessage, CompletionResponse
     LLAMA_INDEX_NEW = True
 except ImportError:
     # Fallback a versiones anteriores
     from llama_index import SimpleDirectoryReader, GPTVectorStoreIndex as VectorStoreIndex, ServiceContext
     from llama_index.embeddings import OpenAIEmbedding
     from llama_index.prompts import PromptTemplate
-    from llama_index.llms import LLM, ChatMessage, CompletionResponse
+    from llama_index.llms import LLM, LLMMetadata, ChatMessage, CompletionResponse
     LLAMA_INDEX_NEW = False
 
-# Importar OpenAI client para Baseten
-from openai import OpenAI
+# Cliente OpenAI compartido (pool de conexiones) para Baseten
+from llm_client import get_shared_client, get_shared_async_client
+from resiliencia import ErrorLLM
+from proveedores import DEFAULT_MODEL, Proveedor, amerita_failover, get_registro_proveedores
+from etapas import ETAPA_CALENDARIO, ETAPA_EXTRACCION, ETAPA_NARRATIVA, ConfigEtapa, registrar_latencia_etapa
+from limitador import get_limitador
+from embeddings import BACKEND_OPENAI, backend_configurado, crear_embeddings
+from secciones_rag import normalizar_titulo
+from planificador import planificador, NATAL, TareaCanceladaError, verificar_cancelacion
+from presupuesto_tokens import PresupuestoSalida, contabilizar_tokens, registrar_uso
+
+
+class LatenciaExcedidaError(TimeoutError):
+    """El presupuesto de latencia del cliente se agotó antes de tener algo que devolver."""
 
 
 class BasetenLLM(LLM):
     """
     Wrapper para usar Baseten (Kimi-K2.5) con llama-index.
     Baseten usa una API compatible con OpenAI.
+    
+    Sin base_url, cada llamada se enruta entre los proveedores del registro (proveedores.py):
+    primero el de mejor p95 reciente, con failover al siguiente ante errores transitorios.
+    Con base_url, se usa ese único endpoint (tests, scripts).
+    `etapa` (etapas.py) agrupa las latencias de sus llamadas en /metrics.
     """
     
     api_key: str
     model: str
     temperature: float
     max_tokens: int
+    base_url: Optional[str] = None
+    request_timeout: Optional[float] = None
+    etapa: Optional[str] = None
     
-    def __init__(self, api_key: str, model: str = "moonshotai/Kimi-K2.5", temperature: float = 0.7, max_tokens: int = 4096, **kwargs):
+    def __init__(self, api_key: str, model: str = DEFAULT_MODEL, temperature: float = 0.7, max_tokens: int = 4096, **kwargs):
         super().__init__(api_key=api_key, model=model, temperature=temperature, max_tokens=max_tokens, **kwargs)
     
-    def _get_client(self):
-        """Obtener o crear cliente OpenAI para Baseten."""
-        return OpenAI(
-            api_key=self.api_key,
-            base_url="https://inference.baseten.co/v1"
-        )
+    def _proveedores(self, stream: bool = False) -> List[Proveedor]:
+        """Endpoint fijo si se pasó base_url; si no, los proveedores del registro en orden de preferencia
+        para la clase de esta llamada (etapa + modelo)."""
+        if self.base_url:
+            return [Proveedor(self.base_url, self.base_url, self.api_key)]
+        return get_registro_proveedores().candidatos(self._clase_latencia(stream))
+    
+    def _get_client(self, proveedor: Optional[Proveedor] = None):
+        """Obtener el cliente OpenAI compartido del proceso (keep-alive, pool limitado)."""
+        proveedor = proveedor or self._proveedores()[0]
+        return get_shared_client(proveedor.api_key, proveedor.base_url)
+    
+    def _get_async_client(self, proveedor: Optional[Proveedor] = None):
+        """Obtener el cliente AsyncOpenAI compartido para el event loop actual."""
+        proveedor = proveedor or self._proveedores()[0]
+        return get_shared_async_client(proveedor.api_key, proveedor.base_url)
+    
+    def _opciones(self, proveedores: List[Proveedor], **kwargs) -> Dict[str, Any]:
+        """Opciones de la llamada con un único deadline para todos los proveedores que se prueben."""
+        return {**kwargs, "deadline": proveedores[0].resiliencia().deadline(kwargs.get("deadline"))}
+    
+    def _con_failover(self, proveedores: List[Proveedor], llamar: Callable[[Proveedor], Any]) -> Any:
+        """Probar los proveedores en orden hasta que uno responda (solo se pasa al siguiente si el fallo es suyo)."""
+        for n, proveedor in enumerate(proveedores):
+            proveedor.registrar_llamada()
+            try:
+                return llamar(proveedor)
+            except ErrorLLM as e:
+                if n + 1 == len(proveedores) or not amerita_failover(e):
+                    raise
+                self._registrar_failover(proveedor, proveedores[n + 1], e)
+    
+    async def _acon_failover(self, proveedores: List[Proveedor], llamar: Callable[[Proveedor], Awaitable[Any]]) -> Any:
+        """Versión async de _con_failover."""
+        for n, proveedor in enumerate(proveedores):
+            proveedor.registrar_llamada()
+            try:
+                return await llamar(proveedor)
+            except ErrorLLM as e:
+                if n + 1 == len(proveedores) or not amerita_failover(e):
+                    raise
+                self._registrar_failover(proveedor, proveedores[n + 1], e)
+    
+    def _clase_latencia(self, stream: bool = False) -> str:
+        """Clase de latencia de la llamada (etapa + modelo lógico): la cobertura y el enrutamiento
+        comparan cada llamada con las de su misma clase; en streams se mide solo la apertura."""
+        clase = f"{self.etapa or 'general'}:{self.model}"
+        return f"{clase}:stream" if stream else clase
+    
+    def _umbral_latencia(self) -> Optional[float]:
+        """Umbral de congestión del limitador para la etapa de esta llamada (None = global)."""
+        return ConfigEtapa(self.etapa).umbral_latencia if self.etapa else None
+    
+    @contextmanager
+    def _medir_etapa(self):
+        """Latencia de la llamada completa (reintentos y failover incluidos) para las métricas de la etapa."""
+        inicio = time.monotonic()
+        try:
+            yield
+        except Exception:
+            if self.etapa:
+                registrar_latencia_etapa(self.etapa, time.monotonic() - inicio, error=True)
+            raise
+        if self.etapa:
+            registrar_latencia_etapa(self.etapa, time.monotonic() - inicio)
+    
+    @staticmethod
+    def _registrar_failover(origen: Proveedor, destino: Proveedor, error: ErrorLLM):
+        origen.registrar_failover()
+        print(f"🔀 Failover del LLM: {origen.nombre} → {destino.nombre} ({error})")
+    
+    def _call_timeout(self, **kwargs) -> Optional[float]:
+        """Segundos disponibles para un intento: timeout explícito, de instancia o el que deja el deadline.
+        
+        `deadline` es un instante absoluto en time.monotonic() (p.ej. el límite de toda la petición).
+        """
+        timeout = kwargs.get("timeout", self.request_timeout)
+        deadline = kwargs.get("deadline")
+        if deadline is not None:
+            remaining = max(deadline - time.monotonic(), 0.0)
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        return timeout
+    
+    def _request_options(self, **kwargs) -> Dict[str, Any]:
+        """Opciones por llamada para el cliente OpenAI (timeout)."""
+        timeout = self._call_timeout(**kwargs)
+        return {"timeout": timeout} if timeout is not None else {}
+    
+    def _max_tokens(self, **kwargs) -> int:
+        """Tope de salida: el del presupuesto adaptativo, el explícito o el de la instancia."""
+        presupuesto = kwargs.get("presupuesto")
+        if presupuesto is not None:
+            return presupuesto.max_tokens
+        return kwargs.get("max_tokens") or self.max_tokens
+    
+    def _format_messages(self, messages: List[ChatMessage]) -> List[Dict[str, str]]:
+        formatted_messages = []
+        for msg in messages:
+            role = "assistant" if msg.role.value == "assistant" else "user"
+            formatted_messages.append({"role": role, "content": msg.content})
+        return formatted_messages
     
     @property
-    def metadata(self):
-        return {"model": self.model}
+    def metadata(self) -> LLMMetadata:
+        # Los sintetizadores de llama-index leen context_window/num_output para repartir el contexto
+        return LLMMetadata(
+            context_window=int(os.getenv("LLM_CONTEXT_WINDOW", "262144")),
+            num_output=self.max_tokens,
+            model_name=self.model,
+        )
+    
+    def _create(self, formatted_messages: List[Dict[str, str]], origen: str, **kwargs) -> CompletionResponse:
+        """Llamada sincrónica con deadline, reintentos y circuit breaker.
+        
+        Lanza ErrorLLM si falla definitivamente (en lugar de devolver el error como texto).
+        """
+        proveedores = self._proveedores()
+        opciones = self._opciones(proveedores, **kwargs)
+        
+        def llamar(proveedor: Proveedor) -> CompletionResponse:
+            def intento() -> CompletionResponse:
+                # Hilo de consulta RAG cuyo pedido se canceló: no gastar la llamada a Baseten
+                verificar_cancelacion()
+                with get_limitador().permiso_sync(opciones["deadline"], self._umbral_latencia()):
+                    verificar_cancelacion()
+                    response = self._get_client(proveedor).chat.completions.create(
+                        model=proveedor.modelo(self.model),
+                        messages=formatted_messages,
+                        temperature=self.temperature,
+                        max_tokens=self._max_tokens(**kwargs),
+                        **self._request_options(**opciones)
+                    )
+                registrar_uso(kwargs.get("presupuesto"), response.usage)
+                return CompletionResponse(text=response.choices[0].message.content)
+            
+            return proveedor.resiliencia().ejecutar_sync(intento, opciones["deadline"], clase=self._clase_latencia())
+        
+        try:
+            with self._medir_etapa():
+                return self._con_failover(proveedores, llamar)
+        except ErrorLLM as e:
+            print(f"❌ Error en BasetenLLM.{origen}: {e}")
+            raise
     
     def complete(self, prompt: str, **kwargs) -> CompletionResponse:
         """Método sincrónico para completar un prompt."""
-        try:
-            client = self._get_client()
-            response = client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=self.temperature,
-                max_tokens=self.max_tokens
+        return self._create([{"role": "user", "content": prompt}], "complete", **kwargs)
+    
+    async def _acreate(self, formatted_messages: List[Dict[str, str]], origen: str, **kwargs) -> CompletionResponse:
+        """Llamada asyncio nativa: no ocupa hilos mientras espera a Baseten.
+        
+        Cada intento espera turno en el limitador global y respeta el deadline; los errores transitorios
+        se reintentan con backoff y, si LLM_HEDGE_ENABLED, un intento lento se duplica.
+        La cancelación se propaga al request HTTP.
+        """
+        proveedores = self._proveedores()
+        opciones = self._opciones(proveedores, **kwargs)
+        
+        async def llamar(proveedor: Proveedor) -> CompletionResponse:
+            async def intento() -> CompletionResponse:
+                async with get_limitador().permiso(opciones["deadline"], self._umbral_latencia()):
+                    async with asyncio.timeout(self._call_timeout(**opciones)):
+                        response = await self._get_async_client(proveedor).chat.completions.create(
+                            model=proveedor.modelo(self.model),
+                            messages=formatted_messages,
+                            temperature=self.temperature,
+                            max_tokens=self._max_tokens(**kwargs),
+                            **self._request_options(**opciones)
+                        )
+                registrar_uso(kwargs.get("presupuesto"), response.usage)
+                return CompletionResponse(text=response.choices[0].message.content)
+            
+            return await proveedor.resiliencia().ejecutar(
+                intento, opciones["deadline"], cobertura=True, clase=self._clase_latencia()
             )
-            return CompletionResponse(text=response.choices[0].message.content)
-        except Exception as e:
-            print(f"❌ Error en BasetenLLM.complete: {e}")
-            return CompletionResponse(text=f"Error: {e}")
+        
+        try:
+            with self._medir_etapa():
+                return await self._acon_failover(proveedores, llamar)
+        except ErrorLLM as e:
+            print(f"❌ Error en BasetenLLM.{origen}: {e}")
+            raise
     
     async def acomplete(self, prompt: str, **kwargs) -> CompletionResponse:
         """Método asíncrono para completar un prompt."""
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, self.complete, prompt)
+        return await self._acreate([{"role": "user", "content": prompt}], "acomplete", **kwargs)
     
     def chat(self, messages: List[ChatMessage], **kwargs) -> CompletionResponse:
         """Método para chat con múltiples mensajes."""
-        try:
-            formatted_messages = []
-            for msg in messages:
-                role = "assistant" if msg.role.value == "assistant" else "user"
-                formatted_messages.append({"role": role, "content": msg.content})
-            
-            client = self._get_client()
-            response = client.chat.completions.create(
-                model=self.model,
-                messages=formatted_messages,
-                temperature=self.temperature,
-                max_tokens=self.max_tokens
-            )
-            return CompletionResponse(text=response.choices[0].message.content)
-        except Exception as e:
-            print(f"❌ Error en BasetenLLM.chat: {e}")
-            return CompletionResponse(text=f"Error: {e}")
+        return self._create(self._format_messages(messages), "chat", **kwargs)
     
     async def achat(self, messages: List[ChatMessage], **kwargs) -> CompletionResponse:
         """Método asíncrono para chat."""
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, self.chat, messages)
+        return await self._acreate(self._format_messages(messages), "achat", **kwargs)
+    
+    async def _astream(self, formatted_messages: List[Dict[str, str]], origen: str, **kwargs):
+        """Streaming asyncio nativo: produce CompletionResponse con el texto acumulado y el delta.
+        
+        La apertura del stream pasa por la capa de resiliencia (reintentos y breaker; sin duplicados).
+        Si falla se lanza ErrorLLM; un corte a mitad de la respuesta no se reintenta.
+        """
+        proveedores = self._proveedores(stream=True)
+        opciones = self._opciones(proveedores, **kwargs)
+        
+        async def abrir_stream(proveedor: Proveedor):
+            async def intento():
+                async with asyncio.timeout(self._call_timeout(**opciones)):
+                    return await self._get_async_client(proveedor).chat.completions.create(
+                        model=proveedor.modelo(self.model),
+                        messages=formatted_messages,
+                        temperature=self.temperature,
+                        max_tokens=self._max_tokens(**kwargs),
+                        stream=True,
+                        **self._request_options(**opciones)
+                    )
+            
+            return await proveedor.resiliencia().ejecutar(intento, opciones["deadline"], clase=self._clase_latencia(stream=True))
+        
+        # El lugar en el limitador se ocupa durante todo el stream (Baseten sigue generando);
+        # el failover solo es posible antes del primer token
+        with self._medir_etapa():
+            async with get_limitador().permiso(opciones["deadline"], self._umbral_latencia()):
+                try:
+                    stream = await self._acon_failover(proveedores, abrir_stream)
+                except ErrorLLM as e:
+                    print(f"❌ Error en BasetenLLM.{origen}: {e}")
+                    raise
+            
+                texto = ""
+                async with asyncio.timeout(self._call_timeout(**opciones)):
+                    async for chunk in stream:
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta.content or ""
+                        if delta:
+                            texto += delta
+                            yield CompletionResponse(text=texto, delta=delta)
+                # El stream no trae usage: se registra solo lo previsto
+                registrar_uso(kwargs.get("presupuesto"))
+    
+    def _stream(self, formatted_messages: List[Dict[str, str]], origen: str, **kwargs):
+        """Streaming sincrónico: mismo contrato que _astream pero con el cliente sync."""
+        proveedores = self._proveedores(stream=True)
+        opciones = self._opciones(proveedores, **kwargs)
+        
+        def abrir_stream(proveedor: Proveedor):
+            def intento():
+                return self._get_client(proveedor).chat.completions.create(
+                    model=proveedor.modelo(self.model),
+                    messages=formatted_messages,
+                    temperature=self.temperature,
+                    max_tokens=self._max_tokens(**kwargs),
+                    stream=True,
+                    **self._request_options(**opciones)
+                )
+            
+            return proveedor.resiliencia().ejecutar_sync(intento, opciones["deadline"], clase=self._clase_latencia(stream=True))
+        
+        with self._medir_etapa(), get_limitador().permiso_sync(opciones["deadline"], self._umbral_latencia()):
+            try:
+                stream = self._con_failover(proveedores, abrir_stream)
+            except ErrorLLM as e:
+                print(f"❌ Error en BasetenLLM.{origen}: {e}")
+                raise
+            
+            texto = ""
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content or ""
+                if delta:
+                    texto += delta
+                    yield CompletionResponse(text=texto, delta=delta)
+            registrar_uso(kwargs.get("presupuesto"))
     
     def stream_chat(self, messages: List[ChatMessage], **kwargs):
-        """Streaming de chat no implementado - delega a chat."""
-        yield self.chat(messages, **kwargs)
+        """Streaming de chat (tokens a medida que llegan)."""
+        yield from self._stream(self._format_messages(messages), "stream_chat", **kwargs)
     
     async def astream_chat(self, messages: List[ChatMessage], **kwargs):
-        """Streaming asíncrono de chat no implementado - delega a achat."""
-        yield await self.achat(messages, **kwargs)
+        """Streaming asíncrono de chat (tokens a medida que llegan)."""
+        async for response in self._astream(self._format_messages(messages), "astream_chat", **kwargs):
+            yield response
     
     def stream_complete(self, prompt: str, **kwargs):
-        """Streaming no implementado - delega a complete."""
-        yield self.complete(prompt, **kwargs)
+        """Streaming de un prompt (tokens a medida que llegan)."""
+        yield from self._stream([{"role": "user", "content": prompt}], "stream_complete", **kwargs)
     
     async def astream_complete(self, prompt: str, **kwargs):
-        """Streaming asíncrono no implementado - delega a acomplete."""
-        yield await self.acomplete(prompt, **kwargs)
+        """Streaming asíncrono de un prompt (tokens a medida que llegan)."""
+        async for response in self._astream([{"role": "user", "content": prompt}], "astream_complete", **kwargs):
+            yield response
 
 class InterpretadorRAG:
+    # Argumentos de RetrieverQueryEngine.from_args: no van al retriever de _crear_motor_rag
+    _ARGS_MOTOR_CONSULTA = (
+        "llm", "response_synthesizer", "node_postprocessors", "callback_manager", "response_mode",
+        "text_qa_template", "refine_template", "summary_template", "simple_template", "output_cls",
+        "use_async", "streaming", "verbose",
+    )
+
     def __init__(self):
         """Inicializar el interpretador RAG"""
         # Cargar variables de entorno
@@ -136,14 +401,38 @@ class InterpretadorRAG:
         self.openai_key = os.getenv("OPENAI_API_KEY")
         self.baseten_key = os.getenv("BASETEN_API_KEY")
         
-        if not self.openai_key:
-            raise ValueError("OPENAI_API_KEY no encontrada en variables de entorno")
+        # OPENAI_API_KEY solo hace falta con el backend de embeddings de OpenAI (embeddings.py)
+        if backend_configurado() == BACKEND_OPENAI and not self.openai_key:
+            raise ValueError("OPENAI_API_KEY no encontrada en variables de entorno (o usar EMBEDDING_BACKEND=local)")
             
-        if not self.baseten_key:
-            raise ValueError("BASETEN_API_KEY no encontrada en variables de entorno")
+        # Proveedores LLM (proveedores.py): valida URL y API key de cada uno (BASETEN_API_KEY por defecto)
+        self.proveedores_llm = get_registro_proveedores()
         
         # Feature flag para RAGs separados (False = sistema actual, True = RAGs separados)
         self.USE_SEPARATE_ENGINES = os.getenv("USE_SEPARATE_ENGINES", "true").lower() == "true"
+        # Consultas canónicas resueltas por encabezado (secciones_rag.py); el vectorial queda de respaldo
+        self.USE_SECTION_LOOKUP = os.getenv("RAG_SECTION_LOOKUP", "true").lower() == "true"
+        
+        # Modo de generación narrativa por defecto ("completa" = un único prompt, "secciones" = paralelo,
+        # "parrafos" = párrafos por ítem cacheados entre cartas + pasada corta de transiciones,
+        # "pregenerada" = párrafos del artefacto offline, sin generar faltantes: 0-1 llamadas al LLM,
+        # "plantilla" = textos fuente con plantillas deterministas: 0 llamadas al LLM)
+        self.MODOS_NARRATIVA = ("completa", "secciones", "parrafos", "pregenerada", "plantilla")
+        self.NARRATIVA_MODO_DEFECTO = os.getenv("NARRATIVA_MODO", "completa").lower()
+        self.PARAGRAPH_REWRITE_CONCURRENCY = int(os.getenv("PARAGRAPH_REWRITE_CONCURRENCY", 8))
+        self.PARAGRAPH_CONNECTIVES = os.getenv("PARAGRAPH_CONNECTIVES", "true").lower() == "true"
+        self.PARAGRAPH_MAX_TOKENS = int(os.getenv("PARAGRAPH_MAX_TOKENS", 1200))
+        # Reserva del presupuesto de latencia del cliente (max_latency_ms) para armar la respuesta degradada
+        self.LATENCY_BUDGET_RESERVE_MS = int(os.getenv("LATENCY_BUDGET_RESERVE_MS", 50))
+        self.degradaciones = {"parcial": 0, "plantilla": 0, "excedidas": 0}
+        # Profundidad del informe por defecto: "profunda" (lectura principal), "estandar" o "breve" (visión general)
+        self.NARRATIVA_PROFUNDIDAD_DEFECTO = os.getenv("NARRATIVA_PROFUNDIDAD", "profunda").lower()
+        
+        # Pedidos idénticos concurrentes (doble click, reintentos) comparten una sola generación
+        self.vuelos_interpretacion = (
+            SingleFlight("interpretacion_completa")
+            if os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true" else None
+        )
         
         # Inicializar Interpretador Astrológico Determinista (Phase 3.2)
         try:
@@ -155,10 +444,22 @@ class InterpretadorRAG:
 
         # LlamaIndex (RAG) se inicializa lazy: solo cuando realmente se necesita
         self._rag_initialized = False
+        # Las búsquedas de calendario corren en paralelo: una sola construcción aunque lleguen N a la vez
+        self._rag_lock = threading.Lock()
+        # Origen y tiempo de arranque en frío de los índices RAG (artefacto vs construcción), para /metrics
+        self.rag_index_report = None
+        self.rag_tipos_carta: List[str] = []
+        self.secciones_rag = None  # secciones_rag.AlmacenSecciones (solo con la API nueva)
         
         # Inicializar LLM rewriter (siempre necesario, no lazy)
         # Se usa para generar narrativas en TODAS las cartas (JSON y RAG)
         self._setup_llm_rewriter()
+        
+        # Caché persistente de narrativas (SQLite): una recarga de la misma carta no repite la llamada al LLM
+        self._setup_cache_narrativas()
+        
+        # Párrafos pre-generados offline (parrafos_pregenerados.py) para todo el vocabulario natal
+        self._setup_parrafos_pregenerados()
 
         # [NUEVO] Inicializar InterpretadorAstrologico (Motor JSON) para Calendario
         try:
@@ -181,11 +482,16 @@ class InterpretadorRAG:
         """Inicializa LlamaIndex (embeddings + índices) solo la primera vez que se necesita."""
         if self._rag_initialized:
             return
-        print("⚡ Inicializando RAG (lazy, primera vez que se necesita)...")
-        self._setup_llm_and_embeddings()
-        self._load_and_index_documents()
-        self._rag_initialized = True
-        print("✅ RAG inicializado correctamente.")
+        with self._rag_lock:
+            # Doble verificación: otro hilo pudo terminar la inicialización mientras se esperaba el lock
+            if self._rag_initialized:
+                return
+            print("⚡ Inicializando RAG (lazy, primera vez que se necesita)...")
+            inicio = time.monotonic()
+            self._setup_llm_and_embeddings()
+            self._load_and_index_documents()
+            self._rag_initialized = True
+            print(f"✅ RAG inicializado correctamente en {time.monotonic() - inicio:.2f}s.")
 
     def _setup_llm_rewriter(self):
         """Configurar LLM rewriter (siempre necesario, no lazy).
@@ -193,55 +499,74 @@ class InterpretadorRAG:
         Se usa para generar narrativas en todas las cartas (Tropical/Dracónica JSON y RAG).
         Este método se llama en __init__, no es lazy.
         """
-        MODEL_BASETEN = "moonshotai/Kimi-K2.5"
-        
-        self.llm_rewriter = BasetenLLM(
-            api_key=self.baseten_key, 
-            temperature=0.7, 
-            model=MODEL_BASETEN, 
-            max_tokens=16000
+        # Etapa "narrativa": el modelo grande; su max_tokens es el tope de cada presupuesto (presupuesto_tokens.py)
+        self.llm_rewriter = self._llm_para_etapa(ETAPA_NARRATIVA)
+        print(f"✅ LLM rewriter inicializado (no lazy, modelo {self.llm_rewriter.model})")
+    
+    def _llm_para_etapa(self, etapa: str) -> BasetenLLM:
+        """LLM con el modelo, la temperatura y el tope de tokens declarados para la etapa (etapas.py)."""
+        config = ConfigEtapa(etapa)
+        # Modelo lógico; cada proveedor del registro lo sirve con su propio nombre (proveedores.py)
+        return BasetenLLM(
+            api_key=self.baseten_key or "",
+            temperature=config.temperatura,
+            model=config.modelo,
+            max_tokens=config.max_tokens,
+            etapa=etapa
         )
-        print("✅ LLM rewriter inicializado (no lazy)")
+    
+    def _setup_parrafos_pregenerados(self):
+        """Cargar el artefacto de párrafos pre-generados si existe y coincide con prompts y modelo"""
+        self.parrafos_pregenerados = None
+        path = os.getenv("PREGENERATED_PARAGRAPHS_PATH", DEFAULT_ARTIFACT_PATH)
+        try:
+            self.parrafos_pregenerados = ParrafosPregenerados.cargar(path, modelo=self.llm_rewriter.model)
+        except Exception as e:
+            print(f"⚠️ No se pudieron cargar los párrafos pre-generados: {e}")
+        if self.parrafos_pregenerados is not None:
+            print(f"✅ Párrafos pre-generados cargados ({len(self.parrafos_pregenerados)} entradas)")
+    
+    def _setup_cache_narrativas(self):
+        """Abrir las cachés de narrativas y de párrafos (NARRATIVE_CACHE_ENABLED=false las desactiva)"""
+        self.cache_narrativas = None
+        self.cache_parrafos = None
+        if os.getenv("NARRATIVE_CACHE_ENABLED", "true").lower() != "true":
+            print("🔧 Caché de narrativas DESACTIVADA")
+            return
+        try:
+            self.cache_narrativas = CacheNarrativas()
+            self.cache_parrafos = CacheNarrativas(
+                tabla="parrafos",
+                max_entries=int(os.getenv("PARAGRAPH_CACHE_MAX_ENTRIES", 20000))
+            )
+            print(f"✅ Caché de narrativas lista ({self.cache_narrativas.stats()['entries']} narrativas, "
+                  f"{self.cache_parrafos.stats()['entries']} párrafos)")
+        except Exception as e:
+            print(f"⚠️ No se pudo abrir la caché de narrativas, se continúa sin caché: {e}")
     
     def _setup_llm_and_embeddings(self):
-        """Configurar LLM y embeddings: Stack Baseten (Kimi-K2.5)
+        """Configurar LLM y embeddings: LLMs de extracción y calendario (etapas.py) + backend de embeddings (embeddings.py)
         
         Este método es lazy: solo se llama cuando se necesita RAG.
         No inicializa llm_rewriter (ya está en _setup_llm_rewriter).
         """
-        # Usar Baseten con Kimi-K2.5 para RAG y Narrativa
-        
-        MODEL_BASETEN = "moonshotai/Kimi-K2.5"  # Modelo Kimi-K2.5 en Baseten
-        
-        # Cargar API key de Baseten
-        self.baseten_key = os.getenv("BASETEN_API_KEY")
-        if not self.baseten_key:
-            raise ValueError("BASETEN_API_KEY no encontrada en variables de entorno")
+        # Consultas de calendario: etapa propia (puede ser un modelo más chico que el de extracción)
+        self.llm_calendario = self._llm_para_etapa(ETAPA_CALENDARIO)
         
         if LLAMA_INDEX_NEW:
             # Usar Settings globales (nueva API)
-            # 1. Configurar RAG con Baseten (temperatura 0 para respuestas consistentes)
-            Settings.llm = BasetenLLM(
-                api_key=self.baseten_key, 
-                temperature=0.0, 
-                model=MODEL_BASETEN, 
-                max_tokens=4096
-            )
+            # 1. Configurar RAG con la etapa "extraccion" (temperatura 0 para respuestas consistentes)
+            Settings.llm = self._llm_para_etapa(ETAPA_EXTRACCION)
             
-            # 2. Embeddings se mantienen con OpenAI
-            Settings.embed_model = OpenAIEmbedding(api_key=self.openai_key)
+            # 2. Embeddings del backend configurado (openai | local), con caché de consultas
+            Settings.embed_model = crear_embeddings(self.openai_key)
             self.service_context_rag = None
             
             # NOTA: llm_rewriter ya está inicializado en _setup_llm_rewriter() (no lazy)
         else:
             # Usar ServiceContext (versión anterior)
             # 1. Configurar RAG con Baseten
-            self.llm_rag = BasetenLLM(
-                api_key=self.baseten_key, 
-                temperature=0.0, 
-                model=MODEL_BASETEN, 
-                max_tokens=4096
-            )
+            self.llm_rag = self._llm_para_etapa(ETAPA_EXTRACCION)
             
             # NOTA: llm_rewriter ya está inicializado en _setup_llm_rewriter() (no lazy)
             
@@ -276,60 +601,33 @@ class InterpretadorRAG:
             raise Exception(f"Error al cargar o indexar los archivos Markdown de interpretaciones: {e}")
     
     def _create_all_engines(self, tropical_files: List[Path], draco_files: List[Path]):
-        """Crear todos los engines RAG: mixto (actual) + separados (nuevo)"""
+        """Crear el índice RAG único (tropical + dracónico) del que salen todos los engines
+        
+        Cada chunk se embebe una sola vez y lleva `chart_type` en su metadata: los engines
+        tropical y dracónico son vistas filtradas de ese mismo almacén (ver _get_query_engine).
+        Con la API nueva el índice sale del artefacto persistido (indices_rag.py) si está al día
+        con el contenido de los .md; si no, se construye una vez y se guarda.
+        """
         try:
             # print("🔧 Creando engines RAG...")
+            if LLAMA_INDEX_NEW:
+                from indices_rag import cargar_o_construir
+                self.index, self.rag_index_report = cargar_o_construir(tropical_files, draco_files)
+                self.rag_tipos_carta = list(self.rag_index_report.get("chart_types") or [])
+                if self.USE_SECTION_LOOKUP:
+                    from secciones_rag import AlmacenSecciones
+                    self.secciones_rag = AlmacenSecciones.desde_archivos(tropical_files, draco_files)
+                return
             
-            # 1. Crear índice mixto (sistema actual) - SIEMPRE se crea para compatibilidad
+            # API legacy: solo el índice mixto (sin vistas filtradas, _get_query_engine usa el mixto)
             all_files = tropical_files + draco_files
             if all_files:
                 documents_mixed = SimpleDirectoryReader(input_files=all_files).load_data()
-                if LLAMA_INDEX_NEW:
-                    self.index = VectorStoreIndex.from_documents(documents_mixed)
-                else:
-                    self.index = VectorStoreIndex.from_documents(documents_mixed, service_context=self.service_context_rag)
-                # print(f"✅ Índice RAG MIXTO creado: {len(documents_mixed)} documentos")
+                self.index = VectorStoreIndex.from_documents(documents_mixed, service_context=self.service_context_rag)
+                self.rag_tipos_carta = []
             else:
                 raise ValueError("No hay archivos para crear el índice mixto")
             
-            # 2. Crear índices separados (solo si USE_SEPARATE_ENGINES está activado o para preparación)
-            # Los creamos siempre para estar listos, pero solo los usamos si el flag está activado
-            
-            # Índice tropical separado
-            if tropical_files:
-                documents_tropical = SimpleDirectoryReader(input_files=tropical_files).load_data()
-                if LLAMA_INDEX_NEW:
-                    self.tropical_index = VectorStoreIndex.from_documents(documents_tropical)
-                else:
-                    self.tropical_index = VectorStoreIndex.from_documents(documents_tropical, service_context=self.service_context_rag)
-                # print(f"✅ Índice RAG TROPICAL creado: {len(documents_tropical)} documentos")
-            else:
-                self.tropical_index = None
-                # print("⚠️ No se encontraron archivos tropicales, índice tropical = None")
-            
-            # Índice dracónico separado
-            if draco_files:
-                documents_draco = SimpleDirectoryReader(input_files=draco_files).load_data()
-                if LLAMA_INDEX_NEW:
-                    self.draco_index = VectorStoreIndex.from_documents(documents_draco)
-                else:
-                    self.draco_index = VectorStoreIndex.from_documents(documents_draco, service_context=self.service_context_rag)
-                # print(f"✅ Índice RAG DRACÓNICO creado: {len(documents_draco)} documentos")
-            else:
-                self.draco_index = None
-                # print("⚠️ No se encontraron archivos dracónicos, índice dracónico = None")
-            
-            # Resumen de engines creados
-            # engines_created = []
-            # if hasattr(self, 'index') and self.index:
-            #     engines_created.append("MIXTO")
-            # if hasattr(self, 'tropical_index') and self.tropical_index:
-            #     engines_created.append("TROPICAL")
-            # if hasattr(self, 'draco_index') and self.draco_index:
-            #     engines_created.append("DRACÓNICO")
-            
-            # print(f"🎯 Engines RAG creados exitosamente: {', '.join(engines_created)}")
-            
         except Exception as e:
             print(f"❌ Error en _create_all_engines: {e}")
             raise e
@@ -398,21 +696,8 @@ class InterpretadorRAG:
         return target_titles
     
     def _normalize_title(self, title: str) -> str:
-        """Normalizar título para matching consistente"""
-        # Remover paréntesis y contenido
-        normalized = re.sub(r'\s*\([^)]*\)', '', title)
-        # Remover dos puntos y contenido posterior
-        normalized = re.sub(r':.*', '', normalized)
-        # Convertir a minúsculas
-        normalized = normalized.lower()
-        # Normalizar espacios
-        normalized = re.sub(r'\s+', ' ', normalized).strip()
-        # Normalizar "casa dos" -> "casa 2"
-        normalized = normalized.replace(" en casa dos", " en casa 2")
-        # Remover asteriscos de markdown
-        normalized = re.sub(r'\*+', '', normalized).strip()
-        
-        return normalized
+        """Normalizar título para matching consistente (misma normalización que las claves de secciones_rag.py)"""
+        return normalizar_titulo(title)
     
     def _is_relevant_title(self, title: str) -> bool:
         """Verificar si un título es relevante para interpretación"""
@@ -466,38 +751,41 @@ class InterpretadorRAG:
             # Si el feature flag está desactivado, usar siempre el índice mixto (sistema actual)
             if not self.USE_SEPARATE_ENGINES:
                 # print(f"🔧 Usando índice MIXTO (feature flag desactivado)")
-                return self.index.as_query_engine(**kwargs)
-            
-            # Si el feature flag está activado, usar índices separados
-            # print(f"🔧 Feature flag activado - seleccionando índice para carta {chart_type}")
+                return self._crear_motor_rag(chart_type, **kwargs)
             
-            if chart_type.lower() == "draco":
-                if hasattr(self, 'draco_index') and self.draco_index is not None:
-                    # print(f"✅ Usando índice DRACÓNICO separado")
-                    return self.draco_index.as_query_engine(**kwargs)
-                else:
-                    # print(f"⚠️ Índice dracónico no disponible, fallback a índice mixto")
-                    return self.index.as_query_engine(**kwargs)
-            else:
-                # chart_type == "tropical" o cualquier otro valor
-                if hasattr(self, 'tropical_index') and self.tropical_index is not None:
-                    # print(f"✅ Usando índice TROPICAL separado")
-                    return self.tropical_index.as_query_engine(**kwargs)
-                else:
-                    # print(f"⚠️ Índice tropical no disponible, fallback a índice mixto")
-                    return self.index.as_query_engine(**kwargs)
+            # Si el feature flag está activado, vista filtrada por chart_type del mismo índice
+            tipo = "draco" if chart_type.lower() == "draco" else "tropical"
+            if tipo in getattr(self, 'rag_tipos_carta', []):
+                from indices_rag import filtro_tipo_carta
+                return self._crear_motor_rag(tipo, filters=filtro_tipo_carta(tipo), **kwargs)
+            # print(f"⚠️ Sin nodos {tipo}, fallback a índice mixto")
+            return self._crear_motor_rag(tipo, **kwargs)
                     
         except Exception as e:
             print(f"❌ Error en _get_query_engine: {e}")
             # print(f"🔄 Fallback a índice mixto por error")
             return self.index.as_query_engine(**kwargs)
     
+    def _crear_motor_rag(self, chart_type: str = "tropical", **kwargs):
+        """Motor de consulta sobre self.index; con el almacén de secciones, las consultas que son un
+        encabezado del corpus usan esa sección exacta y el resto la búsqueda vectorial"""
+        if self.secciones_rag is None:
+            return self.index.as_query_engine(**kwargs)
+        from llama_index.core.query_engine import RetrieverQueryEngine
+        from secciones_rag import RecuperadorPorTitulo
+        tipo = "draco" if chart_type.lower() == "draco" else "tropical"
+        # as_query_engine() reparte solo los kwargs; aquí hay que separar los del motor de los del retriever
+        args_motor = {k: kwargs.pop(k) for k in self._ARGS_MOTOR_CONSULTA if k in kwargs}
+        recuperador = RecuperadorPorTitulo(self.secciones_rag, tipo, self.index.as_retriever(**kwargs))
+        llm = args_motor.pop("llm", None) or Settings.llm
+        return RetrieverQueryEngine.from_args(recuperador, llm=llm, **args_motor)
+    
     def _setup_base_prompt(self):
         """Configurar prompt base para RAG"""
         prompt_str = get_rag_extraction_prompt_str()
         self.base_custom_prompt_template = PromptTemplate(prompt_str)
     
-    async def generar_interpretacion_completa(self, carta_natal_data: Dict[str, Any], genero: str, tipo_carta: str = "tropical") -> Dict[str, Any]:
+    async def generar_interpretacion_completa(self, carta_natal_data: Dict[str, Any], genero: str, tipo_carta: str = "tropical", modo_narrativa: Optional[str] = None, profundidad: Optional[str] = None, max_latency_ms: Optional[int] = None) -> Dict[str, Any]:
         """
         Generar interpretación completa (narrativa + individual)
 
@@ -505,108 +793,78 @@ class InterpretadorRAG:
             carta_natal_data: Datos de carta natal del microservicio
             genero: "masculino" o "femenino"
             tipo_carta: "tropical" o "draco" para determinar qué títulos usar
+            modo_narrativa: "completa", "secciones", "parrafos", "pregenerada" o "plantilla" (None = NARRATIVA_MODO)
+            profundidad: "breve", "estandar" o "profunda" (None = NARRATIVA_PROFUNDIDAD)
+            max_latency_ms: presupuesto de latencia del cliente; si la narrativa no llega a tiempo se
+                devuelve degradada (parcial o por plantilla). Sin esto, la latencia la decide el LLM.
 
         Returns:
-            Dict con interpretacion_narrativa, interpretaciones_individuales, tiempo_generacion
+            Dict con interpretacion_narrativa, interpretaciones_individuales, tiempo_generacion, tokens,
+            degradada y motivo_degradacion
+        
+        Raises:
+            LatenciaExcedidaError: ni las interpretaciones individuales llegaron dentro de max_latency_ms
         """
+        if max_latency_ms is not None:
+            # Con deadline propio no se coalesce: un resultado degradado no debe llegar a pedidos sin apuro
+            deadline = time.monotonic() + max_latency_ms / 1000
+            return await self._ejecutar_interpretacion_completa(carta_natal_data, genero, tipo_carta, modo_narrativa, profundidad, deadline)
+        if self.vuelos_interpretacion is None:
+            return await self._ejecutar_interpretacion_completa(carta_natal_data, genero, tipo_carta, modo_narrativa, profundidad)
+        
+        modo = self._resolver_modo_narrativa(modo_narrativa)
+        profundidad = self._resolver_profundidad(profundidad)
+        clave = self._huella_pedido(carta_natal_data, genero, tipo_carta, f"{modo}:{profundidad}")
+        resultado = await self.vuelos_interpretacion.run(
+            clave, lambda: self._ejecutar_interpretacion_completa(carta_natal_data, genero, tipo_carta, modo, profundidad)
+        )
+        # Cada pedido recibe su propio dict (el resultado compartido no debe mutarse)
+        return dict(resultado)
+    
+    def _huella_pedido(self, carta_natal_data: Dict[str, Any], genero: str, tipo_carta: str, modo: str) -> str:
+        """Huella de un pedido: carta completa (JSON canónico) + género + tipo + modo narrativo"""
+        payload = json.dumps(
+            {"carta": carta_natal_data, "genero": (genero or "").lower(), "tipo_carta": (tipo_carta or "").lower(), "modo": modo},
+            sort_keys=True, ensure_ascii=False, default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    async def _ejecutar_interpretacion_completa(self, carta_natal_data: Dict[str, Any], genero: str, tipo_carta: str = "tropical", modo_narrativa: Optional[str] = None, profundidad: Optional[str] = None, deadline: Optional[float] = None) -> Dict[str, Any]:
+        """Generación efectiva de generar_interpretacion_completa (sin coalescencia)"""
         try:
             start_time = time.time()
 
-            # --- FASE 3.2: INTERPRETACIÓN DETERMINISTA (TROPICAL) ---
-            # Si es carta tropical y tenemos el interpretador cargado, usamos lógica directa (JSON)
-            if tipo_carta == "tropical" and hasattr(self, 'interpretador_astrologico') and self.interpretador_astrologico and getattr(self.interpretador_astrologico, 'natal_map', None):
-                print(f"🚀 Usando InterpretadorAstrologico (JSON) para carta {tipo_carta}...")
-                
-                # 1. Obtener interpretaciones directas (incluye lógica compleja)
-                interpretaciones_raw = self.interpretador_astrologico.get_natal_interpretations(carta_natal_data)
-                
-                # 2. Adaptar al formato que espera el generador narrativo
-                interpretaciones_individuales = []
-                for item in interpretaciones_raw:
-                    interpretaciones_individuales.append({
-                        "titulo": item["titulo"],
-                        "interpretacion": item["texto"],
-                        "tipo": item["tipo"],
-                        # "planeta": "", # Campos opcionales
-                        # "signo": ""
-                    })
-                
-                print(f"✅ Se obtuvieron {len(interpretaciones_individuales)} interpretaciones deterministas (Tropical).")
-                
-            # --- FASE 3.3: INTERPRETACIÓN DETERMINISTA (DRACÓNICA) ---
-            elif tipo_carta == "draco" and hasattr(self, 'interpretador_astrologico') and self.interpretador_astrologico and getattr(self.interpretador_astrologico, 'draco_map', None):
-                print(f"🚀 Usando InterpretadorAstrologico (JSON) para carta {tipo_carta} en modo Determinista...")
-                
-                # 0. Adaptar datos (cuspides_cruzadas -> house_overlaps, etc.)
-                draco_data = carta_natal_data.copy()
-                
-                if "cuspides_cruzadas" in carta_natal_data and carta_natal_data["cuspides_cruzadas"]:
-                    overlaps = {}
-                    for item in carta_natal_data["cuspides_cruzadas"]:
-                        d = str(item.get("casa_draconica"))
-                        t = item.get("casa_tropical_ubicacion")
-                        if d and t: overlaps[d] = t
-                    draco_data["house_overlaps"] = overlaps
-                    
-                if "aspectos_cruzados" in carta_natal_data and carta_natal_data["aspectos_cruzados"]:
-                    contacts = []
-                    for item in carta_natal_data["aspectos_cruzados"]:
-                        contacts.append({
-                            "p1": item.get("punto_draconico"),
-                            "p2": item.get("punto_tropical"),
-                            "aspect": item.get("tipo_aspecto")
-                        })
-                    draco_data["contacts"] = contacts
-
-                # 1. Obtener interpretaciones
-                interpretaciones_raw = self.interpretador_astrologico.get_draconic_interpretations(draco_data)
-                
-                # 2. Adaptar formato
-                interpretaciones_individuales = []
-                for item in interpretaciones_raw:
-                    interpretaciones_individuales.append({
-                        "titulo": item["titulo"],
-                        "interpretacion": item["texto"],
-                        "tipo": "Draconica " + str(item.get("etiquetas", [])),
-                    })
-                
-                print(f"✅ Se obtuvieron {len(interpretaciones_individuales)} interpretaciones deterministas (Dracónica).")
-
-            else:
-                # --- FALLBACK RAG (Lógica Original) ---
-                print(f"⚠️ Usando RAG Fallback para carta {tipo_carta} (Interpretador inexistente o tipo no soportado)")
-                self._ensure_rag_initialized()
-
-                # DEBUG: Ver qué datos recibe el RAG system
-                # print(f"🔍 DEBUG PAYLOAD KEYS: {list(carta_natal_data.keys())}")
-                
-                # Cargar títulos específicos para el tipo de carta
-                target_titles_for_chart = self._load_target_titles_for_chart_type(tipo_carta)
-                
-                # 1. Adaptar datos del microservicio
-                carta_adaptada = self._adaptar_datos_microservicio(carta_natal_data)
-                
-                # 2. Extraer eventos de la carta
-                eventos = self._extract_events_from_carta(carta_adaptada)
-                
-                # 3. Filtrar eventos según títulos objetivo
-                eventos_filtrados = self._filter_events_by_target_titles(eventos)
-                
-                # 4. Obtener query engine
-                query_engine_rag = self._get_query_engine(chart_type=tipo_carta)
-                
-                # 5. Generar interpretaciones concurrentes
-                interpretaciones_individuales = await self._generar_interpretaciones_concurrentes(eventos_filtrados, query_engine_rag, tipo_carta)
+            # --- INTERPRETACIONES INDIVIDUALES (JSON determinista o RAG) ---
+            try:
+                async with asyncio.timeout(None if deadline is None else deadline - time.monotonic()):
+                    interpretaciones_individuales = await self._obtener_interpretaciones_individuales(carta_natal_data, tipo_carta)
+            except TimeoutError:
+                self.degradaciones["excedidas"] += 1
+                raise LatenciaExcedidaError("El presupuesto de latencia se agotó antes de tener las interpretaciones individuales")
             
             # --- GENERACIÓN DE NARRATIVA (COMÚN) ---
-            interpretacion_narrativa = await self._generar_interpretacion_narrativa(interpretaciones_individuales, genero, "Usuario", tipo_carta)
+            motivo_degradacion = None
+            with contabilizar_tokens() as contabilidad:
+                if deadline is None:
+                    interpretacion_narrativa = await self._generar_interpretacion_narrativa(interpretaciones_individuales, genero, "Usuario", tipo_carta, modo_narrativa, profundidad)
+                else:
+                    interpretacion_narrativa, motivo_degradacion = await self._generar_narrativa_con_deadline(
+                        interpretaciones_individuales, genero, tipo_carta, modo_narrativa, profundidad, deadline
+                    )
             
             tiempo_generacion = time.time() - start_time
+            tokens = contabilidad.resumen()
+            if tokens["llamadas"]:
+                print(f"📏 Tokens de salida: previstos {tokens['salida_prevista']}, reales {tokens['salida_real']} "
+                      f"(max_tokens {tokens['max_tokens']}, {tokens['llamadas']} llamadas)")
             
             return {
                 "interpretacion_narrativa": interpretacion_narrativa,
                 "interpretaciones_individuales": interpretaciones_individuales,
-                "tiempo_generacion": tiempo_generacion
+                "tiempo_generacion": tiempo_generacion,
+                "tokens": tokens,
+                "degradada": motivo_degradacion is not None,
+                "motivo_degradacion": motivo_degradacion
             }
         
         except Exception as e:
@@ -616,6 +874,204 @@ class InterpretadorRAG:
             traceback.print_exc()
             raise e
     
+    async def generar_interpretacion_stream(self, carta_natal_data: Dict[str, Any], genero: str, tipo_carta: str = "tropical", modo_narrativa: Optional[str] = None, profundidad: Optional[str] = None, max_latency_ms: Optional[int] = None):
+        """
+        Generar la interpretación completa como flujo de eventos (para SSE).
+
+        Produce, en orden:
+            ("interpretaciones_individuales", [...])   - en cuanto están listas
+            ("token", {"delta": "..."})               - por cada fragmento de la narrativa
+            ("fin", {"tiempo_generacion", "tiempo_primer_token", "tokens", "degradada", "motivo_degradacion"})
+
+        modo_narrativa y max_latency_ms como en generar_interpretacion_completa. Solo "completa" se
+        transmite token a token; los demás modos entregan la narrativa en un único "token". Con
+        max_latency_ms el stream se corta al agotarse el tiempo: lo ya enviado queda como narrativa
+        parcial o, si no llegó nada, se envía la plantilla.
+
+        Raises:
+            LatenciaExcedidaError: ni las interpretaciones individuales llegaron dentro de max_latency_ms
+        """
+        start_time = time.time()
+        deadline = None if max_latency_ms is None else time.monotonic() + max_latency_ms / 1000
+        try:
+            async with asyncio.timeout(None if deadline is None else deadline - time.monotonic()):
+                interpretaciones_individuales = await self._obtener_interpretaciones_individuales(carta_natal_data, tipo_carta)
+        except TimeoutError:
+            self.degradaciones["excedidas"] += 1
+            raise LatenciaExcedidaError("El presupuesto de latencia se agotó antes de tener las interpretaciones individuales")
+        yield "interpretaciones_individuales", interpretaciones_individuales
+        
+        modo = self._resolver_modo_narrativa(modo_narrativa)
+        tiempo_primer_token = None
+        motivo_degradacion = None
+        with contabilizar_tokens() as contabilidad:
+            if modo != "completa":
+                if deadline is None:
+                    narrativa = await self._generar_interpretacion_narrativa(interpretaciones_individuales, genero, "Usuario", tipo_carta, modo, profundidad)
+                else:
+                    narrativa, motivo_degradacion = await self._generar_narrativa_con_deadline(
+                        interpretaciones_individuales, genero, tipo_carta, modo, profundidad, deadline
+                    )
+                tiempo_primer_token = time.time() - start_time
+                yield "token", {"delta": narrativa}
+            elif deadline is None:
+                async for delta in self._stream_interpretacion_narrativa(interpretaciones_individuales, genero, tipo_carta, profundidad):
+                    if tiempo_primer_token is None:
+                        tiempo_primer_token = time.time() - start_time
+                    yield "token", {"delta": delta}
+            else:
+                motivo = None
+                # El plazo se aplica a cada fragmento y no alrededor de los yield: un asyncio.timeout
+                # abierto durante el yield cancelaría al consumidor (la respuesta SSE), no al LLM
+                deltas = self._stream_narrativa_completa(interpretaciones_individuales, genero, tipo_carta, profundidad)
+                try:
+                    while True:
+                        restante = deadline - time.monotonic() - self.LATENCY_BUDGET_RESERVE_MS / 1000
+                        try:
+                            delta = await asyncio.wait_for(anext(deltas), max(restante, 0))
+                        except StopAsyncIteration:
+                            break
+                        except TimeoutError:
+                            motivo = "sin_tiempo"
+                            break
+                        except ErrorLLM as e:
+                            print(f"❌ Error durante la re-escritura narrativa: {e}")
+                            motivo = "error_llm"
+                            break
+                        if tiempo_primer_token is None:
+                            tiempo_primer_token = time.time() - start_time
+                        yield "token", {"delta": delta}
+                finally:
+                    await deltas.aclose()
+                if motivo and tiempo_primer_token is not None:
+                    # Lo enviado ya está en el cliente: no se puede recortar al último párrafo
+                    self.degradaciones["parcial"] += 1
+                    print(f"⏱️ Narrativa (stream) parcial por presupuesto de latencia ({motivo})")
+                    motivo_degradacion = f"parcial:{motivo}"
+                elif motivo:
+                    self.degradaciones["plantilla"] += 1
+                    print(f"⏱️ Narrativa (stream) por plantilla por presupuesto de latencia ({motivo})")
+                    motivo_degradacion = f"plantilla:{motivo}"
+                    tiempo_primer_token = time.time() - start_time
+                    yield "token", {"delta": generar_narrativa_plantilla(
+                        interpretaciones_individuales, genero, tipo_carta, self._resolver_profundidad(profundidad)
+                    )}
+        
+        yield "fin", {
+            "tiempo_generacion": time.time() - start_time,
+            "tiempo_primer_token": tiempo_primer_token,
+            "tokens": contabilidad.resumen(),
+            "degradada": motivo_degradacion is not None,
+            "motivo_degradacion": motivo_degradacion
+        }
+    
+    async def _obtener_interpretaciones_individuales(self, carta_natal_data: Dict[str, Any], tipo_carta: str = "tropical") -> List[Dict[str, Any]]:
+        """
+        Obtener las interpretaciones individuales de la carta (sin narrativa).
+        Usa el motor JSON determinista si está disponible y el RAG como fallback.
+        """
+        interpretaciones_individuales = self._interpretaciones_deterministas(carta_natal_data, tipo_carta)
+        if interpretaciones_individuales is not None:
+            return interpretaciones_individuales
+
+        # --- FALLBACK RAG (Lógica Original) ---
+        print(f"⚠️ Usando RAG Fallback para carta {tipo_carta} (Interpretador inexistente o tipo no soportado)")
+        if not self._rag_initialized:
+            # Fuera del event loop: el arranque en frío del índice no bloquea a los demás pedidos y el
+            # plazo de max_latency_ms puede vencer mientras tanto (la inicialización sigue en su hilo)
+            await asyncio.to_thread(self._ensure_rag_initialized)
+
+        # DEBUG: Ver qué datos recibe el RAG system
+        # print(f"🔍 DEBUG PAYLOAD KEYS: {list(carta_natal_data.keys())}")
+        
+        # Cargar títulos específicos para el tipo de carta
+        target_titles_for_chart = self._load_target_titles_for_chart_type(tipo_carta)
+        
+        # 1. Adaptar datos del microservicio
+        carta_adaptada = self._adaptar_datos_microservicio(carta_natal_data)
+        
+        # 2. Extraer eventos de la carta
+        eventos = self._extract_events_from_carta(carta_adaptada)
+        
+        # 3. Filtrar eventos según títulos objetivo
+        eventos_filtrados = self._filter_events_by_target_titles(eventos)
+        
+        # 4. Obtener query engine
+        query_engine_rag = self._get_query_engine(chart_type=tipo_carta)
+        
+        # 5. Generar interpretaciones concurrentes
+        return await self._generar_interpretaciones_concurrentes(eventos_filtrados, query_engine_rag, tipo_carta)
+
+    def _interpretaciones_deterministas(self, carta_natal_data: Dict[str, Any], tipo_carta: str = "tropical") -> Optional[List[Dict[str, Any]]]:
+        """
+        Interpretaciones del motor JSON (rápidas, sin RAG ni LLM).
+        None si el motor no está cargado o no soporta el tipo de carta: ahí corresponde el RAG.
+        """
+        # --- FASE 3.2: INTERPRETACIÓN DETERMINISTA (TROPICAL) ---
+        # Si es carta tropical y tenemos el interpretador cargado, usamos lógica directa (JSON)
+        if tipo_carta == "tropical" and hasattr(self, 'interpretador_astrologico') and self.interpretador_astrologico and getattr(self.interpretador_astrologico, 'natal_map', None):
+            print(f"🚀 Usando InterpretadorAstrologico (JSON) para carta {tipo_carta}...")
+            
+            # 1. Obtener interpretaciones directas (incluye lógica compleja)
+            interpretaciones_raw = self.interpretador_astrologico.get_natal_interpretations(carta_natal_data)
+            
+            # 2. Adaptar al formato que espera el generador narrativo
+            interpretaciones_individuales = []
+            for item in interpretaciones_raw:
+                interpretaciones_individuales.append({
+                    "titulo": item["titulo"],
+                    "interpretacion": item["texto"],
+                    "tipo": item["tipo"],
+                    # "planeta": "", # Campos opcionales
+                    # "signo": ""
+                })
+            
+            print(f"✅ Se obtuvieron {len(interpretaciones_individuales)} interpretaciones deterministas (Tropical).")
+            
+        # --- FASE 3.3: INTERPRETACIÓN DETERMINISTA (DRACÓNICA) ---
+        elif tipo_carta == "draco" and hasattr(self, 'interpretador_astrologico') and self.interpretador_astrologico and getattr(self.interpretador_astrologico, 'draco_map', None):
+            print(f"🚀 Usando InterpretadorAstrologico (JSON) para carta {tipo_carta} en modo Determinista...")
+            
+            # 0. Adaptar datos (cuspides_cruzadas -> house_overlaps, etc.)
+            draco_data = carta_natal_data.copy()
+            
+            if "cuspides_cruzadas" in carta_natal_data and carta_natal_data["cuspides_cruzadas"]:
+                overlaps = {}
+                for item in carta_natal_data["cuspides_cruzadas"]:
+                    d = str(item.get("casa_draconica"))
+                    t = item.get("casa_tropical_ubicacion")
+                    if d and t: overlaps[d] = t
+                draco_data["house_overlaps"] = overlaps
+                
+            if "aspectos_cruzados" in carta_natal_data and carta_natal_data["aspectos_cruzados"]:
+                contacts = []
+                for item in carta_natal_data["aspectos_cruzados"]:
+                    contacts.append({
+                        "p1": item.get("punto_draconico"),
+                        "p2": item.get("punto_tropical"),
+                        "aspect": item.get("tipo_aspecto")
+                    })
+                draco_data["contacts"] = contacts
+
+            # 1. Obtener interpretaciones
+            interpretaciones_raw = self.interpretador_astrologico.get_draconic_interpretations(draco_data)
+            
+            # 2. Adaptar formato
+            interpretaciones_individuales = []
+            for item in interpretaciones_raw:
+                interpretaciones_individuales.append({
+                    "titulo": item["titulo"],
+                    "interpretacion": item["texto"],
+                    "tipo": "Draconica " + str(item.get("etiquetas", [])),
+                })
+            
+            print(f"✅ Se obtuvieron {len(interpretaciones_individuales)} interpretaciones deterministas (Dracónica).")
+
+        else:
+            return None
+        
+        return interpretaciones_individuales
+    
     def _adaptar_datos_microservicio(self, datos_microservicio: Dict[str, Any]) -> Dict[str, Any]:
         """
         Adaptar datos del microservicio al formato que espera el RAG
@@ -1258,6 +1714,8 @@ class InterpretadorRAG:
                 # Ejecutar consulta RAG de forma síncrona (llama-index es bloqueante)
                 respuesta = query_engine_rag.query(consulta)
                 interpretacion = respuesta.response.strip() if respuesta.response else "No se encontró interpretación específica."
+            except TareaCanceladaError:
+                raise
             except Exception as e:
                 print(f"⚠️ Error al consultar RAG para '{consulta}': {e}")
                 interpretacion = f"Error al obtener interpretación: {e}"
@@ -1265,65 +1723,335 @@ class InterpretadorRAG:
             # Crear item de interpretación
             return self._create_interpretation_item(evento, interpretacion)
         
-        # Usar ThreadPoolExecutor para paralelización real de llamadas bloqueantes
+        # Paralelización real de llamadas bloqueantes en hilos
         print(f"🚀 Ejecutando {len(eventos_filtrados)} consultas RAG en paralelo usando hilos...")
         
-        loop = asyncio.get_event_loop()
-        with ThreadPoolExecutor(max_workers=min(len(eventos_filtrados), 10)) as executor:
-            # Crear tareas para cada evento
-            tareas = [
-                loop.run_in_executor(executor, procesar_evento_individual, i, evento)
-                for i, evento in enumerate(eventos_filtrados)
-            ]
-            
-            # Ejecutar todas las tareas en paralelo y esperar resultados
-            interpretaciones_individuales = await asyncio.gather(*tareas)
+        # Pool compartido de la clase natal (acotado para todo el proceso, separado del de calendario)
+        tareas = [
+            planificador.ejecutar(NATAL, procesar_evento_individual, i, evento)
+            for i, evento in enumerate(eventos_filtrados)
+        ]
+        interpretaciones_individuales = await asyncio.gather(*tareas)
         
         return interpretaciones_individuales
     
-    async def _generar_interpretacion_narrativa(self, interpretaciones_individuales: List[Dict[str, Any]], genero: str, nombre: str, tipo_carta: str = "tropical") -> str:
-        """Generar interpretación narrativa usando GPT-4"""
+    def _combinar_interpretaciones(self, interpretaciones_individuales: List[Dict[str, Any]]) -> str:
+        """Unir los ítems como bloques '### título' + texto para el prompt"""
+        return combinar_interpretaciones_str(interpretaciones_individuales)
+    
+    def _instrucciones_narrativas(self, genero: str) -> str:
+        """Instrucciones de género gramatical y segunda persona para la narrativa"""
+        return get_instrucciones_narrativas(genero)
+    
+    def _construir_prompt_narrativo(self, interpretaciones_individuales: List[Dict[str, Any]], genero: str, tipo_carta: str = "tropical", profundidad: str = "profunda") -> Tuple[str, PresupuestoSalida]:
+        """Armar el prompt de re-escritura narrativa (persona + datos + reglas de formato) y su presupuesto de salida"""
+        interpretaciones_combinadas = self._combinar_interpretaciones(interpretaciones_individuales)
+        instrucciones_adicionales = self._instrucciones_narrativas(genero)
+        presupuesto = PresupuestoSalida(interpretaciones_individuales, profundidad)
+        
+        # Seleccionar prompt según tipo de carta
+        if tipo_carta.lower() == "draco":
+            prompt = self._get_draconian_narrative_prompt(instrucciones_adicionales, interpretaciones_combinadas, presupuesto.regla_profundidad(), profundidad)
+        else:
+            prompt = self._get_tropical_narrative_prompt(instrucciones_adicionales, interpretaciones_combinadas, presupuesto.regla_profundidad(), profundidad)
+        return prompt, presupuesto.ajustar(prompt, tope=self.llm_rewriter.max_tokens)
+    
+    def _resolver_profundidad(self, profundidad: Optional[str]) -> str:
+        """Profundidad pedida por el cliente o la de NARRATIVA_PROFUNDIDAD.
+        
+        Un valor pedido desconocido es un error (la API ya lo rechaza con 422); solo el valor por
+        defecto de la variable de entorno cae a 'profunda' si está mal escrito.
+        """
+        if profundidad:
+            if profundidad.lower() not in PROFUNDIDADES:
+                raise ValueError(f"profundidad desconocida '{profundidad}' (válidas: {', '.join(PROFUNDIDADES)})")
+            return profundidad.lower()
+        if self.NARRATIVA_PROFUNDIDAD_DEFECTO not in PROFUNDIDADES:
+            print(f"⚠️ NARRATIVA_PROFUNDIDAD desconocida '{self.NARRATIVA_PROFUNDIDAD_DEFECTO}', usando 'profunda'")
+            return "profunda"
+        return self.NARRATIVA_PROFUNDIDAD_DEFECTO
+    
+    def _resolver_modo_narrativa(self, modo_narrativa: Optional[str]) -> str:
+        """Modo pedido por el cliente o el de NARRATIVA_MODO.
+        
+        Un modo pedido desconocido es un error (la API ya lo rechaza con 422); solo el valor por
+        defecto de la variable de entorno cae a 'completa' si está mal escrito.
+        """
+        if modo_narrativa:
+            if modo_narrativa.lower() not in self.MODOS_NARRATIVA:
+                raise ValueError(f"modo_narrativa desconocido '{modo_narrativa}' (válidos: {', '.join(self.MODOS_NARRATIVA)})")
+            return modo_narrativa.lower()
+        if self.NARRATIVA_MODO_DEFECTO not in self.MODOS_NARRATIVA:
+            print(f"⚠️ NARRATIVA_MODO desconocido '{self.NARRATIVA_MODO_DEFECTO}', usando 'completa'")
+            return "completa"
+        return self.NARRATIVA_MODO_DEFECTO
+    
+    async def _generar_interpretacion_narrativa(self, interpretaciones_individuales: List[Dict[str, Any]], genero: str, nombre: str, tipo_carta: str = "tropical", modo_narrativa: Optional[str] = None, profundidad: Optional[str] = None) -> str:
+        """Generar interpretación narrativa con el LLM rewriter (Kimi-K2.5).
+        
+        Usa acomplete (asyncio nativo): la generación puede superar los 100s y
+        no debe congelar el event loop de uvicorn (/health, /interpretar-eventos).
+        
+        modo_narrativa:
+            "completa"  - un único prompt con todos los ítems (por defecto)
+            "secciones" - una llamada por sección, en paralelo, y se concatenan en orden
+            "parrafos"  - párrafos por ítem reutilizados entre cartas; el LLM solo redacta los
+                          que faltan en caché y una pasada corta de transiciones
+            "pregenerada" - como "parrafos" pero sin generar faltantes (se usa el texto fuente):
+                          a lo sumo una llamada, la de transiciones
+            "plantilla" - sin LLM: textos fuente con aperturas por sección y concordancia de género
+        
+        profundidad ("breve", "estandar", "profunda") cambia la variante del prompt, el presupuesto
+        de salida y el namespace de caché; se combina con cualquier modo.
+        """
         try:
-            # Usar el rewriter configurado en __init__ (GPT-4o, 128k context)
-            llm_rewriter = self.llm_rewriter
-            
-            # Combinar interpretaciones individuales
-            interpretaciones_texto = []
-            for item in interpretaciones_individuales:
-                titulo = item.get("titulo", "")
-                interpretacion = item.get("interpretacion", "")
-                interpretaciones_texto.append(f"### {titulo}\n{interpretacion}")
-            
-            interpretaciones_combinadas = "\n\n".join(interpretaciones_texto)
-            
-            # Configurar instrucciones de género
-            if genero.lower() == "femenino":
-                genero_instruccion = "Instrucción adicional: Redacta usando el género gramatical femenino."
-            elif genero.lower() == "masculino":
-                genero_instruccion = "Instrucción adicional: Redacta usando el género gramatical masculino."
-            else:
-                genero_instruccion = ""
-            
-            persona_instruccion = "Instrucción adicional: Dirígete directamente a la persona usando la segunda persona singular (Tú)."
-            instrucciones_adicionales = f"{genero_instruccion}\n{persona_instruccion}".strip()
-            
-            # Seleccionar prompt según tipo de carta
-            if tipo_carta.lower() == "draco":
-                rewrite_prompt_str = self._get_draconian_narrative_prompt(instrucciones_adicionales, interpretaciones_combinadas)
-            else:
-                rewrite_prompt_str = self._get_tropical_narrative_prompt(instrucciones_adicionales, interpretaciones_combinadas)
-            
-            # Generar interpretación narrativa
-            if LLAMA_INDEX_NEW:
-                narrative_response = llm_rewriter.complete(rewrite_prompt_str)
-                return narrative_response.text.strip()
-            else:
-                narrative_response = llm_rewriter.complete(rewrite_prompt_str)
-                return narrative_response.text.strip()
-            
+            return await self._generar_narrativa(interpretaciones_individuales, genero, tipo_carta, modo_narrativa, profundidad)
         except Exception as e:
             print(f"❌ Error durante la re-escritura narrativa: {e}")
             return f"Error al generar el informe narrativo: {e}"
+    
+    async def _generar_narrativa(self, interpretaciones_individuales: List[Dict[str, Any]], genero: str, tipo_carta: str = "tropical", modo_narrativa: Optional[str] = None, profundidad: Optional[str] = None) -> str:
+        """Caché + generación según el modo; a diferencia de _generar_interpretacion_narrativa, propaga los errores"""
+        modo = self._resolver_modo_narrativa(modo_narrativa)
+        profundidad = self._resolver_profundidad(profundidad)
+        if modo == "plantilla":
+            # Milisegundos y determinista: no vale la pena pasar por la caché
+            return generar_narrativa_plantilla(interpretaciones_individuales, genero, tipo_carta, profundidad)
+        clave_cache = self._clave_cache_narrativa(interpretaciones_individuales, genero, tipo_carta, f"{modo}:{profundidad}")
+        if clave_cache:
+            narrativa_cacheada = self.cache_narrativas.get(clave_cache)
+            if narrativa_cacheada is not None:
+                print("⚡ [CACHE HIT] Narrativa recuperada de la caché")
+                return narrativa_cacheada
+        
+        if modo == "secciones":
+            narrativa = await self._generar_narrativa_por_secciones(interpretaciones_individuales, genero, tipo_carta, profundidad)
+        elif modo in ("parrafos", "pregenerada"):
+            narrativa = await self._generar_narrativa_por_parrafos(
+                interpretaciones_individuales, genero, tipo_carta, generar_faltantes=(modo == "parrafos"), profundidad=profundidad
+            )
+        else:
+            rewrite_prompt_str, presupuesto = self._construir_prompt_narrativo(interpretaciones_individuales, genero, tipo_carta, profundidad)
+            narrative_response = await self.llm_rewriter.acomplete(rewrite_prompt_str, presupuesto=presupuesto)
+            narrativa = narrative_response.text.strip()
+        
+        self._guardar_narrativa_en_cache(clave_cache, narrativa)
+        return narrativa
+    
+    async def _generar_narrativa_por_secciones(self, interpretaciones_individuales: List[Dict[str, Any]], genero: str, tipo_carta: str = "tropical", profundidad: str = "profunda") -> str:
+        """Generar cada sección (luminares, planetas, casas, aspectos, contactos) en paralelo.
+        
+        La latencia total pasa a ser la de la sección más larga en lugar de la suma.
+        """
+        secciones = agrupar_en_secciones(interpretaciones_individuales)
+        instrucciones_adicionales = self._instrucciones_narrativas(genero)
+        
+        llamadas = []
+        for _, nombre_seccion, items in secciones:
+            presupuesto = PresupuestoSalida(items, profundidad)
+            prompt = get_section_narrative_prompt_str(
+                instrucciones_adicionales,
+                self._combinar_interpretaciones(items),
+                tipo_carta,
+                nombre_seccion,
+                presupuesto.regla_profundidad(),
+                profundidad
+            )
+            llamadas.append(self.llm_rewriter.acomplete(prompt, presupuesto=presupuesto.ajustar(prompt, tope=self.llm_rewriter.max_tokens)))
+        print(f"🧩 Generando narrativa en {len(llamadas)} secciones en paralelo: {', '.join(nombre for _, nombre, _ in secciones)}")
+        
+        tareas = [asyncio.ensure_future(llamada) for llamada in llamadas]
+        try:
+            respuestas = await asyncio.gather(*tareas)
+        finally:
+            # Si una sección falla, las demás no siguen ocupando el limitador ni gastando tokens
+            pendientes = [tarea for tarea in tareas if not tarea.done()]
+            for tarea in pendientes:
+                tarea.cancel()
+            await asyncio.gather(*pendientes, return_exceptions=True)
+        return "\n\n".join(respuesta.text.strip() for respuesta in respuestas)
+
+    async def _generar_narrativa_por_parrafos(self, interpretaciones_individuales: List[Dict[str, Any]], genero: str, tipo_carta: str = "tropical", generar_faltantes: bool = True, profundidad: str = "profunda") -> str:
+        """Ensamblar la narrativa con párrafos por ítem (artefacto pre-generado y caché compartida).
+        
+        El costo depende de cuántos ítems son nuevos para la caché, no del tamaño de la carta.
+        """
+        secciones = agrupar_en_secciones(interpretaciones_individuales)
+        parrafos, conectores = await asyncio.gather(
+            self._obtener_parrafos(interpretaciones_individuales, genero, tipo_carta, generar_faltantes, profundidad),
+            self._generar_conectores([nombre for _, nombre, _ in secciones], genero)
+        )
+        parrafo_por_item = {id(item): parrafo for item, parrafo in zip(interpretaciones_individuales, parrafos)}
+        
+        bloques = []
+        for n, (_, _, items_seccion) in enumerate(secciones):
+            if n > 0 and conectores:
+                bloques.append(conectores[n - 1])
+            bloques.extend(parrafo_por_item[id(item)] for item in items_seccion)
+        return "\n\n".join(bloques)
+    
+    async def _obtener_parrafos(self, interpretaciones_individuales: List[Dict[str, Any]], genero: str, tipo_carta: str, generar_faltantes: bool = True, profundidad: str = "profunda") -> List[str]:
+        """Párrafo re-escrito de cada ítem: pre-generado, desde caché o generado (concurrencia acotada).
+        
+        Con generar_faltantes=False los ítems sin párrafo usan su texto fuente sin llamar al LLM.
+        El artefacto pre-generado solo contiene párrafos de profundidad "profunda".
+        """
+        modelo = self.llm_rewriter.model
+        pregenerados = self.parrafos_pregenerados if profundidad == "profunda" else None
+        parrafos: List[Optional[str]] = []
+        for item in interpretaciones_individuales:
+            texto = item.get("interpretacion", "")
+            parrafo = pregenerados.get(texto, genero, tipo_carta) if pregenerados is not None else None
+            parrafos.append(parrafo)
+        claves = [
+            self.cache_parrafos.clave_parrafo(item.get("interpretacion", ""), genero, tipo_carta, modelo, profundidad)
+            if self.cache_parrafos is not None and parrafo is None else None
+            for item, parrafo in zip(interpretaciones_individuales, parrafos)
+        ]
+        for i, clave in enumerate(claves):
+            if clave:
+                parrafos[i] = self.cache_parrafos.get(clave)
+        faltantes = [i for i, parrafo in enumerate(parrafos) if parrafo is None]
+        print(f"📝 Párrafos: {len(parrafos) - len(faltantes)} pre-generados o en caché, {len(faltantes)} faltantes")
+        
+        if not generar_faltantes:
+            for i in faltantes:
+                parrafos[i] = interpretaciones_individuales[i].get("interpretacion", "")
+            return parrafos
+        
+        semaforo = asyncio.Semaphore(self.PARAGRAPH_REWRITE_CONCURRENCY)
+        
+        async def generar_parrafo(i: int) -> str:
+            async with semaforo:
+                texto = await self._reescribir_parrafo(interpretaciones_individuales[i], genero, tipo_carta, profundidad)
+            if claves[i]:
+                self.cache_parrafos.set(claves[i], texto)
+            return texto
+        
+        generados = await asyncio.gather(*[generar_parrafo(i) for i in faltantes])
+        for i, texto in zip(faltantes, generados):
+            parrafos[i] = texto
+        return parrafos
+    
+    async def _reescribir_parrafo(self, item: Dict[str, Any], genero: str, tipo_carta: str, profundidad: str = "profunda") -> str:
+        """Una llamada al LLM para re-escribir un ítem como párrafo autónomo (modo parrafos y pre-generación)"""
+        presupuesto = PresupuestoSalida([item], profundidad)
+        prompt = get_paragraph_rewrite_prompt_str(
+            self._instrucciones_narrativas(genero), self._combinar_interpretaciones([item]), tipo_carta,
+            presupuesto.regla_profundidad(), profundidad
+        )
+        respuesta = await self.llm_rewriter.acomplete(
+            prompt, presupuesto=presupuesto.ajustar(prompt, tope=self.PARAGRAPH_MAX_TOKENS)
+        )
+        return respuesta.text.strip()
+    
+    async def _generar_conectores(self, nombres_secciones: List[str], genero: str) -> List[str]:
+        """Pasada corta: una frase de transición por cada sección a partir de la segunda.
+        
+        Si el LLM falla o no devuelve la cantidad exacta de líneas, se omiten las transiciones.
+        """
+        if not self.PARAGRAPH_CONNECTIVES or len(nombres_secciones) < 2:
+            return []
+        cantidad = len(nombres_secciones) - 1
+        prompt = get_connective_prompt_str(
+            self._instrucciones_narrativas(genero),
+            "\n".join(f"{n}. {nombre}" for n, nombre in enumerate(nombres_secciones, 1)),
+            cantidad
+        )
+        try:
+            respuesta = await self.llm_rewriter.acomplete(prompt, max_tokens=60 * cantidad)
+        except ErrorLLM:
+            print("⚠️ Transiciones omitidas (el LLM no respondió)")
+            return []
+        lineas = [linea.strip() for linea in respuesta.text.strip().split("\n") if linea.strip()]
+        if len(lineas) != cantidad:
+            print(f"⚠️ Transiciones omitidas (se esperaban {cantidad} líneas, llegaron {len(lineas)})")
+            return []
+        return lineas
+    
+    async def _generar_narrativa_con_deadline(self, interpretaciones_individuales: List[Dict[str, Any]], genero: str, tipo_carta: str, modo_narrativa: Optional[str], profundidad: Optional[str], deadline: float) -> Tuple[str, Optional[str]]:
+        """Narrativa que nunca pasa del deadline: (texto, motivo de degradación o None).
+        
+        En modo "completa" se genera por streaming para conservar lo ya redactado. Si el tiempo
+        (menos LATENCY_BUDGET_RESERVE_MS para armar la respuesta) se agota o el LLM falla, se
+        devuelve la narrativa parcial cortada en el último párrafo completo o, si no hay, la plantilla.
+        """
+        modo = self._resolver_modo_narrativa(modo_narrativa)
+        profundidad = self._resolver_profundidad(profundidad)
+        restante = deadline - time.monotonic() - self.LATENCY_BUDGET_RESERVE_MS / 1000
+        fragmentos: List[str] = []
+        motivo = "sin_tiempo"
+        if restante > 0:
+            try:
+                async with asyncio.timeout(restante):
+                    if modo == "completa":
+                        async for delta in self._stream_narrativa_completa(interpretaciones_individuales, genero, tipo_carta, profundidad):
+                            fragmentos.append(delta)
+                        return "".join(fragmentos).strip(), None
+                    return await self._generar_narrativa(interpretaciones_individuales, genero, tipo_carta, modo, profundidad), None
+            except TimeoutError:
+                motivo = "sin_tiempo"
+            except ErrorLLM as e:
+                print(f"❌ Error durante la re-escritura narrativa: {e}")
+                motivo = "error_llm"
+        
+        parcial = self._cortar_narrativa_parcial("".join(fragmentos))
+        if parcial:
+            self.degradaciones["parcial"] += 1
+            print(f"⏱️ Narrativa parcial por presupuesto de latencia ({motivo}, {len(parcial)} caracteres)")
+            return parcial, f"parcial:{motivo}"
+        self.degradaciones["plantilla"] += 1
+        print(f"⏱️ Narrativa por plantilla por presupuesto de latencia ({motivo})")
+        return generar_narrativa_plantilla(interpretaciones_individuales, genero, tipo_carta, profundidad), f"plantilla:{motivo}"
+    
+    @staticmethod
+    def _cortar_narrativa_parcial(texto: str) -> str:
+        """Quedarse con los párrafos completos de una narrativa cortada (vacío si no hay ninguno)."""
+        texto = texto.strip()
+        corte = texto.rfind("\n\n")
+        return texto[:corte].strip() if corte > 0 else ""
+    
+    async def _stream_interpretacion_narrativa(self, interpretaciones_individuales: List[Dict[str, Any]], genero: str, tipo_carta: str = "tropical", profundidad: Optional[str] = None):
+        """Versión en streaming de _generar_interpretacion_narrativa: produce los deltas de texto."""
+        try:
+            async for delta in self._stream_narrativa_completa(interpretaciones_individuales, genero, tipo_carta, profundidad):
+                yield delta
+        except ErrorLLM as e:
+            # El stream no llegó a abrirse: mismo texto que la versión no streaming
+            yield f"Error al generar el informe narrativo: {e}"
+    
+    async def _stream_narrativa_completa(self, interpretaciones_individuales: List[Dict[str, Any]], genero: str, tipo_carta: str = "tropical", profundidad: Optional[str] = None):
+        """Deltas de la narrativa completa (caché incluida); propaga ErrorLLM. Solo se cachea si termina."""
+        profundidad = self._resolver_profundidad(profundidad)
+        clave_cache = self._clave_cache_narrativa(interpretaciones_individuales, genero, tipo_carta, f"completa:{profundidad}")
+        if clave_cache:
+            narrativa_cacheada = self.cache_narrativas.get(clave_cache)
+            if narrativa_cacheada is not None:
+                print("⚡ [CACHE HIT] Narrativa (stream) recuperada de la caché")
+                yield narrativa_cacheada
+                return
+        
+        narrativa = ""
+        rewrite_prompt_str, presupuesto = self._construir_prompt_narrativo(interpretaciones_individuales, genero, tipo_carta, profundidad)
+        async for response in self.llm_rewriter.astream_complete(rewrite_prompt_str, presupuesto=presupuesto):
+            narrativa += response.delta
+            yield response.delta
+        
+        self._guardar_narrativa_en_cache(clave_cache, narrativa.strip())
+    
+    def _clave_cache_narrativa(self, interpretaciones_individuales: List[Dict[str, Any]], genero: str, tipo_carta: str, namespace: str) -> Optional[str]:
+        """Clave de caché de la narrativa, o None si la caché está desactivada"""
+        if self.cache_narrativas is None:
+            return None
+        return self.cache_narrativas.clave(interpretaciones_individuales, genero, tipo_carta, self.llm_rewriter.model, namespace)
+    
+    def _guardar_narrativa_en_cache(self, clave_cache: Optional[str], narrativa: str):
+        """Guardar solo narrativas válidas (nunca textos de error ni vacíos)"""
+        if clave_cache and narrativa and not narrativa.startswith("Error"):
+            try:
+                self.cache_narrativas.set(clave_cache, narrativa)
+            except Exception as e:
+                print(f"⚠️ No se pudo guardar la narrativa en caché: {e}")
 
     def buscar_interpretacion_evento(self, evento: dict) -> str:
         """
@@ -1423,9 +2151,11 @@ class InterpretadorRAG:
             self._ensure_rag_initialized()
             try:
                 # Crear motor de consulta RAG (es rápido, se basa en el índice en memoria)
-                query_engine_rag = self.index.as_query_engine(
+                query_engine_rag = self._crear_motor_rag(
+                    "tropical",
                     similarity_top_k=1,
-                    text_qa_template=self.base_custom_prompt_template
+                    text_qa_template=self.base_custom_prompt_template,
+                    **({"llm": self.llm_calendario} if LLAMA_INDEX_NEW else {})
                 )
                 # Consultar al motor RAG
                 respuesta = query_engine_rag.query(consulta_normalizada)
@@ -1437,10 +2167,10 @@ class InterpretadorRAG:
         else:
             return f"[SIN COINCIDENCIA]: {consulta_normalizada}"
 
-    def _get_tropical_narrative_prompt(self, instrucciones_adicionales: str, interpretaciones_combinadas: str) -> str:
+    def _get_tropical_narrative_prompt(self, instrucciones_adicionales: str, interpretaciones_combinadas: str, regla_profundidad: Optional[str] = None, profundidad: str = "profunda") -> str:
         """Crear prompt específico para cartas natales tropicales"""
-        return get_tropical_narrative_prompt_str(instrucciones_adicionales, interpretaciones_combinadas)
+        return get_tropical_narrative_prompt_str(instrucciones_adicionales, interpretaciones_combinadas, regla_profundidad, profundidad)
 
-    def _get_draconian_narrative_prompt(self, instrucciones_adicionales: str, interpretaciones_combinadas: str) -> str:
+    def _get_draconian_narrative_prompt(self, instrucciones_adicionales: str, interpretaciones_combinadas: str, regla_profundidad: Optional[str] = None, profundidad: str = "profunda") -> str:
         """Crear prompt específico para cartas natales dracónicas - VERSIÓN REFINADA"""
-        return get_draconian_narrative_prompt_str(instrucciones_adicionales, interpretaciones_combinadas)
+        return get_draconian_narrative_prompt_str(instrucciones_adicionales, interpretaciones_combinadas, regla_profundidad, profundidad)
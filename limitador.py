@@ -0,0 +1,297 @@
+"""
+Limitador de concurrencia adaptativo (AIMD) para las llamadas salientes al LLM.
+- Un límite por clase de prioridad (planificador.py) compartido por todo el proceso:
+  llm_rewriter, Settings.llm y los motores RAG (todos llaman a Baseten a través de BasetenLLM)
+- Aumento aditivo con cada respuesta sana, disminución multiplicativa ante errores de
+  sobrecarga (429, 5xx, timeouts) o latencias por encima del umbral de la etapa de la llamada
+  (etapas.py: una extracción lenta indica congestión mucho antes que una narrativa)
+- Las llamadas canceladas (cliente desconectado, duplicado perdedor) liberan su lugar sin ajustar:
+  no dicen nada sobre la salud del proveedor
+- Cola de espera FIFO acotada, compartida entre hilos (consultas RAG) y corutinas
+- Profundidad de cola y tiempos de espera exportados en /metrics para autoescalar
+"""
+
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from typing import Any, Deque, Dict, Optional
+
+from llm_client import _env_float, _env_int
+from resiliencia import ErrorLLM, es_reintentable, iniciar_reloj_intento
+from planificador import CLASES, CALENDARIO, NATAL, PREFETCH, TareaCanceladaError, clase_actual
+
+# Presupuesto por clase: (inicial, mínimo, máximo, cola máxima)
+PRESUPUESTOS = {
+    CALENDARIO: (8, 2, 16, 200),
+    NATAL: (16, 2, 64, 200),
+    PREFETCH: (2, 1, 8, 5000),
+}
+
+
+class LimitadorSaturadoError(ErrorLLM):
+    """La cola del limitador está llena o la espera superó el deadline de la llamada."""
+
+
+class _Espera:
+    """Un pedido en cola: se despierta con un Event (hilo) o un Future (corutina)."""
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.loop = loop
+        self.futuro = loop.create_future() if loop is not None else None
+        self.evento = threading.Event() if loop is None else None
+        self.concedido = False
+
+    def despertar(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(lambda: self.futuro.done() or self.futuro.set_result(True))
+        else:
+            self.evento.set()
+
+
+class Permiso:
+    """Turno concedido: recuerda cuándo empezó, en qué "época" del límite y su umbral de latencia."""
+
+    def __init__(self, epoca: int, espera: float):
+        self.epoca = epoca
+        self.espera = espera
+        self.inicio = time.monotonic()
+        self.umbral_latencia: Optional[float] = None
+
+
+class LimitadorAdaptativo:
+    """Semáforo cuyo tamaño se ajusta con AIMD a partir de latencia y errores observados."""
+
+    def __init__(self, inicial: Optional[int] = None, minimo: Optional[int] = None, maximo: Optional[int] = None,
+                 max_cola: Optional[int] = None, umbral_latencia: Optional[float] = None,
+                 factor_reduccion: Optional[float] = None, clase: str = NATAL):
+        inicial_def, minimo_def, maximo_def, cola_def = PRESUPUESTOS[clase]
+        prefijo = f"LLM_CONCURRENCY_{clase.upper()}"
+        self.clase = clase
+        self.minimo = minimo if minimo is not None else _env_int(f"{prefijo}_MIN", minimo_def)
+        self.maximo = maximo if maximo is not None else _env_int(f"{prefijo}_MAX", maximo_def)
+        self.limite = float(inicial if inicial is not None else _env_int(f"{prefijo}_INITIAL", inicial_def))
+        self.max_cola = max_cola if max_cola is not None else _env_int(f"LLM_QUEUE_{clase.upper()}_MAX", cola_def)
+        # Umbral para llamadas sin etapa: una narrativa completa de Kimi-K2.5 ronda los 120s
+        self.umbral_latencia = umbral_latencia if umbral_latencia is not None else _env_float("LLM_LATENCY_THRESHOLD", 180.0)
+        self.factor_reduccion = factor_reduccion if factor_reduccion is not None else _env_float("LLM_CONCURRENCY_BACKOFF", 0.7)
+        self.en_curso = 0
+        self._cola: Deque[_Espera] = deque()
+        self._lock = threading.Lock()
+        self._epoca = 0
+        self.concedidos = 0
+        self.encolados = 0
+        self.rechazados = 0
+        self.aumentos = 0
+        self.reducciones = 0
+        self.cancelados = 0
+        self.espera_total = 0.0
+        self.espera_maxima = 0.0
+        self._esperas_recientes: Deque[float] = deque(maxlen=500)
+
+    # --- Adquisición ---
+
+    def _conceder(self, espera: float) -> Permiso:
+        """Con el lock tomado: ocupar un lugar y registrar el tiempo de espera."""
+        self.en_curso += 1
+        self.concedidos += 1
+        self.espera_total += espera
+        self.espera_maxima = max(self.espera_maxima, espera)
+        self._esperas_recientes.append(espera)
+        return Permiso(self._epoca, espera)
+
+    def _intentar_o_encolar(self, loop: Optional[asyncio.AbstractEventLoop]):
+        with self._lock:
+            if self.en_curso < int(self.limite) and not self._cola:
+                return self._conceder(0.0), None
+            if len(self._cola) >= self.max_cola:
+                self.rechazados += 1
+                raise LimitadorSaturadoError(f"Cola del limitador LLM llena ({self.max_cola} en espera)")
+            espera = _Espera(loop)
+            self._cola.append(espera)
+            self.encolados += 1
+            return None, espera
+
+    def _abandonar(self, espera: _Espera, inicio: float) -> Optional[Permiso]:
+        """El pedido dejó de esperar: si justo se le concedió el turno, lo conserva."""
+        with self._lock:
+            if espera.concedido:
+                return Permiso(self._epoca, time.monotonic() - inicio)
+            self._cola.remove(espera)
+            return None
+
+    def adquirir_sync(self, deadline: Optional[float] = None, umbral_latencia: Optional[float] = None) -> Permiso:
+        permiso = self._esperar_turno_sync(deadline)
+        permiso.umbral_latencia = umbral_latencia
+        # La espera en cola no es latencia del proveedor (muestras de cobertura y enrutamiento)
+        iniciar_reloj_intento()
+        return permiso
+
+    async def adquirir(self, deadline: Optional[float] = None, umbral_latencia: Optional[float] = None) -> Permiso:
+        permiso = await self._esperar_turno(deadline)
+        permiso.umbral_latencia = umbral_latencia
+        iniciar_reloj_intento()
+        return permiso
+
+    def _esperar_turno_sync(self, deadline: Optional[float] = None) -> Permiso:
+        inicio = time.monotonic()
+        permiso, espera = self._intentar_o_encolar(None)
+        if permiso is not None:
+            return permiso
+        restante = None if deadline is None else max(deadline - time.monotonic(), 0.0)
+        if espera.evento.wait(restante):
+            return self._permiso_concedido(inicio)
+        permiso = self._abandonar(espera, inicio)
+        if permiso is None:
+            raise LimitadorSaturadoError("Deadline agotado esperando turno para llamar al LLM")
+        return permiso
+
+    async def _esperar_turno(self, deadline: Optional[float] = None) -> Permiso:
+        inicio = time.monotonic()
+        permiso, espera = self._intentar_o_encolar(asyncio.get_running_loop())
+        if permiso is not None:
+            return permiso
+        restante = None if deadline is None else max(deadline - time.monotonic(), 0.0)
+        try:
+            async with asyncio.timeout(restante):
+                await espera.futuro
+            return self._permiso_concedido(inicio)
+        except (TimeoutError, asyncio.CancelledError) as e:
+            permiso = self._abandonar(espera, inicio)
+            if isinstance(e, asyncio.CancelledError):
+                if permiso is not None:
+                    self.liberar(permiso, ajustar=False)
+                raise
+            if permiso is None:
+                raise LimitadorSaturadoError("Deadline agotado esperando turno para llamar al LLM") from e
+            return permiso
+
+    def _permiso_concedido(self, inicio: float) -> Permiso:
+        espera = time.monotonic() - inicio
+        with self._lock:
+            # _conceder ya contó el lugar al despertar; aquí solo se mide la espera real
+            self.espera_total += espera
+            self.espera_maxima = max(self.espera_maxima, espera)
+            self._esperas_recientes.append(espera)
+            return Permiso(self._epoca, espera)
+
+    # --- Liberación y ajuste AIMD ---
+
+    def liberar(self, permiso: Permiso, error: Optional[BaseException] = None, ajustar: bool = True):
+        """Devolver el lugar y ajustar el límite según el resultado de la llamada.
+
+        ajustar=False (llamada cancelada) solo devuelve el lugar: ni aumento ni reducción.
+        """
+        latencia = time.monotonic() - permiso.inicio
+        umbral = permiso.umbral_latencia or self.umbral_latencia
+        sobrecarga = (error is not None and es_reintentable(error)) or latencia > umbral
+        with self._lock:
+            self.en_curso -= 1
+            if not ajustar:
+                self.cancelados += 1
+            elif sobrecarga:
+                # Una sola reducción por "época": las llamadas que empezaron antes no vuelven a reducir
+                if permiso.epoca == self._epoca:
+                    self.limite = max(self.minimo, self.limite * self.factor_reduccion)
+                    self._epoca += 1
+                    self.reducciones += 1
+            elif error is None:
+                if self.limite < self.maximo:
+                    self.limite = min(self.maximo, self.limite + 1.0 / self.limite)
+                    self.aumentos += 1
+            self._despertar_siguientes()
+
+    def _despertar_siguientes(self):
+        """Con el lock tomado: pasar los lugares libres a los primeros de la cola."""
+        while self._cola and self.en_curso < int(self.limite):
+            espera = self._cola.popleft()
+            espera.concedido = True
+            self.en_curso += 1
+            self.concedidos += 1
+            espera.despertar()
+
+    def _liberar_por_excepcion(self, permiso: Permiso, error: BaseException):
+        # CancelledError/GeneratorExit no son Exception; TareaCanceladaError es la cancelación de los hilos
+        if isinstance(error, Exception) and not isinstance(error, TareaCanceladaError):
+            self.liberar(permiso, error)
+        else:
+            self.liberar(permiso, ajustar=False)
+
+    @contextmanager
+    def permiso_sync(self, deadline: Optional[float] = None, umbral_latencia: Optional[float] = None):
+        permiso = self.adquirir_sync(deadline, umbral_latencia)
+        try:
+            yield permiso
+        except BaseException as e:
+            self._liberar_por_excepcion(permiso, e)
+            raise
+        self.liberar(permiso)
+
+    @asynccontextmanager
+    async def permiso(self, deadline: Optional[float] = None, umbral_latencia: Optional[float] = None):
+        permiso = await self.adquirir(deadline, umbral_latencia)
+        try:
+            yield permiso
+        except BaseException as e:
+            self._liberar_por_excepcion(permiso, e)
+            raise
+        self.liberar(permiso)
+
+    # --- Métricas ---
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            esperas = sorted(self._esperas_recientes)
+            p95 = esperas[min(int(0.95 * len(esperas)), len(esperas) - 1)] if esperas else 0.0
+            return {
+                "class": self.clase,
+                "limit": int(self.limite),
+                "limit_exact": round(self.limite, 2),
+                "min": self.minimo,
+                "max": self.maximo,
+                "in_flight": self.en_curso,
+                "queue_depth": len(self._cola),
+                "queue_max": self.max_cola,
+                "granted": self.concedidos,
+                "queued": self.encolados,
+                "rejected": self.rechazados,
+                "increases": self.aumentos,
+                "decreases": self.reducciones,
+                "cancelled": self.cancelados,
+                "wait_avg_seconds": round(self.espera_total / self.concedidos, 4) if self.concedidos else 0.0,
+                "wait_p95_seconds": round(p95, 4),
+                "wait_max_seconds": round(self.espera_maxima, 4),
+            }
+
+
+_limitadores: Dict[str, LimitadorAdaptativo] = {}
+_limitador_lock = threading.Lock()
+
+
+def get_limitador(clase: Optional[str] = None) -> LimitadorAdaptativo:
+    """Limitador global de una clase de prioridad (por defecto, la del contexto actual).
+
+    LLM_CONCURRENCY_ENABLED=false devuelve limitadores sin tope efectivo.
+    """
+    clase = clase or clase_actual()
+    with _limitador_lock:
+        limitador = _limitadores.get(clase)
+        if limitador is None:
+            if os.getenv("LLM_CONCURRENCY_ENABLED", "true").lower() == "true":
+                limitador = LimitadorAdaptativo(clase=clase)
+            else:
+                limitador = LimitadorAdaptativo(inicial=10**6, minimo=10**6, maximo=10**6, clase=clase)
+            _limitadores[clase] = limitador
+        return limitador
+
+
+def get_limiter_stats() -> Dict[str, Any]:
+    return {clase: get_limitador(clase).stats() for clase in CLASES}
+
+
+def reset_limitador():
+    """Descartar los limitadores globales (tests o cambio de configuración)."""
+    with _limitador_lock:
+        _limitadores.clear()
@@ -0,0 +1,231 @@
+"""
+Cliente HTTP compartido para los proveedores LLM compatibles con OpenAI (Baseten).
+- Un único cliente por (base_url, api_key) para todo el proceso (sync)
+- Un cliente async por (base_url, api_key) y event loop, para llamadas nativas asyncio
+- Keep-alive, HTTP/2 si `h2` está instalado, límites de pool y timeouts configurables
+- Estadísticas del pool expuestas para dimensionarlo (/metrics)
+- Los reintentos del SDK están desactivados: los gestiona resiliencia.py
+"""
+
+import os
+import asyncio
+import weakref
+import threading
+import importlib.util
+from typing import Dict, Any, Optional, Tuple, Union
+
+import httpx
+from openai import OpenAI, AsyncOpenAI
+
+DEFAULT_BASETEN_BASE_URL = "https://inference.baseten.co/v1"
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def get_baseten_base_url() -> str:
+    """URL base de Baseten (sobrescribible con BASETEN_BASE_URL, p.ej. para tests)."""
+    return os.getenv("BASETEN_BASE_URL", DEFAULT_BASETEN_BASE_URL)
+
+
+def http2_available() -> bool:
+    """HTTP/2 solo se activa si el paquete `h2` está instalado y no se deshabilitó por env."""
+    if os.getenv("LLM_HTTP2", "auto").lower() in ("0", "false", "no"):
+        return False
+    return importlib.util.find_spec("h2") is not None
+
+
+class PoolConfig:
+    """Configuración del pool de conexiones leída de variables de entorno."""
+
+    def __init__(self):
+        self.max_connections = _env_int("LLM_POOL_MAX_CONNECTIONS", 50)
+        self.max_keepalive_connections = _env_int("LLM_POOL_MAX_KEEPALIVE", 20)
+        self.keepalive_expiry = _env_float("LLM_POOL_KEEPALIVE_EXPIRY", 120.0)
+        self.connect_timeout = _env_float("LLM_CONNECT_TIMEOUT", 10.0)
+        # Las narrativas de Kimi-K2.5 tardan ~120s: el timeout de lectura por defecto debe cubrirlas
+        self.request_timeout = _env_float("LLM_REQUEST_TIMEOUT", 300.0)
+        self.http2 = http2_available()
+
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    def timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(self.request_timeout, connect=self.connect_timeout)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "max_connections": self.max_connections,
+            "max_keepalive_connections": self.max_keepalive_connections,
+            "keepalive_expiry": self.keepalive_expiry,
+            "connect_timeout": self.connect_timeout,
+            "request_timeout": self.request_timeout,
+            "http2": self.http2,
+        }
+
+
+class SharedClientRegistry:
+    """
+    Registro de clientes OpenAI de larga vida, uno por (base_url, api_key).
+    httpx.Client es thread-safe, así que el mismo cliente se comparte entre
+    llm_rewriter, Settings.llm y los hilos de consultas RAG.
+
+    Los clientes async quedan ligados al event loop que los creó, por eso se
+    guardan por loop (uvicorn usa un único loop por worker).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients: Dict[Tuple[str, str], OpenAI] = {}
+        self._http_clients: Dict[Tuple[str, str], httpx.Client] = {}
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._config: Optional[PoolConfig] = None
+
+    @property
+    def config(self) -> PoolConfig:
+        if self._config is None:
+            self._config = PoolConfig()
+        return self._config
+
+    def get_client(self, api_key: str, base_url: Optional[str] = None) -> OpenAI:
+        """Obtener (o crear la primera vez) el cliente compartido para un endpoint."""
+        base_url = base_url or get_baseten_base_url()
+        key = (base_url, api_key)
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                config = self.config
+                http_client = httpx.Client(
+                    limits=config.limits(),
+                    timeout=config.timeout(),
+                    http2=config.http2,
+                )
+                client = OpenAI(
+                    api_key=api_key,
+                    base_url=base_url,
+                    http_client=http_client,
+                    timeout=config.timeout(),
+                    max_retries=0,
+                )
+                self._http_clients[key] = http_client
+                self._clients[key] = client
+                print(f"🔌 Cliente LLM compartido creado para {base_url} (HTTP/2: {'sí' if config.http2 else 'no'})")
+        return client
+
+    def get_async_client(self, api_key: str, base_url: Optional[str] = None) -> AsyncOpenAI:
+        """Obtener el cliente async compartido para el event loop en ejecución."""
+        base_url = base_url or get_baseten_base_url()
+        key = (base_url, api_key)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            clients = self._async_clients.setdefault(loop, {})
+            entry = clients.get(key)
+            if entry is None:
+                config = self.config
+                http_client = httpx.AsyncClient(
+                    limits=config.limits(),
+                    timeout=config.timeout(),
+                    http2=config.http2,
+                )
+                client = AsyncOpenAI(
+                    api_key=api_key,
+                    base_url=base_url,
+                    http_client=http_client,
+                    timeout=config.timeout(),
+                    max_retries=0,
+                )
+                entry = (client, http_client)
+                clients[key] = entry
+                print(f"🔌 Cliente LLM async compartido creado para {base_url}")
+        return entry[0]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Estadísticas de cada pool: conexiones abiertas, ociosas, activas y peticiones en espera."""
+        pools = []
+        with self._lock:
+            items = list(self._http_clients.items())
+            async_items = [
+                (key, entry[1])
+                for clients in list(self._async_clients.values())
+                for key, entry in clients.items()
+            ]
+        for (base_url, _), http_client in items:
+            pools.append({"base_url": base_url, "async": False, **_pool_stats(http_client)})
+        for (base_url, _), http_client in async_items:
+            pools.append({"base_url": base_url, "async": True, **_pool_stats(http_client)})
+        return {"config": self.config.as_dict(), "pools": pools}
+
+    async def aclose_all(self):
+        """Cerrar los clientes async del loop actual y luego los sync."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            clients = self._async_clients.pop(loop, {})
+        for _, http_client in clients.values():
+            await http_client.aclose()
+        self.close_all()
+
+    def close_all(self):
+        """Cerrar todos los clientes sync y olvidar los async (apagado del servidor o tests)."""
+        with self._lock:
+            for http_client in self._http_clients.values():
+                http_client.close()
+            self._http_clients.clear()
+            self._clients.clear()
+            self._async_clients = weakref.WeakKeyDictionary()
+            self._config = None
+
+
+def _pool_stats(http_client: Union[httpx.Client, httpx.AsyncClient]) -> Dict[str, Any]:
+    """Leer el estado del pool de httpcore subyacente (defensivo ante cambios de API)."""
+    pool = getattr(getattr(http_client, "_transport", None), "_pool", None)
+    connections = list(getattr(pool, "connections", []) or [])
+    idle = sum(1 for c in connections if c.is_idle())
+    http2 = 0
+    for c in connections:
+        info = c.info() if hasattr(c, "info") else ""
+        if "HTTP/2" in info:
+            http2 += 1
+    requests = list(getattr(pool, "_requests", []) or [])
+    queued = sum(1 for r in requests if getattr(r, "connection", None) is None)
+    return {
+        "connections": len(connections),
+        "idle": idle,
+        "active": len(connections) - idle,
+        "http2_connections": http2,
+        "in_flight_requests": len(requests) - queued,
+        "queued_requests": queued,
+    }
+
+
+# Registro global del proceso
+shared_clients = SharedClientRegistry()
+
+
+def get_shared_client(api_key: str, base_url: Optional[str] = None) -> OpenAI:
+    return shared_clients.get_client(api_key, base_url)
+
+
+def get_shared_async_client(api_key: str, base_url: Optional[str] = None) -> AsyncOpenAI:
+    return shared_clients.get_async_client(api_key, base_url)
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    return shared_clients.get_stats()
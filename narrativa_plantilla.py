@@ -0,0 +1,145 @@
+"""
+Narrativa determinista por plantillas (modo_narrativa="plantilla"): cero llamadas al LLM.
+- Mismo orden de secciones que la narrativa por secciones (narrativa_secciones.py)
+- Frase de apertura por sección, elegida de forma determinista según el contenido de la carta
+- Cada ítem abre con el dato técnico en negrita, como las narrativas del LLM
+- Concordancia de género sobre los textos fuente (redactados en masculino genérico)
+- La profundidad recorta cada texto a sus primeras oraciones (breve / estandar)
+
+Sirve para vistas previas instantáneas, para descargar carga cuando Baseten está degradado
+y para usuarios del plan gratuito. Tarda milisegundos.
+"""
+
+import re
+import hashlib
+from typing import Any, Dict, List, Optional
+
+from narrativa_secciones import agrupar_en_secciones
+
+# Aperturas por sección (se elige una por carta, siempre la misma para la misma carta)
+APERTURAS_SECCION: Dict[str, List[str]] = {
+    "luminares": [
+        "Empecemos por lo esencial: tus luminares y tu Ascendente muestran quién eres y cómo te presentas ante el mundo.",
+        "El Sol, la Luna y el Ascendente son los actores principales de tu carta; desde ellos se entiende todo lo demás.",
+    ],
+    "planetas": [
+        "Los demás planetas son promesas que cumplen una función psíquica; veamos cómo se expresan en tus signos.",
+        "Cada planeta aporta un actor a tu historia, y el signo en el que está describe su manera de actuar.",
+    ],
+    "casas": [
+        "Las casas son los escenarios donde esos actores se manifiestan en tu vida cotidiana.",
+        "Ahora pasemos a los escenarios: las casas muestran en qué áreas de tu vida se juega cada promesa.",
+    ],
+    "aspectos": [
+        "Los aspectos cuentan cómo dialogan tus planetas entre sí, a veces en armonía y a veces a través de sus polaridades.",
+        "Los aspectos muestran los encuentros y tensiones entre tus planetas, un camino de aprendizaje a través de los opuestos.",
+    ],
+    "contactos_draconicos": [
+        "Los contactos entre tu carta dracónica y tu carta trópica muestran cómo lo que traes se encuentra con lo que vienes a desarrollar.",
+        "Por último, los contactos dracónicos señalan dónde tu nivel más profundo toca tu vida presente.",
+    ],
+}
+
+APERTURA_DRACONICA = "Tu carta dracónica describe un nivel lunar que pulsa bajo la trópica: tu esencia más profunda y lo que traes de antes."
+
+# Cantidad de oraciones que se conservan de cada texto fuente (None = texto completo)
+ORACIONES_CONSERVADAS = {"breve": 2, "estandar": 4, "profunda": None}
+
+# Concordancia: adjetivos y participios en masculino genérico que siguen a estos verbos
+_VERBOS_COPULATIVOS = (
+    r"eres|estás|seas|estés|ser|estar|te sientes|sentirte|te sientas|te vuelves|volverte|"
+    r"te muestras|mostrarte|te consideras|te ves|verte|quedas|quedar|te quedas"
+)
+_INTENSIFICADORES = r"(?:muy|más|menos|tan|bastante|algo|un poco|sumamente|realmente|bien)\s+"
+_SUFIJOS_ADJETIVO = ("ado", "ido", "ído", "oso", "ivo", "ico", "ero", "ario", "ento", "ísimo")
+_ADJETIVOS = {
+    "bueno", "seguro", "cómodo", "incómodo", "listo", "tranquilo", "lleno", "duro", "cauto", "justo",
+    "único", "inquieto", "contento", "honesto", "abierto", "dispuesto", "propenso", "intenso",
+    "atento", "ingenuo", "nuevo", "solo", "sincero", "directo", "perfecto", "exacto", "correcto",
+}
+_NO_ADJETIVOS = {"demasiado", "cuidado", "pasado", "tanto", "mucho", "poco", "todo", "centro", "momento", "mismo"}
+_PATRON_CONCORDANCIA = re.compile(
+    rf"\b(?P<verbo>{_VERBOS_COPULATIVOS})\s+(?P<intensificador>(?:{_INTENSIFICADORES})?)"
+    rf"(?P<adjetivos>[a-záéíóúñ]+(?:(?:,\s+|\s+y\s+|\s+e\s+)(?:{_INTENSIFICADORES})?[a-záéíóúñ]+)*)",
+    re.IGNORECASE,
+)
+# Adjetivos invariables ('optimista', 'leal', 'capaz', 'independiente'): no cambian pero la enumeración sigue
+_TERMINACIONES_INVARIABLES = ("ista", "e", "l", "z", "r")
+
+
+def _es_adjetivo_masculino(palabra: str) -> bool:
+    palabra = palabra.lower()
+    if palabra in _NO_ADJETIVOS or not palabra.endswith("o"):
+        return False
+    return palabra in _ADJETIVOS or palabra.endswith(_SUFIJOS_ADJETIVO)
+
+
+def _feminizar_adjetivos(match: re.Match) -> str:
+    """Pasar a femenino los adjetivos de la enumeración; se detiene en la primera palabra que no es adjetivo."""
+    partes = re.split(r"(,\s+|\s+y\s+|\s+e\s+)", match.group("adjetivos"))
+    resultado = []
+    for n, parte in enumerate(partes):
+        if n % 2 == 1:
+            resultado.append(parte)
+            continue
+        palabras = parte.split()
+        if palabras and _es_adjetivo_masculino(palabras[-1]):
+            palabras[-1] = palabras[-1][:-1] + "a"
+            resultado.append(" ".join(palabras))
+        elif palabras and palabras[-1].lower().endswith(_TERMINACIONES_INVARIABLES):
+            resultado.append(parte)
+        else:
+            # La enumeración terminó: el resto se deja como estaba
+            resultado.append("".join(partes[n:]))
+            break
+    return f"{match.group('verbo')} {match.group('intensificador')}{''.join(resultado)}"
+
+
+def concordar_genero(texto: str, genero: str) -> str:
+    """Concordancia de género gramatical para la segunda persona ('eres generoso' → 'eres generosa')."""
+    if (genero or "").lower() != "femenino":
+        return texto
+    return _PATRON_CONCORDANCIA.sub(_feminizar_adjetivos, texto)
+
+
+def recortar_oraciones(texto: str, cantidad: Optional[int] = None) -> str:
+    """Primeras `cantidad` oraciones del texto (todas si cantidad es None)."""
+    texto = texto.strip()
+    if cantidad is None:
+        return texto
+    oraciones = re.split(r"(?<=[.!?])\s+(?=[¿¡A-ZÁÉÍÓÚÑ])", texto)
+    return " ".join(oraciones[:cantidad])
+
+
+def _dato_tecnico(titulo: str) -> str:
+    """'Sol en Capricornio' → 'Tu Sol en Capricornio' (las casas no llevan posesivo)."""
+    titulo = titulo.strip()
+    if not titulo or titulo.lower().startswith(("tu ", "casa")):
+        return titulo
+    return f"Tu {titulo}"
+
+
+def _elegir(opciones: List[str], semilla: str) -> str:
+    indice = int(hashlib.sha256(semilla.encode("utf-8")).hexdigest(), 16) % len(opciones)
+    return opciones[indice]
+
+
+def generar_narrativa_plantilla(interpretaciones: List[Dict[str, Any]], genero: str,
+                                tipo_carta: str = "tropical", profundidad: str = "profunda") -> str:
+    """Narrativa en segunda persona armada solo con los textos fuente de los ítems."""
+    secciones = agrupar_en_secciones(interpretaciones)
+    semilla = "|".join(sorted(str(item.get("titulo", "")) for item in interpretaciones))
+    oraciones = ORACIONES_CONSERVADAS.get(profundidad)
+
+    bloques: List[str] = []
+    if (tipo_carta or "").lower() == "draco":
+        bloques.append(APERTURA_DRACONICA)
+    for clave, _, items in secciones:
+        bloques.append(_elegir(APERTURAS_SECCION[clave], f"{semilla}|{clave}"))
+        for item in items:
+            texto = concordar_genero(recortar_oraciones(item.get("interpretacion", ""), oraciones), genero)
+            if not texto:
+                continue
+            dato = _dato_tecnico(str(item.get("titulo", "")))
+            bloques.append(f"**{dato}.** {texto}" if dato else texto)
+    return "\n\n".join(bloques)
@@ -0,0 +1,67 @@
+"""
+Agrupación de interpretaciones individuales en secciones coherentes del informe.
+Se usa para generar la narrativa por secciones en paralelo (modo_narrativa="secciones").
+"""
+
+import unicodedata
+from typing import Dict, List, Any, Tuple
+
+# Orden de las secciones en el informe final
+SECCIONES: List[Tuple[str, str]] = [
+    ("luminares", "Luminares y Ascendente"),
+    ("planetas", "Planetas en signos"),
+    ("casas", "Casas"),
+    ("aspectos", "Aspectos"),
+    ("contactos_draconicos", "Contactos dracónicos"),
+]
+
+LUMINARES = {"sol", "luna", "ascendente"}
+
+
+def _sin_acentos(texto: str) -> str:
+    return ''.join(c for c in unicodedata.normalize('NFD', texto) if unicodedata.category(c) != 'Mn')
+
+
+def _sujeto(item: Dict[str, Any]) -> str:
+    """Primer actor del ítem ('sol', 'luna', 'ascendente', 'marte'...) en minúsculas y sin acentos."""
+    sujeto = item.get("planeta") or item.get("angulo") or item.get("planeta_draconico") or ""
+    if not sujeto:
+        titulo = item.get("titulo", "").strip()
+        if titulo.lower().startswith("tu "):
+            titulo = titulo[3:]
+        sujeto = titulo.split(" ")[0] if titulo else ""
+    return _sin_acentos(sujeto.lower())
+
+
+def clasificar_item(item: Dict[str, Any]) -> str:
+    """Devolver la clave de sección de un ítem (tropical JSON, dracónico JSON o RAG)."""
+    tipo = str(item.get("tipo", ""))
+
+    # Dracónica JSON: tipo = "Draconica ['draconica', 'planeta'|'casa'|'contacto', ...]"
+    if tipo.startswith("Draconica"):
+        if "'contacto'" in tipo:
+            return "contactos_draconicos"
+        if "'casa'" in tipo:
+            return "casas"
+        return "luminares" if _sujeto(item) in LUMINARES else "planetas"
+
+    if tipo == "AspectoCruzado":
+        return "contactos_draconicos"
+    if tipo in ("PlanetaEnCasa", "CasaEnSigno", "CuspideCruzada"):
+        return "casas"
+    if tipo in ("Aspecto", "AspectoComplejo"):
+        return "aspectos"
+    if tipo == "AnguloEnSigno" or _sujeto(item) in LUMINARES:
+        return "luminares"
+    return "planetas"
+
+
+def agrupar_en_secciones(interpretaciones: List[Dict[str, Any]]) -> List[Tuple[str, str, List[Dict[str, Any]]]]:
+    """
+    Agrupar ítems por sección respetando el orden de SECCIONES y el orden original dentro de cada una.
+    Devuelve solo secciones no vacías: [(clave, nombre, items), ...]
+    """
+    grupos: Dict[str, List[Dict[str, Any]]] = {clave: [] for clave, _ in SECCIONES}
+    for item in interpretaciones:
+        grupos[clasificar_item(item)].append(item)
+    return [(clave, nombre, grupos[clave]) for clave, nombre in SECCIONES if grupos[clave]]
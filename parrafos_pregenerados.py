@@ -0,0 +1,242 @@
+"""
+Pre-generación offline de los párrafos re-escritos para todo el vocabulario natal.
+
+- Vocabulario: cada clave de data/natal_map.json (tropical) y data/draco.json (dracónica)
+- Un párrafo por (texto fuente, género, tipo de carta), con el mismo prompt que el modo "parrafos"
+- Concurrencia acotada y reanudable: el progreso se agrega a <salida>.parcial.jsonl
+- Artefacto final compacto (JSON gzip) versionado por formato, versión de prompts (hash_prompts) y modelo;
+  el servicio lo carga al arrancar y el modo "pregenerada" arma informes con 0-1 llamadas al LLM
+
+Uso:
+    python parrafos_pregenerados.py --salida data/parrafos_pregenerados.json.gz --concurrencia 8
+"""
+
+import os
+import sys
+import gzip
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+from pathlib import Path
+from typing import Dict, List, Any, Optional
+
+from cache_narrativas import hash_prompts
+from planificador import con_prioridad, PREFETCH
+
+ARTIFACT_VERSION = 1
+DATA_DIR = Path(__file__).parent / "data"
+DEFAULT_ARTIFACT_PATH = str(DATA_DIR / "parrafos_pregenerados.json.gz")
+GENEROS = ("femenino", "masculino")
+
+
+def clave_pregenerada(texto: str, genero: str, tipo_carta: str) -> str:
+    """Clave compacta de un párrafo: texto fuente + género + tipo de carta."""
+    payload = json.dumps([(tipo_carta or "").lower(), (genero or "").lower(), texto], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:24]
+
+
+def cargar_vocabulario(data_dir: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Ítems del vocabulario completo: [{tipo_carta, clave_mapa, titulo, interpretacion}, ...]."""
+    data_dir = Path(data_dir) if data_dir else DATA_DIR
+    vocabulario = []
+    with open(data_dir / "natal_map.json", encoding="utf-8") as f:
+        for clave, valor in json.load(f).items():
+            texto = valor.get("texto", "") if isinstance(valor, dict) else str(valor)
+            titulo = valor.get("titulo", clave) if isinstance(valor, dict) else clave
+            if texto:
+                vocabulario.append({"tipo_carta": "tropical", "clave_mapa": clave, "titulo": titulo, "interpretacion": texto})
+    with open(data_dir / "draco.json", encoding="utf-8") as f:
+        for clave, texto in json.load(f).items():
+            if texto:
+                vocabulario.append({"tipo_carta": "draco", "clave_mapa": clave,
+                                    "titulo": clave.replace("_", " "), "interpretacion": texto})
+    return vocabulario
+
+
+class ParrafosPregenerados:
+    """Artefacto de párrafos pre-generados cargado en memoria (lectura O(1) por clave)."""
+
+    def __init__(self, parrafos: Dict[str, str], prompt_version: str, modelo: str, generado: Optional[float] = None):
+        self.parrafos = parrafos
+        self.prompt_version = prompt_version
+        self.modelo = modelo
+        self.generado = generado
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def cargar(cls, path: str, prompt_version: Optional[str] = None, modelo: Optional[str] = None) -> Optional["ParrafosPregenerados"]:
+        """Leer el artefacto; devuelve None si no existe o no corresponde a estos prompts/modelo."""
+        if not os.path.exists(path):
+            return None
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            datos = json.load(f)
+        if datos.get("version") != ARTIFACT_VERSION:
+            print(f"⚠️ Párrafos pre-generados ignorados: formato {datos.get('version')} != {ARTIFACT_VERSION}")
+            return None
+        prompt_version = prompt_version or hash_prompts()
+        if datos.get("prompt_version") != prompt_version or (modelo and datos.get("modelo") != modelo):
+            print("⚠️ Párrafos pre-generados ignorados: generados con otros prompts o con otro modelo")
+            return None
+        return cls(datos["parrafos"], datos["prompt_version"], datos["modelo"], datos.get("generado"))
+
+    def guardar(self, path: str):
+        """Escritura atómica del artefacto (archivo temporal + rename)."""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        temporal = f"{path}.tmp"
+        with gzip.open(temporal, "wt", encoding="utf-8") as f:
+            json.dump({
+                "version": ARTIFACT_VERSION,
+                "prompt_version": self.prompt_version,
+                "modelo": self.modelo,
+                "generado": self.generado or time.time(),
+                "parrafos": self.parrafos,
+            }, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(temporal, path)
+
+    def get(self, texto: str, genero: str, tipo_carta: str) -> Optional[str]:
+        parrafo = self.parrafos.get(clave_pregenerada(texto, genero, tipo_carta))
+        if parrafo is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return parrafo
+
+    def __len__(self) -> int:
+        return len(self.parrafos)
+
+    def stats(self) -> Dict[str, Any]:
+        consultas = self.hits + self.misses
+        return {
+            "entries": len(self.parrafos),
+            "prompt_version": self.prompt_version,
+            "model": self.modelo,
+            "generated_at": self.generado,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / consultas, 3) if consultas else 0.0,
+        }
+
+
+def _leer_progreso(path_parcial: str, prompt_version: str, modelo: str) -> Dict[str, str]:
+    """Párrafos ya generados por una corrida anterior interrumpida (misma versión de prompts y modelo)."""
+    hechos: Dict[str, str] = {}
+    if not os.path.exists(path_parcial):
+        return hechos
+    with open(path_parcial, encoding="utf-8") as f:
+        cabecera = f.readline()
+        try:
+            cabecera = json.loads(cabecera)
+        except json.JSONDecodeError:
+            return hechos
+        if cabecera.get("prompt_version") != prompt_version or cabecera.get("modelo") != modelo:
+            print("🧹 Progreso previo descartado (prompts o modelo distintos)")
+            return hechos
+        for linea in f:
+            try:
+                registro = json.loads(linea)
+            except json.JSONDecodeError:
+                continue  # última línea cortada por la interrupción
+            hechos[registro["clave"]] = registro["parrafo"]
+    return hechos
+
+
+def _termina_en_salto(path: str) -> bool:
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() == 0:
+            return True
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+async def pregenerar(interpretador, salida: str = DEFAULT_ARTIFACT_PATH,
+                     vocabulario: Optional[List[Dict[str, Any]]] = None,
+                     generos=GENEROS, concurrencia: int = 8) -> Dict[str, Any]:
+    """
+    Generar los párrafos que falten y escribir el artefacto.
+
+    Reutiliza InterpretadorRAG._reescribir_parrafo (mismo prompt y límites que en tiempo real).
+    Los fallos no detienen la corrida: quedan pendientes y una nueva ejecución los reintenta.
+    """
+    inicio = time.time()
+    vocabulario = vocabulario if vocabulario is not None else cargar_vocabulario()
+    modelo = interpretador.llm_rewriter.model
+    prompt_version = hash_prompts()
+    path_parcial = f"{salida}.parcial.jsonl"
+
+    trabajos: Dict[str, Any] = {}
+    for item in vocabulario:
+        for genero in generos:
+            clave = clave_pregenerada(item["interpretacion"], genero, item["tipo_carta"])
+            trabajos.setdefault(clave, (item, genero))
+
+    hechos = _leer_progreso(path_parcial, prompt_version, modelo)
+    pendientes = [clave for clave in trabajos if clave not in hechos]
+    print(f"📚 Vocabulario: {len(trabajos)} párrafos ({len(hechos)} ya generados, {len(pendientes)} pendientes)")
+
+    Path(salida).parent.mkdir(parents=True, exist_ok=True)
+    if not hechos:
+        with open(path_parcial, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"prompt_version": prompt_version, "modelo": modelo}) + "\n")
+
+    semaforo = asyncio.Semaphore(concurrencia)
+    errores: List[str] = []
+
+    with open(path_parcial, "a", encoding="utf-8") as progreso:
+        if hechos and not _termina_en_salto(path_parcial):
+            progreso.write("\n")  # no pegar registros nuevos a una línea cortada
+        async def generar(clave: str):
+            item, genero = trabajos[clave]
+            async with semaforo:
+                try:
+                    parrafo = await interpretador._reescribir_parrafo(item, genero, item["tipo_carta"])
+                except Exception as e:
+                    errores.append(f"{item['clave_mapa']} ({genero}): {e}")
+                    return
+            hechos[clave] = parrafo
+            progreso.write(json.dumps({"clave": clave, "parrafo": parrafo}, ensure_ascii=False) + "\n")
+            progreso.flush()
+
+        # Clase de fondo: usa su propio presupuesto de LLM y no compite con los pedidos interactivos
+        with con_prioridad(PREFETCH):
+            await asyncio.gather(*[generar(clave) for clave in pendientes])
+
+    artefacto = ParrafosPregenerados({clave: hechos[clave] for clave in trabajos if clave in hechos}, prompt_version, modelo)
+    artefacto.guardar(salida)
+    if not errores:
+        os.remove(path_parcial)
+
+    resumen = {
+        "total": len(trabajos),
+        "generados": len(pendientes) - len(errores),
+        "reanudados": len(trabajos) - len(pendientes),
+        "errores": len(errores),
+        "salida": salida,
+        "tiempo": round(time.time() - inicio, 2),
+    }
+    print(f"✅ Párrafos pre-generados: {resumen}")
+    for error in errores[:10]:
+        print(f"   ❌ {error}")
+    return resumen
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Pre-generar los párrafos re-escritos de todo el vocabulario natal")
+    parser.add_argument("--salida", default=os.getenv("PREGENERATED_PARAGRAPHS_PATH", DEFAULT_ARTIFACT_PATH))
+    parser.add_argument("--concurrencia", type=int, default=8)
+    parser.add_argument("--tipo", choices=["tropical", "draco"], help="Limitar a un tipo de carta")
+    args = parser.parse_args(argv)
+
+    from interpretador_refactored import InterpretadorRAG
+
+    interpretador = InterpretadorRAG()
+    vocabulario = [item for item in cargar_vocabulario() if not args.tipo or item["tipo_carta"] == args.tipo]
+    resumen = asyncio.run(pregenerar(interpretador, args.salida, vocabulario, concurrencia=args.concurrencia))
+    return 1 if resumen["errores"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+"""
+Planificación por clases de prioridad entre calendario, carta natal y tareas de fondo.
+- calendario: búsquedas de /interpretar-eventos (JSON y RAG de un solo resultado), baja latencia
+- natal: /interpretar y sus variantes (RAG de la carta + narrativa de minutos)
+- prefetch: trabajo de fondo (pre-generación de párrafos) que nunca debe quitarle lugar al resto
+
+Cada clase tiene su propio pool de hilos (trabajo bloqueante) y su propio presupuesto de
+concurrencia hacia el LLM (limitador.py), así una narrativa de 16k tokens no retiene lugares
+que necesita una consulta de calendario. La clase viaja en un ContextVar.
+
+Cancelación: si la corutina que espera una tarea se cancela (cliente desconectado), la tarea
+que aún no empezó no se ejecuta y la que ya corre recibe una señal que el hilo consulta
+entre pasos (cancelacion_solicitada) para no seguir llamando al LLM para nadie.
+"""
+
+import os
+import asyncio
+import threading
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+CALENDARIO = "calendario"
+NATAL = "natal"
+PREFETCH = "prefetch"
+CLASES = (CALENDARIO, NATAL, PREFETCH)
+
+# Hilos por clase para trabajo bloqueante (consultas RAG de llama-index, búsquedas JSON)
+HILOS_POR_DEFECTO = {CALENDARIO: 8, NATAL: 10, PREFETCH: 2}
+
+_clase_actual: contextvars.ContextVar = contextvars.ContextVar("clase_prioridad", default=NATAL)
+_cancelacion: contextvars.ContextVar = contextvars.ContextVar("cancelacion_tarea", default=None)
+
+
+class TareaCanceladaError(RuntimeError):
+    """Quien esperaba la tarea ya no la necesita: el hilo abandona el trabajo pendiente."""
+
+
+def clase_actual() -> str:
+    """Clase de prioridad del código en ejecución (por defecto: natal)."""
+    return _clase_actual.get()
+
+
+def cancelacion_solicitada() -> bool:
+    """True si la tarea del planificador en la que corre este hilo fue cancelada."""
+    aviso = _cancelacion.get()
+    return aviso is not None and aviso.is_set()
+
+
+def verificar_cancelacion():
+    """Lanzar TareaCanceladaError si la tarea en curso fue cancelada (llamar entre pasos caros)."""
+    if cancelacion_solicitada():
+        raise TareaCanceladaError("Tarea cancelada: nadie espera su resultado")
+
+
+@contextmanager
+def con_prioridad(clase: str):
+    """Ejecutar un bloque (y las tareas async que cree) dentro de una clase de prioridad."""
+    if clase not in CLASES:
+        raise ValueError(f"Clase de prioridad desconocida: {clase}")
+    token = _clase_actual.set(clase)
+    try:
+        yield
+    finally:
+        _clase_actual.reset(token)
+
+
+class Planificador:
+    """Pools de hilos separados por clase; cada tarea corre con su clase en el contexto."""
+
+    def __init__(self, hilos: Optional[Dict[str, int]] = None):
+        self._hilos = {
+            clase: (hilos or {}).get(clase) or int(os.getenv(f"PRIORITY_{clase.upper()}_THREADS", HILOS_POR_DEFECTO[clase]))
+            for clase in CLASES
+        }
+        self._executors: Dict[str, ThreadPoolExecutor] = {}
+        self._lock = threading.Lock()
+        self._enviadas = {clase: 0 for clase in CLASES}
+        self._activas = {clase: 0 for clase in CLASES}
+        self._canceladas_en_cola = {clase: 0 for clase in CLASES}
+        self._canceladas_en_curso = {clase: 0 for clase in CLASES}
+
+    def _executor(self, clase: str) -> ThreadPoolExecutor:
+        with self._lock:
+            executor = self._executors.get(clase)
+            if executor is None:
+                executor = ThreadPoolExecutor(max_workers=self._hilos[clase], thread_name_prefix=f"prioridad-{clase}")
+                self._executors[clase] = executor
+            return executor
+
+    async def ejecutar(self, clase: str, fn: Callable[..., Any], *args) -> Any:
+        """Correr fn(*args) en el pool de la clase, con la clase fijada en el ContextVar del hilo.
+
+        Si esta corutina se cancela, la tarea en cola se descarta y la que ya corre recibe la señal
+        de cancelación (ver cancelacion_solicitada).
+        """
+        if clase not in CLASES:
+            raise ValueError(f"Clase de prioridad desconocida: {clase}")
+        aviso = threading.Event()
+        iniciada = threading.Event()
+        contexto = contextvars.copy_context()
+        contexto.run(_clase_actual.set, clase)
+        contexto.run(_cancelacion.set, aviso)
+
+        def tarea():
+            iniciada.set()
+            with self._lock:
+                self._activas[clase] += 1
+            try:
+                contexto.run(verificar_cancelacion)
+                return contexto.run(fn, *args)
+            finally:
+                with self._lock:
+                    self._activas[clase] -= 1
+
+        with self._lock:
+            self._enviadas[clase] += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor(clase), tarea)
+        except asyncio.CancelledError:
+            # El future del pool ya quedó cancelado: si no había empezado, no empieza nunca
+            aviso.set()
+            with self._lock:
+                if iniciada.is_set():
+                    self._canceladas_en_curso[clase] += 1
+                else:
+                    self._canceladas_en_cola[clase] += 1
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            executors = dict(self._executors)
+            activas = dict(self._activas)
+            enviadas = dict(self._enviadas)
+            en_cola = dict(self._canceladas_en_cola)
+            en_curso = dict(self._canceladas_en_curso)
+        return {
+            clase: {
+                "threads": self._hilos[clase],
+                "active": activas[clase],
+                "queue_depth": executors[clase]._work_queue.qsize() if clase in executors else 0,
+                "submitted": enviadas[clase],
+                "cancelled_queued": en_cola[clase],
+                "cancelled_running": en_curso[clase],
+            }
+            for clase in CLASES
+        }
+
+    def shutdown(self):
+        with self._lock:
+            for executor in self._executors.values():
+                executor.shutdown(wait=False, cancel_futures=True)
+            self._executors.clear()
+
+
+# Planificador global del proceso
+planificador = Planificador()
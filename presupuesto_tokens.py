@@ -0,0 +1,144 @@
+"""
+Presupuesto de salida adaptativo para la narrativa (en lugar de max_tokens=16000 fijo).
+- Estimador local de tokens (sin red ni tokenizer): caracteres / NARRATIVE_CHARS_PER_TOKEN
+- Contrato de extensión en el prompt según la cantidad y el tipo de ítems (tabla de oraciones en prompts.py)
+- max_tokens = salida prevista × margen, acotado por el tope y por lo que deja libre la ventana de contexto
+- Contabilidad por pedido (ContextVar): tokens previstos vs reales informados por el proveedor
+"""
+
+import math
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from llm_client import _env_float, _env_int
+from resiliencia import ErrorLLM
+from narrativa_secciones import SECCIONES, clasificar_item
+# La tabla de oraciones y la redacción de la regla viven en prompts.py: entran en la versión de las cachés
+from prompts import ORACIONES_POR_PROFUNDIDAD, get_regla_profundidad_str
+
+# Negrita inicial con el dato técnico y separación entre párrafos
+TOKENS_ENCABEZADO_ITEM = 15
+
+
+class ContextoExcedidoError(ErrorLLM):
+    """El prompt no deja lugar suficiente para la respuesta dentro de la ventana de contexto."""
+
+
+def estimar_tokens(texto: str) -> int:
+    """Estimación local de tokens de un texto (español: ~3.5 caracteres por token)."""
+    if not texto:
+        return 0
+    return math.ceil(len(texto) / _env_float("NARRATIVE_CHARS_PER_TOKEN", 3.5))
+
+
+class PresupuestoSalida:
+    """Contrato de extensión y max_tokens de UNA llamada narrativa."""
+
+    def __init__(self, items: List[Dict[str, Any]], profundidad: str = "profunda"):
+        self.cantidad_items = len(items)
+        self.oraciones = ORACIONES_POR_PROFUNDIDAD[profundidad]
+        conteo: Dict[str, int] = {}
+        for item in items:
+            seccion = clasificar_item(item)
+            conteo[seccion] = conteo.get(seccion, 0) + 1
+        self.items_por_seccion = {clave: conteo[clave] for clave, _ in SECCIONES if clave in conteo}
+        tokens_por_oracion = _env_int("NARRATIVE_TOKENS_PER_SENTENCE", 40)
+        oraciones_medias = sum(
+            n * sum(self.oraciones[clave]) / 2 for clave, n in self.items_por_seccion.items()
+        )
+        self.oraciones_previstas = oraciones_medias
+        self.salida_prevista = math.ceil(
+            oraciones_medias * tokens_por_oracion + self.cantidad_items * TOKENS_ENCABEZADO_ITEM
+        )
+        self.entrada_estimada = 0
+        self.max_tokens = 0
+
+    def regla_profundidad(self) -> str:
+        """Línea PROFUNDIDAD del prompt: oraciones por tipo de ítem y extensión total orientativa."""
+        nombres = dict(SECCIONES)
+        rangos = [(nombres[clave], self.oraciones[clave]) for clave in self.items_por_seccion]
+        return get_regla_profundidad_str(rangos, self.cantidad_items, self.oraciones_previstas)
+
+    def ajustar(self, prompt: str, tope: Optional[int] = None) -> "PresupuestoSalida":
+        """Fijar max_tokens para el prompt final: margen sobre lo previsto, sin exceder la ventana de contexto."""
+        self.entrada_estimada = estimar_tokens(prompt)
+        margen = _env_float("NARRATIVE_BUDGET_MARGIN", 1.5)
+        minimo = _env_int("NARRATIVE_MIN_TOKENS", 256)
+        tope = tope or _env_int("NARRATIVE_MAX_TOKENS", 16000)
+        disponible = _env_int("LLM_CONTEXT_WINDOW", 262144) - self.entrada_estimada - _env_int("LLM_CONTEXT_RESERVE", 512)
+        if disponible < minimo:
+            raise ContextoExcedidoError(
+                f"El prompt (~{self.entrada_estimada} tokens) no deja lugar para la respuesta en la ventana de contexto"
+            )
+        self.max_tokens = max(minimo, min(math.ceil(self.salida_prevista * margen), tope, disponible))
+        return self
+
+
+class ContabilidadTokens:
+    """Tokens previstos y reales de todas las llamadas narrativas de un pedido."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.llamadas = 0
+        self.entrada_estimada = 0
+        self.salida_prevista = 0
+        self.max_tokens = 0
+        self.entrada_real: Optional[int] = None
+        self.salida_real: Optional[int] = None
+
+    def registrar(self, presupuesto: PresupuestoSalida, usage: Any = None):
+        with self._lock:
+            self.llamadas += 1
+            self.entrada_estimada += presupuesto.entrada_estimada
+            self.salida_prevista += presupuesto.salida_prevista
+            self.max_tokens += presupuesto.max_tokens
+            if usage is not None:
+                self.entrada_real = (self.entrada_real or 0) + (getattr(usage, "prompt_tokens", 0) or 0)
+                self.salida_real = (self.salida_real or 0) + (getattr(usage, "completion_tokens", 0) or 0)
+
+    def resumen(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "llamadas": self.llamadas,
+                "entrada_estimada": self.entrada_estimada,
+                "entrada_real": self.entrada_real,
+                "salida_prevista": self.salida_prevista,
+                "salida_real": self.salida_real,
+                "max_tokens": self.max_tokens,
+            }
+
+
+_contabilidad: contextvars.ContextVar = contextvars.ContextVar("contabilidad_tokens", default=None)
+
+# Totales del proceso para /metrics
+_totales = ContabilidadTokens()
+
+
+@contextmanager
+def contabilizar_tokens():
+    """Abrir la contabilidad de un pedido; las llamadas con presupuesto hechas dentro se suman a ella."""
+    contabilidad = ContabilidadTokens()
+    token = _contabilidad.set(contabilidad)
+    try:
+        yield contabilidad
+    finally:
+        _contabilidad.reset(token)
+
+
+def registrar_uso(presupuesto: Optional[PresupuestoSalida], usage: Any = None):
+    """Registrar una llamada presupuestada (la llama BasetenLLM con el usage de la respuesta)."""
+    if presupuesto is None:
+        return
+    _totales.registrar(presupuesto, usage)
+    contabilidad = _contabilidad.get()
+    if contabilidad is not None:
+        contabilidad.registrar(presupuesto, usage)
+
+
+def get_token_stats() -> Dict[str, Any]:
+    resumen = _totales.resumen()
+    if resumen["salida_real"] and resumen["salida_prevista"]:
+        resumen["ratio_real_previsto"] = round(resumen["salida_real"] / resumen["salida_prevista"], 3)
+    return resumen
@@ -4,6 +4,8 @@ Centralized Prompts for Astro Interpretador RAG - V3 (Final Polish 2026)
 Optimizado para extensión profunda (Kimi-K2.5), inicio directo y renderizado MD.
 """
 
+from typing import Any, Dict, List, Optional, Tuple
+
 MARIA_STYLE_SNIPPET = (
     "\"Los planetas son promesas que cumplen una función psíquica. "
     "Imagina que los planetas son los actores y las casas son los escenarios donde se manifiestan. "
@@ -23,16 +25,98 @@ MARIA_BLAQUIER_PERSONA = (
     f"- Habla siempre en segunda persona ('tú') y NO firmes el texto."
 )
 
-REGLA_FORMATO_Y_EXTENSION = (
-    "REGLAS DE FORMATO Y PROFUNDIDAD PARA KIMI-K2.5:\n"
-    "- MARKDOWN: Usa negritas (**) ÚNICAMENTE para el dato técnico al inicio de cada párrafo.\n"
-    "- ESTRUCTURA: Sin títulos ni listas. Los párrafos deben fluir de forma narrativa.\n"
-    "- PROFUNDIDAD: Desarrolla cada aspecto con 5 a 7 oraciones extensas.\n"
-    "- COBERTURA TOTAL: Debes incluir una interpretación para CADA UNO de los elementos listados en los datos de entrada. No omitas ninguno. Si hay Nodos, inclúyelos.\n"
-    "- ARRANQUE: La primera frase del reporte debe mencionar el dato técnico (Ej: **Tu Sol en Aries**...) y luego profundizar.\n"
-    "- VALIDACIÓN: NO inventes grados ni minutos si no se proporcionan en el texto original.\n"
-    "- CIERRE: Termina el informe directamente tras el último análisis, sin frases de cierre, invitaciones al foro o despedidas."
-)
+def get_instrucciones_narrativas(genero: str) -> str:
+    """Instrucciones de género gramatical y segunda persona para la narrativa."""
+    if genero.lower() == "femenino":
+        genero_instruccion = "Instrucción adicional: Redacta usando el género gramatical femenino."
+    elif genero.lower() == "masculino":
+        genero_instruccion = "Instrucción adicional: Redacta usando el género gramatical masculino."
+    else:
+        genero_instruccion = ""
+    persona_instruccion = "Instrucción adicional: Dirígete directamente a la persona usando la segunda persona singular (Tú)."
+    return f"{genero_instruccion}\n{persona_instruccion}".strip()
+
+def combinar_interpretaciones_str(interpretaciones: List[Dict[str, Any]]) -> str:
+    """Ítems como bloques '### título' + texto para los datos del prompt."""
+    return "\n\n".join(
+        f"### {item.get('titulo', '')}\n{item.get('interpretacion', '')}" for item in interpretaciones
+    )
+
+REGLA_PROFUNDIDAD = "- PROFUNDIDAD: Desarrolla cada aspecto con 5 a 7 oraciones extensas.\n"
+
+# Niveles del informe: breve (visión general), estandar (extensión media), profunda (lectura principal)
+PROFUNDIDADES = ("breve", "estandar", "profunda")
+
+VARIANTES_PROFUNDIDAD = {
+    "breve": "- REGISTRO: Informe breve de visión general. Ve directo a la idea central de cada elemento, sin ejemplos ni desarrollos.\n",
+    "estandar": "- REGISTRO: Informe de extensión media. Para cada elemento, la idea central y una consecuencia práctica en la vida cotidiana.\n",
+    "profunda": "",
+}
+
+CIERRES_PROFUNDIDAD = {
+    "breve": "Inicia directamente con la visión general",
+    "estandar": "Inicia directamente con el análisis",
+    "profunda": "Inicia directamente con el análisis profundo",
+}
+
+# Contrato de extensión: oraciones (mínimo, máximo) por ítem según la profundidad y la sección del ítem
+ORACIONES_POR_PROFUNDIDAD = {
+    "breve": {
+        "luminares": (1, 2),
+        "planetas": (1, 1),
+        "casas": (1, 1),
+        "aspectos": (1, 1),
+        "contactos_draconicos": (1, 1),
+    },
+    "estandar": {
+        "luminares": (3, 4),
+        "planetas": (2, 3),
+        "casas": (2, 3),
+        "aspectos": (2, 3),
+        "contactos_draconicos": (1, 2),
+    },
+    "profunda": {
+        "luminares": (5, 7),
+        "planetas": (4, 6),
+        "casas": (3, 5),
+        "aspectos": (3, 5),
+        "contactos_draconicos": (3, 4),
+    },
+}
+
+PALABRAS_POR_ORACION = 25
+
+def _rango_oraciones(minimo: int, maximo: int) -> str:
+    if minimo == maximo:
+        return "una sola oración" if minimo == 1 else f"{minimo} oraciones"
+    return f"{minimo} a {maximo} oraciones"
+
+def get_regla_profundidad_str(rangos: List[Tuple[str, Tuple[int, int]]], cantidad_items: int, oraciones_previstas: float) -> str:
+    """Línea PROFUNDIDAD del prompt: rangos = [(nombre de sección, (mín, máx) oraciones)] en orden del informe."""
+    palabras = int(round(oraciones_previstas * PALABRAS_POR_ORACION, -1))
+    if cantidad_items == 1:
+        return f"- PROFUNDIDAD: Desarrolla el elemento con {_rango_oraciones(*rangos[0][1])} (unas {palabras} palabras).\n"
+    partes = [f"{nombre}: {_rango_oraciones(*rango)}" for nombre, rango in rangos]
+    return (
+        f"- PROFUNDIDAD: Desarrolla cada elemento según su tipo ({'; '.join(partes)}). "
+        f"Son {cantidad_items} elementos: la extensión total debe rondar las {palabras} palabras.\n"
+    )
+
+def get_regla_formato_y_extension(regla_profundidad: Optional[str] = None, profundidad: str = "profunda") -> str:
+    """Reglas de formato; regla_profundidad es el contrato de extensión calculado para la carta."""
+    return (
+        "REGLAS DE FORMATO Y PROFUNDIDAD PARA KIMI-K2.5:\n"
+        "- MARKDOWN: Usa negritas (**) ÚNICAMENTE para el dato técnico al inicio de cada párrafo.\n"
+        "- ESTRUCTURA: Sin títulos ni listas. Los párrafos deben fluir de forma narrativa.\n"
+        f"{VARIANTES_PROFUNDIDAD[profundidad]}"
+        f"{regla_profundidad or REGLA_PROFUNDIDAD}"
+        "- COBERTURA TOTAL: Debes incluir una interpretación para CADA UNO de los elementos listados en los datos de entrada. No omitas ninguno. Si hay Nodos, inclúyelos.\n"
+        "- ARRANQUE: La primera frase del reporte debe mencionar el dato técnico (Ej: **Tu Sol en Aries**...) y luego profundizar.\n"
+        "- VALIDACIÓN: NO inventes grados ni minutos si no se proporcionan en el texto original.\n"
+        "- CIERRE: Termina el informe directamente tras el último análisis, sin frases de cierre, invitaciones al foro o despedidas."
+    )
+
+REGLA_FORMATO_Y_EXTENSION = get_regla_formato_y_extension()
 
 def get_rag_extraction_prompt_str() -> str:
     return (
@@ -49,21 +133,53 @@ def get_rag_extraction_prompt_str() -> str:
         "Interpretación Técnica (Cruda y Directa):"
     )
 
-def get_tropical_narrative_prompt_str(instrucciones_adicionales: str, interpretaciones_combinadas: str) -> str:
+def get_tropical_narrative_prompt_str(instrucciones_adicionales: str, interpretaciones_combinadas: str, regla_profundidad: Optional[str] = None, profundidad: str = "profunda") -> str:
     return (
         f"<sistema_instruccion>\n{instrucciones_adicionales}\n{MARIA_BLAQUIER_PERSONA}\n"
         "Eres un astrólogo experto en CARTAS TROPICALES.\n</sistema_instruccion>\n\n"
         f"<datos_rag>\n{interpretaciones_combinadas}\n</datos_rag>\n\n"
-        f"{REGLA_FORMATO_Y_EXTENSION}\n\n"
-        "Informe Narrativo Tropical (Inicia directamente con el análisis profundo):"
+        f"{get_regla_formato_y_extension(regla_profundidad, profundidad)}\n\n"
+        f"Informe Narrativo Tropical ({CIERRES_PROFUNDIDAD[profundidad]}):"
     )
 
-def get_draconian_narrative_prompt_str(instrucciones_adicionales: str, interpretaciones_combinadas: str) -> str:
+def get_draconian_narrative_prompt_str(instrucciones_adicionales: str, interpretaciones_combinadas: str, regla_profundidad: Optional[str] = None, profundidad: str = "profunda") -> str:
     return (
         f"<sistema_instruccion>\n{instrucciones_adicionales}\n{MARIA_BLAQUIER_PERSONA}\n"
         "Eres un astrólogo experto en CARTAS DRACÓNICAS.\n</sistema_instruccion>\n\n"
         "<teoria_draconica>Nivel lunar que pulsa bajo la trópica. Sol=esencia, Luna=emoción primordial, Asc=motivación inconsciente.</teoria_draconica>\n\n"
         f"<datos_rag>\n{interpretaciones_combinadas}\n</datos_rag>\n\n"
-        f"{REGLA_FORMATO_Y_EXTENSION}\n\n"
-        "Informe Narrativo Dracónico (Inicia directamente con el análisis profundo):"
+        f"{get_regla_formato_y_extension(regla_profundidad, profundidad)}\n\n"
+        f"Informe Narrativo Dracónico ({CIERRES_PROFUNDIDAD[profundidad]}):"
+    )
+
+def get_section_narrative_prompt_str(instrucciones_adicionales: str, interpretaciones_combinadas: str, tipo_carta: str, nombre_seccion: str, regla_profundidad: Optional[str] = None, profundidad: str = "profunda") -> str:
+    """Prompt narrativo para UNA sección del informe (mismas reglas de persona y formato)."""
+    regla_seccion = (
+        f"Instrucción adicional: Redacta únicamente la sección '{nombre_seccion}' de un informe más amplio que se ensamblará después. "
+        "No presentes ni resumas el informe completo y no hagas referencia a otras secciones."
+    )
+    instrucciones = f"{instrucciones_adicionales}\n{regla_seccion}".strip()
+    if tipo_carta.lower() == "draco":
+        return get_draconian_narrative_prompt_str(instrucciones, interpretaciones_combinadas, regla_profundidad, profundidad)
+    return get_tropical_narrative_prompt_str(instrucciones, interpretaciones_combinadas, regla_profundidad, profundidad)
+
+def get_paragraph_rewrite_prompt_str(instrucciones_adicionales: str, interpretacion_item: str, tipo_carta: str, regla_profundidad: Optional[str] = None, profundidad: str = "profunda") -> str:
+    """Prompt para re-escribir UN ítem como párrafo reutilizable (caché compartida entre cartas)."""
+    regla_parrafo = (
+        "Instrucción adicional: Redacta un único párrafo sobre este elemento, autónomo y sin transiciones, "
+        "porque se combinará con los párrafos de otros elementos de la carta."
+    )
+    instrucciones = f"{instrucciones_adicionales}\n{regla_parrafo}".strip()
+    if tipo_carta.lower() == "draco":
+        return get_draconian_narrative_prompt_str(instrucciones, interpretacion_item, regla_profundidad, profundidad)
+    return get_tropical_narrative_prompt_str(instrucciones, interpretacion_item, regla_profundidad, profundidad)
+
+def get_connective_prompt_str(instrucciones_adicionales: str, secciones: str, cantidad: int) -> str:
+    """Prompt corto para las frases de transición entre secciones de un informe ya redactado."""
+    return (
+        f"<sistema_instruccion>\n{instrucciones_adicionales}\n{MARIA_BLAQUIER_PERSONA}\n</sistema_instruccion>\n\n"
+        f"<secciones_del_informe>\n{secciones}\n</secciones_del_informe>\n\n"
+        f"Escribe exactamente {cantidad} frases de transición, una por línea y sin numerar, "
+        "para introducir cada sección a partir de la segunda, en el orden indicado. "
+        "Cada frase debe tener como máximo 25 palabras, sin negritas, saludos ni despedidas."
     )
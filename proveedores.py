@@ -0,0 +1,188 @@
+"""
+Registro de proveedores LLM compatibles con OpenAI y enrutamiento por latencia con failover.
+- Cada proveedor: nombre, base_url, API key y nombres de modelo propios (alias por modelo lógico)
+- Se prefiere el proveedor con mejor p95 reciente para la clase de la llamada (etapa + modelo):
+  una narrativa larga y una extracción corta no se comparan en la misma serie de latencias
+- Un proveedor todavía sin medir en esa clase no pasa adelante: recibe solo una fracción de sondeo
+  (LLM_ROUTING_PROBE_RATIO) hasta juntar LLM_ROUTING_MIN_SAMPLES muestras
+- Un proveedor con el breaker abierto pasa al final; si falla por un error transitorio
+  (timeout, conexión, 429, 5xx) o está cortocircuitado, la llamada sigue con el siguiente
+- Estadísticas por proveedor (latencia, errores, failovers) expuestas en /metrics
+
+Configuración (por defecto un único proveedor "baseten" con BASETEN_BASE_URL y BASETEN_API_KEY):
+    LLM_PROVIDERS=baseten,respaldo
+    LLM_PROVIDER_RESPALDO_BASE_URL=https://api.otro-proveedor.com/v1
+    LLM_PROVIDER_RESPALDO_API_KEY=...
+    LLM_PROVIDER_RESPALDO_MODELS=moonshotai/Kimi-K2.5=kimi-k2.5
+"""
+
+import os
+import random
+import threading
+from typing import Any, Dict, List, Optional
+
+from llm_client import _env_float, _env_int, get_baseten_base_url
+from resiliencia import CircuitBreaker, CircuitoAbiertoError, ErrorLLM, Resiliencia, es_reintentable, get_resiliencia
+
+# Modelo lógico por defecto (cada proveedor puede servirlo con otro nombre)
+DEFAULT_MODEL = "moonshotai/Kimi-K2.5"
+
+
+def _parsear_modelos(valor: str) -> Dict[str, str]:
+    """'logico=real,otro=real2' → {'logico': 'real', 'otro': 'real2'}"""
+    modelos = {}
+    for par in (valor or "").split(","):
+        if "=" in par:
+            logico, real = par.split("=", 1)
+            modelos[logico.strip()] = real.strip()
+    return modelos
+
+
+def amerita_failover(error: BaseException) -> bool:
+    """Solo los problemas del proveedor (breaker abierto o error transitorio) justifican probar otro."""
+    if isinstance(error, CircuitoAbiertoError):
+        return True
+    return isinstance(error, ErrorLLM) and error.__cause__ is not None and es_reintentable(error.__cause__)
+
+
+class Proveedor:
+    """Un endpoint OpenAI-compatible con sus credenciales y nombres de modelo."""
+
+    def __init__(self, nombre: str, base_url: str, api_key: Optional[str], modelos: Optional[Dict[str, str]] = None):
+        self.nombre = nombre
+        self.base_url = base_url
+        self.api_key = api_key or ""
+        self.modelos = modelos or {}
+        self.llamadas = 0
+        self.failovers = 0
+        self._lock = threading.Lock()
+
+    def modelo(self, modelo: str) -> str:
+        """Nombre con el que este proveedor sirve el modelo lógico."""
+        return self.modelos.get(modelo, modelo)
+
+    def resiliencia(self) -> Resiliencia:
+        """Breaker, reintentos y latencias propios del proveedor."""
+        return get_resiliencia(self.nombre)
+
+    def registrar_llamada(self):
+        with self._lock:
+            self.llamadas += 1
+
+    def registrar_failover(self):
+        with self._lock:
+            self.failovers += 1
+
+    def stats(self) -> Dict[str, Any]:
+        resiliencia = self.resiliencia().stats()
+        return {
+            "base_url": self.base_url,
+            "models": self.modelos,
+            "routed_calls": self.llamadas,
+            "failovers": self.failovers,
+            "breaker": resiliencia["breaker"]["state"],
+            "successes": resiliencia["successes"],
+            "failures": resiliencia["failures"],
+            "retries": resiliencia["retries"],
+            "latency_p50": resiliencia["latency_p50"],
+            "latency_p95": resiliencia["latency_p95"],
+            "latency_by_class": resiliencia["latency_by_class"],
+        }
+
+
+class RegistroProveedores:
+    """Proveedores configurados, en orden de preferencia para cada llamada."""
+
+    def __init__(self, proveedores: List[Proveedor], min_muestras: Optional[int] = None,
+                 proporcion_sondeo: Optional[float] = None):
+        if not proveedores:
+            raise ValueError("Se necesita al menos un proveedor LLM")
+        self.proveedores = proveedores
+        self.min_muestras = min_muestras if min_muestras is not None else _env_int("LLM_ROUTING_MIN_SAMPLES", 5)
+        self.proporcion_sondeo = (
+            proporcion_sondeo if proporcion_sondeo is not None else _env_float("LLM_ROUTING_PROBE_RATIO", 0.05)
+        )
+        self.sondeos = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def desde_entorno(cls) -> "RegistroProveedores":
+        proveedores = []
+        for nombre in os.getenv("LLM_PROVIDERS", "baseten").split(","):
+            nombre = nombre.strip().lower()
+            if not nombre:
+                continue
+            prefijo = f"LLM_PROVIDER_{nombre.upper()}"
+            es_baseten = nombre == "baseten"
+            base_url = os.getenv(f"{prefijo}_BASE_URL") or (get_baseten_base_url() if es_baseten else None)
+            if not base_url:
+                raise ValueError(f"{prefijo}_BASE_URL no encontrada en variables de entorno")
+            api_key = os.getenv(f"{prefijo}_API_KEY") or (os.getenv("BASETEN_API_KEY") if es_baseten else None)
+            if not api_key:
+                variable = "BASETEN_API_KEY" if es_baseten else f"{prefijo}_API_KEY"
+                raise ValueError(f"{variable} no encontrada en variables de entorno")
+            proveedores.append(Proveedor(nombre, base_url, api_key, _parsear_modelos(os.getenv(f"{prefijo}_MODELS", ""))))
+        return cls(proveedores)
+
+    def _clasificar(self, clase: Optional[str]):
+        """(medidos por p95, sin muestras suficientes, con breaker abierto) para la clase."""
+        medidos, nuevos, abiertos = [], [], []
+        for indice, proveedor in enumerate(self.proveedores):
+            resiliencia = proveedor.resiliencia()
+            if resiliencia.breaker.estado == CircuitBreaker.ABIERTO:
+                abiertos.append(proveedor)
+            elif resiliencia.muestras(clase) >= self.min_muestras:
+                medidos.append((resiliencia.percentil(0.95, clase), indice, proveedor))
+            else:
+                nuevos.append(proveedor)
+        orden = [proveedor for _, _, proveedor in sorted(medidos, key=lambda t: (t[0], t[1]))]
+        return orden, nuevos, abiertos
+
+    def candidatos(self, clase: Optional[str] = None) -> List[Proveedor]:
+        """Proveedores en orden de preferencia para la clase de llamada.
+
+        Breaker abierto siempre al final; primero los medidos en la clase (menor p95), después los
+        que aún no tienen muestras suficientes (orden de configuración). Con probabilidad
+        proporcion_sondeo el primero sin medir pasa adelante para ir juntando muestras.
+        """
+        orden, nuevos, abiertos = self._clasificar(clase)
+        if orden and nuevos and random.random() < self.proporcion_sondeo:
+            with self._lock:
+                self.sondeos += 1
+            return [nuevos[0]] + orden + nuevos[1:] + abiertos
+        return orden + nuevos + abiertos
+
+    def stats(self) -> Dict[str, Any]:
+        clases = sorted({clase for p in self.proveedores for clase in p.resiliencia().stats()["latency_by_class"]})
+        return {
+            # Orden sin sondeos, por clase de llamada
+            "routing_order": {clase: [p.nombre for parte in self._clasificar(clase) for p in parte] for clase in clases},
+            "min_samples": self.min_muestras,
+            "probe_ratio": self.proporcion_sondeo,
+            "probes": self.sondeos,
+            "providers": {p.nombre: p.stats() for p in self.proveedores},
+        }
+
+
+_registro: Optional[RegistroProveedores] = None
+_registro_lock = threading.Lock()
+
+
+def get_registro_proveedores() -> RegistroProveedores:
+    """Registro global del proceso (se arma con las variables de entorno la primera vez)."""
+    global _registro
+    with _registro_lock:
+        if _registro is None:
+            _registro = RegistroProveedores.desde_entorno()
+        return _registro
+
+
+def get_provider_stats() -> Dict[str, Any]:
+    return get_registro_proveedores().stats()
+
+
+def reset_proveedores():
+    """Volver a leer la configuración de proveedores (tests o cambio de configuración)."""
+    global _registro
+    with _registro_lock:
+        _registro = None
@@ -0,0 +1,411 @@
+"""
+Capa de resiliencia para las llamadas al proveedor LLM (Baseten).
+- Deadline por llamada: todos los reintentos deben terminar antes del instante límite
+- Reintentos con backoff exponencial y jitter completo (solo errores transitorios)
+- Pedido duplicado "hedged" opcional si el primero supera un percentil de latencia de su misma
+  clase de llamada (etapa + modelo): una narrativa de 120s no fija el umbral de una extracción de 2s
+- Circuit breaker por proveedor: falla rápido mientras Baseten está degradado
+- Latencia de cada intento medida desde que el limitador (limitador.py) concede el turno:
+  la espera en cola no entra en las muestras de cobertura ni en el p95 del enrutamiento
+- Estadísticas de estado expuestas en /metrics
+"""
+
+import os
+import time
+import random
+import asyncio
+import threading
+import contextvars
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+import openai
+
+from llm_client import _env_float, _env_int
+from planificador import TareaCanceladaError
+
+T = TypeVar("T")
+
+# Códigos HTTP que indican un problema transitorio del proveedor
+STATUS_REINTENTABLES = {408, 409, 429}
+
+
+class ErrorLLM(RuntimeError):
+    """La llamada al LLM falló definitivamente (reintentos agotados o error no recuperable)."""
+
+
+class CircuitoAbiertoError(ErrorLLM):
+    """El circuit breaker está abierto: no se llama al proveedor hasta que se recupere."""
+
+
+def es_reintentable(error: BaseException) -> bool:
+    """Timeouts, errores de conexión, 408/409/429 y 5xx se reintentan; el resto no."""
+    if isinstance(error, (TimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in STATUS_REINTENTABLES or error.status_code >= 500
+    return False
+
+
+def _mensaje(error: BaseException) -> str:
+    return str(error) or type(error).__name__
+
+
+# Reloj del intento en curso: [inicio]; el limitador lo reinicia al conceder el turno
+_reloj_intento: contextvars.ContextVar = contextvars.ContextVar("reloj_intento", default=None)
+
+
+def iniciar_reloj_intento():
+    """Empezar a medir la latencia del intento actual desde ahora (p.ej. al obtener turno del limitador)."""
+    reloj = _reloj_intento.get()
+    if reloj is not None:
+        reloj[0] = time.monotonic()
+
+
+class PoliticaResiliencia:
+    """Parámetros de la capa de resiliencia leídos de variables de entorno."""
+
+    def __init__(self):
+        self.call_deadline = _env_float("LLM_CALL_DEADLINE", 600.0)
+        self.max_retries = _env_int("LLM_MAX_RETRIES", 2)
+        self.retry_base_delay = _env_float("LLM_RETRY_BASE_DELAY", 0.5)
+        self.retry_max_delay = _env_float("LLM_RETRY_MAX_DELAY", 8.0)
+        self.hedge_enabled = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+        self.hedge_percentile = _env_float("LLM_HEDGE_PERCENTILE", 0.95)
+        self.hedge_min_samples = _env_int("LLM_HEDGE_MIN_SAMPLES", 20)
+        self.hedge_min_delay = _env_float("LLM_HEDGE_MIN_DELAY", 0.5)
+        self.breaker_failure_threshold = _env_int("LLM_BREAKER_FAILURE_THRESHOLD", 5)
+        self.breaker_reset_timeout = _env_float("LLM_BREAKER_RESET_TIMEOUT", 30.0)
+
+    def backoff(self, intento: int) -> float:
+        """Espera antes del reintento `intento` (0 = primer reintento): jitter completo."""
+        return random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * (2 ** intento)))
+
+    def as_dict(self) -> Dict[str, Any]:
+        return dict(vars(self))
+
+
+class CircuitBreaker:
+    """
+    Estados: closed (normal) → open tras N fallos transitorios seguidos →
+    half_open pasado reset_timeout (se deja pasar una sola llamada de prueba) →
+    closed si la prueba sale bien, open otra vez si falla.
+    """
+
+    CERRADO = "closed"
+    ABIERTO = "open"
+    SEMIABIERTO = "half_open"
+
+    def __init__(self, umbral_fallos: int, espera_reapertura: float):
+        self.umbral_fallos = umbral_fallos
+        self.espera_reapertura = espera_reapertura
+        self.estado = self.CERRADO
+        self.fallos_consecutivos = 0
+        self.aperturas = 0
+        self._abierto_desde = 0.0
+        self._prueba_en_curso = False
+        self._lock = threading.Lock()
+
+    def permitir(self) -> bool:
+        with self._lock:
+            if self.estado == self.ABIERTO and time.monotonic() - self._abierto_desde >= self.espera_reapertura:
+                self.estado = self.SEMIABIERTO
+                self._prueba_en_curso = False
+            if self.estado == self.CERRADO:
+                return True
+            if self.estado == self.SEMIABIERTO and not self._prueba_en_curso:
+                self._prueba_en_curso = True
+                return True
+            return False
+
+    def exito(self):
+        with self._lock:
+            if self.estado != self.CERRADO:
+                print("✅ Circuit breaker del LLM cerrado (proveedor recuperado)")
+            self.estado = self.CERRADO
+            self.fallos_consecutivos = 0
+            self._prueba_en_curso = False
+
+    def fallo(self):
+        with self._lock:
+            self.fallos_consecutivos += 1
+            self._prueba_en_curso = False
+            if self.estado == self.SEMIABIERTO or (
+                self.estado == self.CERRADO and self.fallos_consecutivos >= self.umbral_fallos
+            ):
+                self.estado = self.ABIERTO
+                self._abierto_desde = time.monotonic()
+                self.aperturas += 1
+                print(f"🔴 Circuit breaker del LLM abierto ({self.fallos_consecutivos} fallos seguidos)")
+
+    def liberar(self):
+        """Soltar la llamada de prueba sin veredicto (cancelación o error propio)."""
+        with self._lock:
+            self._prueba_en_curso = False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.estado,
+                "consecutive_failures": self.fallos_consecutivos,
+                "times_opened": self.aperturas,
+            }
+
+
+class Resiliencia:
+    """Política + breaker + latencias de un proveedor (compartido por todos sus BasetenLLM)."""
+
+    def __init__(self, nombre: str, politica: Optional[PoliticaResiliencia] = None):
+        self.nombre = nombre
+        self.politica = politica or PoliticaResiliencia()
+        self.breaker = CircuitBreaker(self.politica.breaker_failure_threshold, self.politica.breaker_reset_timeout)
+        # Todas las latencias (métricas) y por clase de llamada (cobertura y enrutamiento)
+        self._latencias: Deque[float] = deque(maxlen=200)
+        self._latencias_por_clase: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+        self.llamadas = 0
+        self.exitos = 0
+        self.fallos = 0
+        self.reintentos = 0
+        self.coberturas = 0
+        self.coberturas_ganadas = 0
+        self.rechazadas = 0
+        self.canceladas = 0
+
+    # --- Deadline y latencias ---
+
+    def deadline(self, deadline: Optional[float] = None) -> float:
+        """Instante límite (time.monotonic) de la llamada: el pedido o LLM_CALL_DEADLINE desde ahora."""
+        return deadline if deadline is not None else time.monotonic() + self.politica.call_deadline
+
+    def _serie(self, clase: Optional[str]) -> Deque[float]:
+        """Latencias de la clase (None = todas). Llamar con el lock tomado."""
+        if clase is None:
+            return self._latencias
+        return self._latencias_por_clase.get(clase, deque())
+
+    def _registrar_latencia(self, segundos: float, clase: Optional[str] = None):
+        with self._lock:
+            self._latencias.append(segundos)
+            if clase is not None:
+                self._latencias_por_clase.setdefault(clase, deque(maxlen=200)).append(segundos)
+
+    def percentil(self, p: float, clase: Optional[str] = None) -> Optional[float]:
+        with self._lock:
+            muestras = sorted(self._serie(clase))
+        if not muestras:
+            return None
+        return muestras[min(int(p * len(muestras)), len(muestras) - 1)]
+
+    def muestras(self, clase: Optional[str] = None) -> int:
+        """Cantidad de latencias recientes registradas (llamadas exitosas), de la clase o de todas."""
+        with self._lock:
+            return len(self._serie(clase))
+
+    def retraso_cobertura(self, clase: Optional[str] = None) -> Optional[float]:
+        """Segundos tras los cuales se lanza el pedido duplicado, o None si no corresponde."""
+        if not self.politica.hedge_enabled or self.muestras(clase) < self.politica.hedge_min_samples:
+            return None
+        return max(self.percentil(self.politica.hedge_percentile, clase), self.politica.hedge_min_delay)
+
+    # --- Ejecución ---
+
+    def _contar(self, contador: str, n: int = 1):
+        """Sumar a un contador de stats (se actualizan desde el loop y desde los hilos de consultas RAG)."""
+        with self._lock:
+            setattr(self, contador, getattr(self, contador) + n)
+
+    async def _intento_medido(self, intento_fn: Callable[[], Awaitable[T]], clase: Optional[str]) -> T:
+        """Ejecutar un intento y registrar su latencia desde el turno del limitador (o desde el inicio)."""
+        reloj = [time.monotonic()]
+        token = _reloj_intento.set(reloj)
+        try:
+            resultado = await intento_fn()
+        finally:
+            _reloj_intento.reset(token)
+        self._registrar_latencia(time.monotonic() - reloj[0], clase)
+        return resultado
+
+    def _intento_medido_sync(self, intento_fn: Callable[[], T], clase: Optional[str]) -> T:
+        reloj = [time.monotonic()]
+        token = _reloj_intento.set(reloj)
+        try:
+            resultado = intento_fn()
+        finally:
+            _reloj_intento.reset(token)
+        self._registrar_latencia(time.monotonic() - reloj[0], clase)
+        return resultado
+
+    def _admitir(self):
+        if not self.breaker.permitir():
+            self._contar("rechazadas")
+            raise CircuitoAbiertoError(f"Proveedor LLM degradado ({self.nombre}): circuit breaker abierto")
+
+    def _resolver_fallo(self, error: BaseException, intento: int, deadline: float) -> Optional[float]:
+        """Registrar un fallo; devuelve la espera antes de reintentar o None si hay que rendirse."""
+        if not es_reintentable(error):
+            # Error del pedido (p.ej. 400) o propio: no dice nada de la salud del proveedor,
+            # así que ni cuenta como fallo ni cierra un breaker semiabierto (solo suelta la prueba)
+            self.breaker.liberar()
+            return None
+        self.breaker.fallo()
+        espera = self.politica.backoff(intento)
+        if intento >= self.politica.max_retries or self.breaker.estado == CircuitBreaker.ABIERTO:
+            return None
+        if time.monotonic() + espera >= deadline:
+            return None
+        self._contar("reintentos")
+        print(f"🔁 Reintentando llamada al LLM en {espera:.2f}s ({_mensaje(error)})")
+        return espera
+
+    def _error_final(self, error: BaseException) -> ErrorLLM:
+        self._contar("fallos")
+        if isinstance(error, ErrorLLM):
+            return error
+        return ErrorLLM(_mensaje(error))
+
+    async def ejecutar(self, intento_fn: Callable[[], Awaitable[T]], deadline: float, cobertura: bool = False,
+                       clase: Optional[str] = None) -> T:
+        """Ejecutar una llamada async con breaker, reintentos y (opcional) pedido duplicado.
+
+        `clase` agrupa las latencias comparables (BasetenLLM usa etapa + modelo).
+        """
+        self._contar("llamadas")
+        intento = 0
+        while True:
+            self._admitir()
+            try:
+                if cobertura:
+                    resultado = await self._con_cobertura(intento_fn, deadline, clase)
+                else:
+                    resultado = await self._intento_medido(intento_fn, clase)
+            except asyncio.CancelledError:
+                self.breaker.liberar()
+                self._contar("canceladas")
+                raise
+            except Exception as e:
+                espera = self._resolver_fallo(e, intento, deadline)
+                if espera is None:
+                    raise self._error_final(e) from e
+                await asyncio.sleep(espera)
+                intento += 1
+                continue
+            self.breaker.exito()
+            self._contar("exitos")
+            return resultado
+
+    def ejecutar_sync(self, intento_fn: Callable[[], T], deadline: float, clase: Optional[str] = None) -> T:
+        """Versión sincrónica (hilos de consultas RAG): breaker y reintentos, sin pedido duplicado."""
+        self._contar("llamadas")
+        intento = 0
+        while True:
+            self._admitir()
+            try:
+                resultado = self._intento_medido_sync(intento_fn, clase)
+            except TareaCanceladaError:
+                # Nadie espera ya el resultado (cliente desconectado): ni fallo ni reintento
+                self.breaker.liberar()
+                self._contar("canceladas")
+                raise
+            except Exception as e:
+                espera = self._resolver_fallo(e, intento, deadline)
+                if espera is None:
+                    raise self._error_final(e) from e
+                time.sleep(espera)
+                intento += 1
+                continue
+            self.breaker.exito()
+            self._contar("exitos")
+            return resultado
+
+    async def _con_cobertura(self, intento_fn: Callable[[], Awaitable[T]], deadline: float, clase: Optional[str] = None) -> T:
+        """Si el primer pedido supera el percentil de latencia de su clase, lanzar un duplicado y quedarse con el primero que responda."""
+        retraso = self.retraso_cobertura(clase)
+        if retraso is None or time.monotonic() + retraso >= deadline:
+            return await self._intento_medido(intento_fn, clase)
+
+        tareas = [asyncio.ensure_future(self._intento_medido(intento_fn, clase))]
+        try:
+            hechas, _ = await asyncio.wait(tareas, timeout=retraso)
+            if not hechas:
+                self._contar("coberturas")
+                tareas.append(asyncio.ensure_future(self._intento_medido(intento_fn, clase)))
+            pendientes = set(tareas)
+            error: Optional[BaseException] = None
+            while pendientes:
+                hechas, pendientes = await asyncio.wait(pendientes, return_when=asyncio.FIRST_COMPLETED)
+                for tarea in hechas:
+                    if tarea.cancelled():
+                        # Una rama cancelada desde afuera no termina la llamada si la otra sigue en pie
+                        error = error or asyncio.CancelledError()
+                        continue
+                    if tarea.exception() is None:
+                        if len(tareas) > 1 and tarea is tareas[1]:
+                            self._contar("coberturas_ganadas")
+                        return tarea.result()
+                    error = tarea.exception()
+            raise error
+        finally:
+            for tarea in tareas:
+                if not tarea.done():
+                    tarea.cancel()
+            # Esperar a la rama perdedora: suelta ya su turno del limitador y su excepción queda recuperada
+            await asyncio.gather(*tareas, return_exceptions=True)
+
+    def _stats_clase(self, clase: str) -> Dict[str, Any]:
+        p50 = self.percentil(0.5, clase)
+        p95 = self.percentil(0.95, clase)
+        return {
+            "samples": self.muestras(clase),
+            "latency_p50": round(p50, 3) if p50 is not None else None,
+            "latency_p95": round(p95, 3) if p95 is not None else None,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        p50 = self.percentil(0.5)
+        p95 = self.percentil(0.95)
+        with self._lock:
+            clases = list(self._latencias_por_clase)
+            contadores = {
+                "calls": self.llamadas,
+                "successes": self.exitos,
+                "failures": self.fallos,
+                "retries": self.reintentos,
+                "short_circuited": self.rechazadas,
+                "cancelled": self.canceladas,
+                "hedges": self.coberturas,
+                "hedge_wins": self.coberturas_ganadas,
+            }
+        return {
+            "provider": self.nombre,
+            "breaker": self.breaker.stats(),
+            **contadores,
+            "latency_p50": round(p50, 3) if p50 is not None else None,
+            "latency_p95": round(p95, 3) if p95 is not None else None,
+            "latency_by_class": {clase: self._stats_clase(clase) for clase in clases},
+            "policy": self.politica.as_dict(),
+        }
+
+
+_registro: Dict[str, Resiliencia] = {}
+_registro_lock = threading.Lock()
+
+
+def get_resiliencia(proveedor: str) -> Resiliencia:
+    """Capa de resiliencia compartida del proveedor (una por nombre de proveedor o base_url)."""
+    with _registro_lock:
+        resiliencia = _registro.get(proveedor)
+        if resiliencia is None:
+            resiliencia = _registro[proveedor] = Resiliencia(proveedor)
+        return resiliencia
+
+
+def get_resilience_stats() -> Dict[str, Any]:
+    with _registro_lock:
+        return {nombre: r.stats() for nombre, r in _registro.items()}
+
+
+def reset_resiliencia():
+    """Olvidar breakers y latencias (tests o cambio de configuración)."""
+    with _registro_lock:
+        _registro.clear()
@@ -0,0 +1,179 @@
+"""
+Almacén de secciones del corpus indexado por título (encabezados markdown de data/*.md y data/draco/*.md).
+
+Las consultas de _generar_consulta_estandarizada son títulos canónicos ("marte en casa 3",
+"sol cuadratura a saturno", "sol dracónico en libra") y esos mismos títulos son encabezados del
+corpus. Para ellas no hace falta similitud de embeddings: la sección exacta sale de un diccionario
+en O(1) (sin embedding de la consulta y sin riesgo de traer la sección vecina). La búsqueda
+vectorial queda como respaldo para las consultas sin encabezado.
+- Claves: normalizar_titulo (la misma normalización que InterpretadorRAG._normalize_title) sin tildes
+- Encabezados de aspectos agrupados ("sol cuadratura u oposición a júpiter") se registran también
+  como un alias por aspecto ("sol cuadratura a júpiter", "sol oposición a júpiter")
+- Una sección va desde su encabezado hasta el siguiente del mismo nivel o superior
+
+    RAG_SECTION_LOOKUP=true
+"""
+
+import re
+import threading
+import unicodedata
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+try:
+    from llama_index.core.retrievers import BaseRetriever
+    from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+except ImportError:
+    # Fallback a versiones anteriores (normalizar_titulo y el almacén no dependen de llama-index)
+    from llama_index.retrievers import BaseRetriever
+    from llama_index.schema import NodeWithScore, QueryBundle, TextNode
+
+_ENCABEZADO = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+
+# Aspectos tal como aparecen en los títulos (sin tildes, ver clave_titulo)
+ASPECTOS = {"conjuncion", "oposicion", "cuadratura", "trigono", "sextil", "semisextil", "quincuncio", "semicuadratura", "sesquicuadratura"}
+_ASPECTO_AGRUPADO = re.compile(r"^(?:aspecto\s+)?(\w+)\s+(?:en\s+)?(.+?)\s+a\s+(\w+)$")
+
+
+def normalizar_titulo(title: str) -> str:
+    """Normalizar título para matching consistente"""
+    # Remover paréntesis y contenido
+    normalized = re.sub(r'\s*\([^)]*\)', '', title)
+    # Remover dos puntos y contenido posterior
+    normalized = re.sub(r':.*', '', normalized)
+    # Convertir a minúsculas
+    normalized = normalized.lower()
+    # Normalizar espacios
+    normalized = re.sub(r'\s+', ' ', normalized).strip()
+    # Normalizar "casa dos" -> "casa 2"
+    normalized = normalized.replace(" en casa dos", " en casa 2")
+    # Remover asteriscos de markdown
+    normalized = re.sub(r'\*+', '', normalized).strip()
+
+    return normalized
+
+
+def clave_titulo(title: str) -> str:
+    """Clave de búsqueda: título normalizado y sin tildes (como _flexible_title_match)."""
+    return unicodedata.normalize('NFD', normalizar_titulo(title)).encode('ascii', 'ignore').decode('ascii')
+
+
+def alias_aspectos(clave: str) -> List[str]:
+    """'sol cuadratura u oposicion a jupiter' → ['sol cuadratura a jupiter', 'sol oposicion a jupiter']"""
+    match = _ASPECTO_AGRUPADO.match(clave)
+    if not match:
+        return []
+    planeta1, aspectos, planeta2 = match.groups()
+    lista = [a.strip() for a in re.split(r"\s+o\s+|\s+u\s+", aspectos)]
+    if not all(a in ASPECTOS for a in lista):
+        return []
+    return [f"{planeta1} {aspecto} a {planeta2}" for aspecto in lista]
+
+
+class Seccion:
+    """Texto de una sección del corpus con su encabezado."""
+
+    __slots__ = ("titulo", "texto", "tipo_carta", "archivo")
+
+    def __init__(self, titulo: str, texto: str, tipo_carta: str, archivo: str):
+        self.titulo = titulo
+        self.texto = texto
+        self.tipo_carta = tipo_carta
+        self.archivo = archivo
+
+
+def secciones_markdown(texto: str) -> List[Dict[str, Any]]:
+    """Encabezados del markdown con el texto de su sección (incluye las subsecciones)."""
+    lineas = texto.splitlines()
+    encabezados = []
+    for n, linea in enumerate(lineas):
+        match = _ENCABEZADO.match(linea)
+        if match:
+            encabezados.append((n, len(match.group(1)), match.group(2)))
+    secciones = []
+    for i, (inicio, nivel, titulo) in enumerate(encabezados):
+        fin = next((n for n, otro_nivel, _ in encabezados[i + 1:] if otro_nivel <= nivel), len(lineas))
+        cuerpo = "\n".join(lineas[inicio:fin]).strip()
+        secciones.append({"titulo": titulo, "nivel": nivel, "texto": cuerpo})
+    return secciones
+
+
+class AlmacenSecciones:
+    """Secciones por tipo de carta y clave de título."""
+
+    def __init__(self):
+        self._secciones: Dict[str, Dict[str, Seccion]] = {}
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.duplicados = 0
+
+    @classmethod
+    def desde_archivos(cls, tropical_files: List[Path], draco_files: List[Path]) -> "AlmacenSecciones":
+        almacen = cls()
+        for tipo, archivos in (("tropical", tropical_files), ("draco", draco_files)):
+            for archivo in archivos:
+                texto = Path(archivo).read_text(encoding="utf-8")
+                for seccion in secciones_markdown(texto):
+                    almacen.agregar(Seccion(seccion["titulo"], seccion["texto"], tipo, Path(archivo).name))
+        return almacen
+
+    def agregar(self, seccion: Seccion):
+        por_clave = self._secciones.setdefault(seccion.tipo_carta, {})
+        clave = clave_titulo(seccion.titulo)
+        if not clave:
+            return
+        if clave in por_clave:
+            # El primer encabezado gana: el corpus repite algunos títulos en secciones de repaso
+            self.duplicados += 1
+        else:
+            por_clave[clave] = seccion
+        for alias in alias_aspectos(clave):
+            por_clave.setdefault(alias, seccion)
+
+    def buscar(self, consulta: str, tipo_carta: str = "tropical") -> Optional[Seccion]:
+        """Sección cuyo encabezado coincide con la consulta (None si no hay)."""
+        seccion = self._secciones.get(tipo_carta, {}).get(clave_titulo(consulta))
+        with self._lock:
+            if seccion is None:
+                self.fallos += 1
+            else:
+                self.aciertos += 1
+        return seccion
+
+    def __len__(self) -> int:
+        return sum(len(por_clave) for por_clave in self._secciones.values())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                "keys": {tipo: len(por_clave) for tipo, por_clave in self._secciones.items()},
+                "duplicate_headers": self.duplicados,
+                "hits": self.aciertos,
+                "vector_fallbacks": self.fallos,
+                "hit_rate": round(self.aciertos / consultas, 3) if consultas else None,
+            }
+
+
+class RecuperadorPorTitulo(BaseRetriever):
+    """Sección exacta por título; si la consulta no es un encabezado, el retriever vectorial."""
+
+    def __init__(self, almacen: AlmacenSecciones, tipo_carta: str, respaldo: BaseRetriever):
+        self._almacen = almacen
+        self._tipo_carta = tipo_carta
+        self._respaldo = respaldo
+        super().__init__(callback_manager=respaldo.callback_manager)
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        seccion = self._almacen.buscar(query_bundle.query_str, self._tipo_carta)
+        if seccion is None:
+            return self._respaldo.retrieve(query_bundle)
+        nodo = TextNode(
+            text=seccion.texto,
+            metadata={"file_name": seccion.archivo, "chart_type": seccion.tipo_carta, "titulo": seccion.titulo},
+            # Como en el índice vectorial, el contexto del LLM no lleva la etiqueta de tipo de carta
+            excluded_llm_metadata_keys=["chart_type", "titulo"],
+            excluded_embed_metadata_keys=["chart_type", "titulo"],
+        )
+        return [NodeWithScore(node=nodo, score=1.0)]
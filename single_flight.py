@@ -0,0 +1,76 @@
+"""
+Coalescencia "single-flight" de trabajos async idénticos en curso.
+
+Pedidos concurrentes con la misma clave esperan una única tarea compartida.
+Si uno de ellos se cancela (cliente desconectado) la tarea sigue para los demás;
+solo se cancela cuando ya no queda nadie esperándola.
+"""
+
+import asyncio
+import weakref
+from typing import Any, Awaitable, Callable, Dict, TypeVar
+
+T = TypeVar("T")
+
+
+class _Vuelo:
+    """Tarea compartida y cantidad de pedidos que la esperan."""
+
+    def __init__(self, tarea: asyncio.Task):
+        self.tarea = tarea
+        self.esperando = 0
+
+
+class SingleFlight:
+    """Registro de tareas en curso por clave (uno por event loop)."""
+
+    def __init__(self, nombre: str = "single_flight"):
+        self.nombre = nombre
+        self._vuelos = weakref.WeakKeyDictionary()
+        self.ejecutadas = 0
+        self.coalescidas = 0
+        self.canceladas = 0
+
+    def _en_loop(self) -> Dict[str, _Vuelo]:
+        return self._vuelos.setdefault(asyncio.get_running_loop(), {})
+
+    async def run(self, clave: str, fabrica: Callable[[], Awaitable[T]]) -> T:
+        """Ejecutar fabrica() o, si ya hay una tarea con esta clave, esperar su resultado."""
+        vuelos = self._en_loop()
+        vuelo = vuelos.get(clave)
+        if vuelo is None:
+            vuelo = _Vuelo(asyncio.ensure_future(fabrica()))
+            vuelos[clave] = vuelo
+            vuelo.tarea.add_done_callback(lambda _: vuelos.pop(clave, None) if vuelos.get(clave) is vuelo else None)
+            self.ejecutadas += 1
+        else:
+            self.coalescidas += 1
+            print(f"🔗 Pedido coalescido con uno idéntico en curso ({self.nombre})")
+
+        vuelo.esperando += 1
+        try:
+            return await asyncio.shield(vuelo.tarea)
+        except asyncio.CancelledError:
+            # Se canceló este pedido (no la tarea): solo se aborta el trabajo si era el último
+            if not vuelo.tarea.done() and vuelo.esperando == 1:
+                # Sacarla del registro ya: un pedido idéntico que llegue antes del done-callback
+                # debe abrir un vuelo nuevo, no esperar una tarea cancelada
+                if vuelos.get(clave) is vuelo:
+                    del vuelos[clave]
+                vuelo.tarea.cancel()
+                self.canceladas += 1
+            raise
+        finally:
+            vuelo.esperando -= 1
+
+    def en_curso(self) -> int:
+        return sum(len(vuelos) for vuelos in list(self._vuelos.values()))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.nombre,
+            "in_flight": self.en_curso(),
+            "executed": self.ejecutadas,
+            "coalesced": self.coalescidas,
+            "cancelled": self.canceladas,
+        }
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field, validator
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, Field, HttpUrl, validator
+from typing import List, Literal, Optional, Dict, Any
 
 # --- Modelos para Interpretación de Carta Natal ---
 
@@ -12,11 +12,23 @@ class CartaNatalData(BaseModel):
     cuspides_cruzadas: Optional[List[Dict[str, Any]]] = None
     aspectos_cruzados: Optional[List[Dict[str, Any]]] = None
 
+# Valores aceptados en el pedido (interpretador_refactored: MODOS_NARRATIVA; prompts: PROFUNDIDADES);
+# un valor mal escrito responde 422 en lugar de caer en silencio al informe más caro
+ModoNarrativa = Literal["completa", "secciones", "parrafos", "pregenerada", "plantilla"]
+Profundidad = Literal["breve", "estandar", "profunda"]
+
 class InterpretacionRequest(BaseModel):
     """Request para generar interpretación"""
     carta_natal: CartaNatalData
     genero: str = Field(..., description="Género: masculino o femenino")
     tipo: str = Field("tropical", description="Tipo de carta: tropical o draco")
+    modo_narrativa: Optional[ModoNarrativa] = Field(None, description="Generación narrativa: completa (un prompt), secciones (en paralelo), parrafos (caché por ítem), pregenerada (artefacto offline) o plantilla (sin LLM, milisegundos)")
+    profundidad: Optional[Profundidad] = Field(None, description="Extensión del informe: breve (visión general), estandar o profunda (lectura principal, por defecto)")
+    max_latency_ms: Optional[int] = Field(None, gt=0, description="Presupuesto de latencia: si la narrativa no llega a tiempo se devuelve degradada (parcial o por plantilla)")
+
+class InterpretacionJobRequest(InterpretacionRequest):
+    """Request para encolar una interpretación como trabajo asíncrono"""
+    callback_url: Optional[HttpUrl] = Field(None, description="URL https (host en JOBS_CALLBACK_ALLOWED_HOSTS) que recibe un POST con el estado final del trabajo")
 
 class InterpretacionItem(BaseModel):
     """Item individual de interpretación"""
@@ -31,11 +43,37 @@ class InterpretacionItem(BaseModel):
     planeta2: Optional[str] = None
     grados: Optional[str] = None
 
+class ConsumoTokens(BaseModel):
+    """Tokens previstos (presupuesto adaptativo) y reales (informados por el proveedor) de la narrativa"""
+    llamadas: int = 0
+    entrada_estimada: int = 0
+    entrada_real: Optional[int] = None
+    salida_prevista: int = 0
+    salida_real: Optional[int] = None
+    max_tokens: int = 0
+
 class InterpretacionResponse(BaseModel):
     """Respuesta con interpretaciones completas"""
     interpretacion_narrativa: str
     interpretaciones_individuales: List[InterpretacionItem]
     tiempo_generacion: float
+    tokens: Optional[ConsumoTokens] = None
+    degradada: bool = False
+    motivo_degradacion: Optional[str] = Field(None, description="parcial:<causa> o plantilla:<causa>, con causa sin_tiempo o error_llm")
+
+class TrabajoInterpretacionResponse(BaseModel):
+    """Estado de un trabajo asíncrono de interpretación"""
+    job_id: str
+    estado: str = Field(..., description="pendiente, en_curso, completado o error")
+    interpretaciones_individuales: List[InterpretacionItem]
+    interpretacion_narrativa: Optional[str] = None
+    error: Optional[str] = None
+    tiempo_generacion: Optional[float] = None
+    degradada: bool = False
+    motivo_degradacion: Optional[str] = Field(None, description="Como en InterpretacionResponse: narrativa recortada por max_latency_ms")
+    callback_estado: Optional[str] = None
+    creado: float
+    actualizado: float
 
 # --- Modelos para Interpretación de Eventos de Calendario ---
 
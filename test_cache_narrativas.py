@@ -0,0 +1,80 @@
+"""
+Tests de la caché persistente de narrativas (SQLite).
+"""
+
+import time
+import asyncio
+
+from cache_narrativas import CacheNarrativas, FUENTES_PROMPTS, hash_prompts
+
+ITEMS = [
+    {"titulo": "Sol en Aries", "interpretacion": "Texto del Sol"},
+    {"titulo": "Luna en Tauro", "interpretacion": "Texto de la Luna"},
+]
+
+
+def test_clave_no_depende_del_orden_pero_si_del_contexto(tmp_path):
+    cache = CacheNarrativas(path=str(tmp_path / "c.sqlite3"), prompt_version="v1")
+    base = cache.clave(ITEMS, "femenino", "tropical", "kimi")
+    assert cache.clave(list(reversed(ITEMS)), "femenino", "tropical", "kimi") == base
+    assert cache.clave(ITEMS, "masculino", "tropical", "kimi") != base
+    assert cache.clave(ITEMS, "femenino", "draco", "kimi") != base
+    assert cache.clave(ITEMS, "femenino", "tropical", "otro-modelo") != base
+    assert cache.clave(ITEMS, "femenino", "tropical", "kimi", namespace="secciones") != base
+
+
+def test_expulsion_por_tamano_y_antiguedad(tmp_path):
+    cache = CacheNarrativas(path=str(tmp_path / "c.sqlite3"), max_entries=2, max_age_seconds=0.2, prompt_version="v1")
+    cache.set("a", "A")
+    cache.set("b", "B")
+    assert cache.get("a") == "A"   # 'a' pasa a ser la más reciente
+    cache.set("c", "C")            # expulsa 'b' (LRU)
+    assert cache.get("b") is None
+    assert cache.get("c") == "C"
+    time.sleep(0.3)
+    assert cache.get("a") is None  # vencida
+    stats = cache.stats()
+    assert stats["hits"] == 2 and stats["misses"] == 2
+    assert stats["evictions"] >= 2
+
+
+def test_cambio_de_prompts_invalida(tmp_path):
+    path = str(tmp_path / "c.sqlite3")
+    CacheNarrativas(path=path, prompt_version="v1").set("a", "A")
+    assert CacheNarrativas(path=path, prompt_version="v1").get("a") == "A"
+    cache_nueva = CacheNarrativas(path=path, prompt_version="v2")
+    assert cache_nueva.stats()["entries"] == 0
+
+
+def test_la_version_de_prompts_cubre_todas_sus_fuentes(tmp_path):
+    copias = []
+    for fuente in FUENTES_PROMPTS:
+        copia = tmp_path / fuente.name
+        copia.write_bytes(fuente.read_bytes())
+        copias.append(copia)
+    base = hash_prompts(copias)
+    assert base == hash_prompts(FUENTES_PROMPTS)
+
+    # Editar cualquiera de las fuentes (no solo prompts.py) cambia la versión
+    for copia in copias:
+        original = copia.read_bytes()
+        copia.write_bytes(original + b"\n# cambio\n")
+        assert hash_prompts(copias) != base
+        copia.write_bytes(original)
+    assert {fuente.name for fuente in FUENTES_PROMPTS} >= {"prompts.py", "narrativa_secciones.py", "presupuesto_tokens.py"}
+
+
+def test_recarga_de_la_misma_carta_no_llama_al_llm(interpretador, fake_llm, carta_real):
+    fake_llm.latency = 0.5
+
+    async def escenario():
+        primera = await interpretador.generar_interpretacion_completa(carta_real, "femenino", "tropical")
+        inicio = time.monotonic()
+        segunda = await interpretador.generar_interpretacion_completa(carta_real, "femenino", "tropical")
+        return primera, segunda, time.monotonic() - inicio
+
+    primera, segunda, transcurrido = asyncio.run(escenario())
+    assert segunda["interpretacion_narrativa"] == primera["interpretacion_narrativa"]
+    assert fake_llm.request_count == 1
+    assert transcurrido < 0.2
+    assert interpretador.cache_narrativas.stats()["hits"] == 1
@@ -0,0 +1,52 @@
+"""
+Tests del modo narrativo "parrafos": párrafos por ítem reutilizados entre cartas distintas.
+"""
+
+import asyncio
+
+
+def _responder(prompt: str) -> str:
+    if "frases de transición" in prompt:
+        cantidad = int(prompt.split("Escribe exactamente ")[1].split(" ")[0])
+        return "\n".join(f"Transición {n}." for n in range(1, cantidad + 1))
+    return f"Párrafo re-escrito ({len(prompt)})"
+
+
+def test_segunda_carta_solo_genera_items_nuevos(interpretador, fake_llm, carta_real):
+    fake_llm.responder = _responder
+    parrafos = interpretador.cache_parrafos
+
+    async def escenario():
+        items = await interpretador._obtener_interpretaciones_individuales(carta_real, "tropical")
+        primera = await interpretador._generar_narrativa_por_parrafos(items, "femenino", "tropical")
+        llamadas_primera = fake_llm.request_count
+
+        # Otra carta: comparte todos los ítems menos dos, que cambian de texto
+        otra = [dict(item) for item in items]
+        otra[0]["interpretacion"] += " (variante)"
+        otra[-1]["interpretacion"] += " (variante)"
+        segunda = await interpretador._generar_narrativa_por_parrafos(otra, "femenino", "tropical")
+        return items, primera, segunda, llamadas_primera
+
+    items, primera, segunda, llamadas_primera = asyncio.run(escenario())
+    # Un párrafo por ítem + una pasada de transiciones
+    assert llamadas_primera == len(items) + 1
+    assert fake_llm.request_count - llamadas_primera == 2 + 1
+    assert parrafos.stats()["entries"] == len(items) + 2
+    assert primera.count("Párrafo re-escrito") == len(items)
+    assert "Transición 1." in segunda
+    # La pasada de transiciones es corta comparada con un informe completo
+    conectores = [r for r in fake_llm.requests if "frases de transición" in r["messages"][0]["content"]]
+    assert len(conectores) == 2
+    assert all(r["max_tokens"] < 1000 for r in conectores)
+
+
+def test_transiciones_con_lineas_incorrectas_se_omiten(interpretador, fake_llm, carta_real):
+    fake_llm.responder = lambda prompt: "Una sola línea" if "frases de transición" in prompt else "Párrafo"
+
+    async def escenario():
+        items = await interpretador._obtener_interpretaciones_individuales(carta_real, "tropical")
+        return items, await interpretador._generar_narrativa_por_parrafos(items, "femenino", "tropical")
+
+    items, narrativa = asyncio.run(escenario())
+    assert narrativa.split("\n\n") == ["Párrafo"] * len(items)
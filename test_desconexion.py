@@ -0,0 +1,55 @@
+"""
+Tests de la cancelación del trabajo cuando el cliente cierra la conexión a mitad de /interpretar.
+"""
+
+import json
+import time
+import asyncio
+
+import app as app_module
+from resiliencia import get_resilience_stats
+
+
+def test_desconexion_cancela_la_narrativa_en_curso(interpretador, fake_llm, carta_real, monkeypatch):
+    fake_llm.latency = 2.0
+    monkeypatch.setattr(app_module, "interpretador", interpretador)
+    cuerpo = json.dumps({"carta_natal": {"nombre": "Test", **carta_real}, "genero": "femenino"}).encode()
+    enviados = []
+    desconexion = {}
+
+    async def escenario():
+        mensajes = [{"type": "http.request", "body": cuerpo, "more_body": False}]
+
+        async def receive():
+            if mensajes:
+                return mensajes.pop(0)
+            # El navegador cierra la pestaña mientras el LLM genera la narrativa
+            while fake_llm.request_count == 0:
+                await asyncio.sleep(0.05)
+            await asyncio.sleep(0.1)
+            desconexion["instante"] = time.monotonic()
+            return {"type": "http.disconnect"}
+
+        async def send(mensaje):
+            enviados.append(mensaje)
+
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+            "scheme": "http", "path": "/interpretar", "raw_path": b"/interpretar", "query_string": b"",
+            "root_path": "", "headers": [(b"content-type", b"application/json")],
+            "client": ("test", 1), "server": ("test", 80),
+        }
+        await app_module.app(scope, receive, send)
+        return time.monotonic() - desconexion["instante"]
+
+    demora = asyncio.run(escenario())
+    # La respuesta del LLM tardaría 2s: el endpoint termina apenas se cancela
+    assert demora < 0.5
+    assert enviados[0]["status"] == 499
+    assert fake_llm.request_count == 1
+
+    cancelaciones = app_module._cancellation_stats()
+    assert cancelaciones["client_disconnects"] == 1
+    assert cancelaciones["llm_calls_cancelled"] == 1
+    assert cancelaciones["single_flight_cancelled"] == 1
+    assert sum(r["successes"] for r in get_resilience_stats().values()) == 0
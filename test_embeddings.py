@@ -0,0 +1,38 @@
+"""
+Tests del backend de embeddings local (sin red) y de la caché de embeddings de consulta.
+"""
+
+from embeddings import EmbeddingConCache, EmbeddingNgramLocal
+from indices_rag import describir_embeddings
+
+
+def test_backend_local_ordena_por_similitud_y_cachea_consultas():
+    modelo = EmbeddingConCache(EmbeddingNgramLocal(dimension=512), max_entradas=1)
+    sol = modelo.get_text_embedding("# Sol en Aries\nImpulso y coraje.")
+    luna = modelo.get_text_embedding("# Luna en Tauro\nCalma y sensualidad.")
+
+    consulta = modelo.get_query_embedding("sol en aries")
+    assert modelo.similarity(consulta, sol) > modelo.similarity(consulta, luna)
+    # Determinista y sin tildes: mismo vector en otro proceso o escrito sin acento
+    assert EmbeddingNgramLocal(dimension=512).get_query_embedding("Plutón") == \
+        EmbeddingNgramLocal(dimension=512).get_query_embedding("pluton")
+
+    assert modelo.get_query_embedding("sol en aries") == consulta
+    modelo.get_query_embedding("luna en tauro")
+    modelo.get_query_embedding("sol en aries")
+    assert modelo.stats()["hits"] == 1 and modelo.stats()["misses"] == 3
+    assert modelo.stats()["entries"] == 1
+    # La huella del artefacto identifica al backend, no a la caché
+    assert describir_embeddings(modelo) == "EmbeddingNgramLocal:ngram-hash-3-5-d512"
+
+
+def test_backend_local_no_requiere_openai_key(fake_llm, monkeypatch, tmp_path):
+    monkeypatch.setenv("NARRATIVE_CACHE_PATH", str(tmp_path / "narrativas.sqlite3"))
+    monkeypatch.setenv("BASETEN_API_KEY", "test")
+    monkeypatch.setenv("BASETEN_BASE_URL", fake_llm.base_url)
+    monkeypatch.setenv("EMBEDDING_BACKEND", "local")
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    from interpretador_refactored import InterpretadorRAG
+
+    interpretador = InterpretadorRAG()
+    assert interpretador.openai_key is None
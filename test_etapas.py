@@ -0,0 +1,41 @@
+"""
+Tests de la configuración de modelo por etapa del pipeline y de sus métricas de latencia.
+"""
+
+import asyncio
+
+import pytest
+
+from etapas import ETAPA_CALENDARIO, get_stage_stats, reset_metricas_etapas
+
+
+@pytest.fixture
+def etapas_configuradas(monkeypatch):
+    """Modelo grande para la narrativa y uno chico para calendario (antes de crear el interpretador)."""
+    monkeypatch.setenv("LLM_STAGE_NARRATIVA_MODEL", "modelo-grande")
+    monkeypatch.setenv("LLM_STAGE_NARRATIVA_TEMPERATURE", "0.3")
+    monkeypatch.setenv("LLM_STAGE_NARRATIVA_MAX_TOKENS", "3000")
+    monkeypatch.setenv("LLM_STAGE_CALENDARIO_MODEL", "modelo-chico")
+    monkeypatch.setenv("LLM_STAGE_CALENDARIO_MAX_TOKENS", "300")
+    reset_metricas_etapas()
+    yield
+    reset_metricas_etapas()
+
+
+def test_cada_etapa_usa_su_modelo_temperatura_y_tope(etapas_configuradas, interpretador, fake_llm, carta_real):
+    fake_llm.responder = lambda prompt: "Narrativa " * 100
+
+    asyncio.run(interpretador.generar_interpretacion_completa(carta_real, "femenino", "tropical", "completa"))
+    interpretador._llm_para_etapa(ETAPA_CALENDARIO).complete("luna nueva en casa 1 natal")
+
+    narrativa, calendario = fake_llm.requests
+    assert (narrativa["model"], narrativa["temperature"]) == ("modelo-grande", 0.3)
+    # El presupuesto adaptativo nunca supera el tope de la etapa
+    assert narrativa["max_tokens"] <= 3000
+    assert (calendario["model"], calendario["temperature"], calendario["max_tokens"]) == ("modelo-chico", 0.0, 300)
+
+    stats = get_stage_stats()
+    assert stats["narrativa"]["model"] == "modelo-grande"
+    assert stats["narrativa"]["calls"] == 1 and stats["calendario"]["calls"] == 1
+    assert stats["calendario"]["latency_p95"] is not None
+    assert stats["extraccion"]["calls"] == 0
@@ -0,0 +1,83 @@
+"""
+Tests del artefacto de índices RAG: se construye una vez y después se carga de disco sin embeber.
+"""
+
+from typing import List
+
+import pytest
+from llama_index.core import Settings
+from llama_index.core.embeddings import MockEmbedding
+
+from indices_rag import archivos_corpus, cargar_o_construir, filtro_tipo_carta
+
+
+class EmbeddingContado(MockEmbedding):
+    """Embeddings falsos que cuentan los textos embebidos (en producción, llamadas a OpenAI)."""
+
+    textos: int = 0
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        self.textos += len(texts)
+        return super()._get_text_embeddings(texts)
+
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    (tmp_path / "data" / "draco").mkdir(parents=True)
+    (tmp_path / "data" / "1 - sol.md").write_text("# Sol en Aries\nImpulso y coraje.\n", encoding="utf-8")
+    (tmp_path / "data" / "2 - luna.md").write_text("# Luna en Tauro\nCalma y sensualidad.\n", encoding="utf-8")
+    (tmp_path / "data" / "draco" / "1 - draco.md").write_text("# Sol dracónico en Leo\nBrillo.\n", encoding="utf-8")
+    modelo = EmbeddingContado(embed_dim=8)
+    monkeypatch.setattr(Settings, "_embed_model", modelo)
+    return tmp_path, modelo
+
+
+def test_segundo_arranque_carga_de_disco_sin_embeber(corpus):
+    raiz, modelo = corpus
+    tropical, draco = archivos_corpus(str(raiz / "data"))
+
+    indice, reporte = cargar_o_construir(tropical, draco, str(raiz / "indices"))
+    embebidos = modelo.textos
+    assert reporte["source"] == "built" and embebidos > 0
+    assert reporte["chart_types"] == ["tropical", "draco"]
+
+    indice, reporte = cargar_o_construir(tropical, draco, str(raiz / "indices"))
+    assert reporte["source"] == "artifact"
+    assert reporte["build_seconds"] is not None and reporte["load_seconds"] is not None
+    assert modelo.textos == embebidos
+    nodos = indice.as_retriever(similarity_top_k=3).retrieve("Sol en Aries")
+    assert any("Impulso" in nodo.get_content() for nodo in nodos)
+
+
+def test_corpus_editado_invalida_el_artefacto(corpus):
+    raiz, modelo = corpus
+    tropical, draco = archivos_corpus(str(raiz / "data"))
+    _, primero = cargar_o_construir(tropical, draco, str(raiz / "indices"))
+
+    (raiz / "data" / "2 - luna.md").write_text("# Luna en Tauro\nCalma, sensualidad y constancia.\n", encoding="utf-8")
+    _, segundo = cargar_o_construir(tropical, draco, str(raiz / "indices"))
+
+    assert segundo["source"] == "built"
+    assert segundo["fingerprint"] != primero["fingerprint"]
+    # Solo el chunk editado se vuelve a embeber
+    assert primero["chunks_embedded"] == 3 and primero["chunks_reused"] == 0
+    assert (segundo["chunks_reused"], segundo["chunks_embedded"], segundo["chunks_removed"]) == (2, 1, 1)
+    assert modelo.textos == 4
+    # Solo queda el artefacto vigente
+    assert [p.name for p in (raiz / "indices").iterdir()] == [segundo["fingerprint"]]
+
+
+def test_cada_chunk_se_embebe_una_vez_y_se_filtra_por_tipo(corpus):
+    raiz, modelo = corpus
+    tropical, draco = archivos_corpus(str(raiz / "data"))
+    indice, reporte = cargar_o_construir(tropical, draco, str(raiz / "indices"))
+
+    # Un nodo por archivo: nada se embebe dos veces para los motores tropical y dracónico
+    assert reporte["nodes"] == modelo.textos == 3
+
+    draco_nodos = indice.as_retriever(similarity_top_k=3, filters=filtro_tipo_carta("draco")).retrieve("Sol")
+    assert [n.metadata["chart_type"] for n in draco_nodos] == ["draco"]
+    tropical_nodos = indice.as_retriever(similarity_top_k=3, filters=filtro_tipo_carta("tropical")).retrieve("Sol")
+    assert len(tropical_nodos) == 2 and all(n.metadata["chart_type"] == "tropical" for n in tropical_nodos)
+    # La etiqueta no entra en el texto embebido
+    assert "chart_type" not in draco_nodos[0].node.get_content(metadata_mode="embed")
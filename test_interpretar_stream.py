@@ -0,0 +1,105 @@
+"""
+Tests del endpoint SSE /interpretar/stream contra el LLM local falso.
+"""
+
+import json
+import time
+import asyncio
+
+import httpx
+
+import app as app_module
+
+
+def _parsear_sse(cuerpo: str):
+    eventos = []
+    for bloque in cuerpo.strip().split("\n\n"):
+        lineas = dict(linea.split(": ", 1) for linea in bloque.split("\n"))
+        eventos.append((lineas["event"], json.loads(lineas["data"])))
+    return eventos
+
+
+def test_stream_envia_items_tokens_y_fin(interpretador, fake_llm, carta_real, monkeypatch):
+    fake_llm.responder = lambda prompt: "**Tu Sol en Capricornio** es una promesa de estructura."
+    monkeypatch.setattr(app_module, "interpretador", interpretador)
+
+    async def escenario():
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/interpretar/stream", json={
+                "carta_natal": {"nombre": "Test", **carta_real},
+                "genero": "masculino",
+                "tipo": "tropical",
+            }, timeout=30)
+
+    respuesta = asyncio.run(escenario())
+    assert respuesta.status_code == 200
+    assert respuesta.headers["content-type"].startswith("text/event-stream")
+
+    eventos = _parsear_sse(respuesta.text)
+    assert eventos[0][0] == "interpretaciones_individuales"
+    assert any(item["titulo"] == "Sol en Capricornio" for item in eventos[0][1])
+
+    tokens = [datos["delta"] for evento, datos in eventos if evento == "token"]
+    assert len(tokens) > 1
+    assert "".join(tokens) == "**Tu Sol en Capricornio** es una promesa de estructura."
+
+    evento_final, datos_finales = eventos[-1]
+    assert evento_final == "fin"
+    assert datos_finales["tiempo_primer_token"] <= datos_finales["tiempo_generacion"]
+    assert fake_llm.requests[-1]["stream"] is True
+
+
+def _stream(interpretador, carta_real, monkeypatch, **extra):
+    monkeypatch.setattr(app_module, "interpretador", interpretador)
+
+    async def escenario():
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/interpretar/stream", json={
+                "carta_natal": {"nombre": "Test", **carta_real},
+                "genero": "femenino",
+                "tipo": "tropical",
+                **extra,
+            }, timeout=30)
+
+    return _parsear_sse(asyncio.run(escenario()).text)
+
+
+def test_stream_respeta_modo_narrativa(interpretador, fake_llm, carta_real, monkeypatch):
+    eventos = _stream(interpretador, carta_real, monkeypatch, modo_narrativa="plantilla")
+
+    tokens = [datos["delta"] for evento, datos in eventos if evento == "token"]
+    assert len(tokens) == 1 and tokens[0]
+    assert eventos[-1][0] == "fin" and eventos[-1][1]["degradada"] is False
+    # La plantilla no llama al LLM
+    assert fake_llm.request_count == 0
+
+
+def test_stream_se_corta_con_max_latency_ms(interpretador, fake_llm, carta_real, monkeypatch):
+    fake_llm.chunk_delay = 0.02
+    fake_llm.responder = lambda prompt: "**Tu Sol** primero.\n\n" + "sigue " * 200
+
+    inicio = time.perf_counter()
+    eventos = _stream(interpretador, carta_real, monkeypatch, max_latency_ms=800)
+    demora = time.perf_counter() - inicio
+
+    assert demora < 1.0
+    tokens = [datos["delta"] for evento, datos in eventos if evento == "token"]
+    assert tokens and "".join(tokens).startswith("**Tu Sol** primero.")
+    evento_final, datos_finales = eventos[-1]
+    assert evento_final == "fin"
+    assert datos_finales["degradada"] is True
+    assert datos_finales["motivo_degradacion"] == "parcial:sin_tiempo"
+    # Lo cortado no se guarda en caché
+    assert interpretador.cache_narrativas.stats()["entries"] == 0
+
+
+def test_stream_con_plantilla_si_no_llega_ningun_token(interpretador, fake_llm, carta_real, monkeypatch):
+    fake_llm.latency = 2.0
+
+    eventos = _stream(interpretador, carta_real, monkeypatch, max_latency_ms=500)
+
+    tokens = [datos["delta"] for evento, datos in eventos if evento == "token"]
+    assert len(tokens) == 1 and tokens[0]
+    assert eventos[-1][1]["motivo_degradacion"] == "plantilla:sin_tiempo"
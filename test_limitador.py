@@ -0,0 +1,172 @@
+"""
+Tests del limitador de concurrencia adaptativo (AIMD) de las llamadas al LLM.
+"""
+
+import time
+import asyncio
+import threading
+
+import pytest
+
+from llm_client import shared_clients
+from limitador import LimitadorAdaptativo, LimitadorSaturadoError, get_limitador, reset_limitador
+from interpretador_refactored import BasetenLLM
+
+
+def test_limita_la_concurrencia_hacia_el_proveedor(fake_llm, monkeypatch):
+    monkeypatch.setenv("LLM_CONCURRENCY_NATAL_INITIAL", "4")
+    monkeypatch.setenv("LLM_CONCURRENCY_NATAL_MAX", "4")
+    reset_limitador()
+    activos = {"ahora": 0, "maximo": 0}
+    lock = threading.Lock()
+
+    def responder(prompt):
+        with lock:
+            activos["ahora"] += 1
+            activos["maximo"] = max(activos["maximo"], activos["ahora"])
+        time.sleep(0.2)
+        with lock:
+            activos["ahora"] -= 1
+        return "ok"
+
+    fake_llm.responder = responder
+    llm = BasetenLLM(api_key="test", base_url=fake_llm.base_url)
+
+    async def escenario():
+        await asyncio.gather(*[llm.acomplete(f"p{i}") for i in range(12)])
+        await shared_clients.aclose_all()
+
+    asyncio.run(escenario())
+    stats = get_limitador().stats()
+    assert activos["maximo"] == 4
+    assert stats["queued"] >= 8 and stats["queue_depth"] == 0 and stats["in_flight"] == 0
+    assert stats["wait_max_seconds"] > 0.1
+
+
+def test_aimd_reduce_ante_sobrecarga_y_crece_con_exitos():
+    limitador = LimitadorAdaptativo(inicial=10, minimo=2, maximo=12, max_cola=10)
+    primero = limitador.adquirir_sync()
+    segundo = limitador.adquirir_sync()
+    limitador.liberar(primero, TimeoutError())
+    assert limitador.stats()["limit_exact"] == 7.0
+    # Misma "época": el segundo fallo no vuelve a reducir
+    limitador.liberar(segundo, TimeoutError())
+    assert limitador.stats()["decreases"] == 1
+
+    for _ in range(8):  # +1/límite por éxito: ~una unidad por "ventana" completa
+        limitador.liberar(limitador.adquirir_sync())
+    assert limitador.stats()["limit"] == 8
+
+    # Los errores que no son de sobrecarga (p.ej. un 400) no tocan el límite
+    limitador.liberar(limitador.adquirir_sync(), ValueError("prompt inválido"))
+    assert limitador.stats()["decreases"] == 1
+
+
+def test_cola_acotada_y_deadline():
+    limitador = LimitadorAdaptativo(inicial=1, minimo=1, maximo=1, max_cola=1)
+
+    async def escenario():
+        ocupado = await limitador.adquirir()
+        en_cola = asyncio.create_task(limitador.adquirir())
+        await asyncio.sleep(0.01)
+        assert limitador.stats()["queue_depth"] == 1
+        with pytest.raises(LimitadorSaturadoError):
+            await limitador.adquirir()
+        limitador.liberar(ocupado)
+        limitador.liberar(await en_cola)
+
+    asyncio.run(escenario())
+    assert limitador.stats()["rejected"] == 1
+
+    ocupado = limitador.adquirir_sync()
+    inicio = time.monotonic()
+    with pytest.raises(LimitadorSaturadoError):
+        limitador.adquirir_sync(deadline=time.monotonic() + 0.1)
+    assert time.monotonic() - inicio < 0.5
+    limitador.liberar(ocupado)
+    assert limitador.stats()["in_flight"] == 0 and limitador.stats()["queue_depth"] == 0
+
+
+def test_hilos_y_corutinas_comparten_la_cola():
+    limitador = LimitadorAdaptativo(inicial=1, minimo=1, maximo=1, max_cola=10)
+    ocupado = limitador.adquirir_sync()
+    orden = []
+
+    def en_hilo():
+        with limitador.permiso_sync():
+            orden.append("hilo")
+
+    hilo = threading.Thread(target=en_hilo)
+    hilo.start()
+    time.sleep(0.05)
+
+    async def escenario():
+        async def en_corutina():
+            async with limitador.permiso():
+                orden.append("corutina")
+        tarea = asyncio.create_task(en_corutina())
+        await asyncio.sleep(0.05)
+        limitador.liberar(ocupado)
+        await tarea
+
+    asyncio.run(escenario())
+    hilo.join()
+    assert orden == ["hilo", "corutina"]
+
+
+def test_cancelaciones_liberan_sin_ajustar_el_limite():
+    from planificador import TareaCanceladaError
+    limitador = LimitadorAdaptativo(inicial=4, minimo=1, maximo=8, max_cola=10)
+
+    async def cancelada():
+        async with limitador.permiso():
+            await asyncio.sleep(10)
+
+    async def escenario():
+        tarea = asyncio.ensure_future(cancelada())
+        await asyncio.sleep(0.01)
+        tarea.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await tarea
+
+    asyncio.run(escenario())
+    with pytest.raises(TareaCanceladaError):
+        with limitador.permiso_sync():
+            raise TareaCanceladaError("cliente desconectado")
+
+    stats = limitador.stats()
+    assert stats["limit_exact"] == 4.0 and stats["increases"] == 0 and stats["decreases"] == 0
+    assert stats["cancelled"] == 2 and stats["in_flight"] == 0
+
+
+def test_una_llamada_corta_lenta_reduce_con_el_umbral_de_su_etapa(fake_llm, monkeypatch):
+    # El umbral global (180s) nunca se alcanzaría con una extracción: manda el de la etapa
+    monkeypatch.setenv("LLM_STAGE_EXTRACCION_LATENCY_THRESHOLD", "0.1")
+    reset_limitador()
+    fake_llm.latency = 0.3
+    fake_llm.responder = lambda prompt: "ok"
+    extraccion = BasetenLLM(api_key="test", base_url=fake_llm.base_url, etapa="extraccion")
+    narrativa = BasetenLLM(api_key="test", base_url=fake_llm.base_url, etapa="narrativa")
+
+    async def escenario():
+        await narrativa.acomplete("narrativa")
+        reducciones_narrativa = get_limitador().stats()["decreases"]
+        await extraccion.acomplete("extraccion")
+        await shared_clients.aclose_all()
+        return reducciones_narrativa
+
+    assert asyncio.run(escenario()) == 0
+    assert get_limitador().stats()["decreases"] == 1
+
+
+def test_umbral_por_permiso_sobre_el_global():
+    limitador = LimitadorAdaptativo(inicial=4, minimo=1, maximo=8, umbral_latencia=180.0)
+    permiso = limitador.adquirir_sync(umbral_latencia=0.05)
+    time.sleep(0.1)
+    limitador.liberar(permiso)
+    assert limitador.stats()["decreases"] == 1
+    # Sin umbral propio rige el global: la misma latencia es sana
+    permiso = limitador.adquirir_sync()
+    time.sleep(0.1)
+    limitador.liberar(permiso)
+    assert limitador.stats()["decreases"] == 1
@@ -0,0 +1,112 @@
+"""
+Tests del cliente LLM compartido (pool de conexiones) contra un servidor local falso.
+Ejecutar con: python -m pytest -q test_llm_client.py
+"""
+
+import time
+import asyncio
+
+import pytest
+
+from fake_llm_server import FakeLLMServer
+from llm_client import shared_clients, get_pool_stats
+from resiliencia import ErrorLLM, reset_resiliencia
+from interpretador_refactored import BasetenLLM
+
+
+@pytest.fixture(autouse=True)
+def limpiar_clientes(monkeypatch):
+    monkeypatch.setenv("LLM_MAX_RETRIES", "0")
+    shared_clients.close_all()
+    reset_resiliencia()
+    yield
+    shared_clients.close_all()
+    reset_resiliencia()
+
+
+def test_rewriter_y_rag_comparten_cliente():
+    with FakeLLMServer() as server:
+        rewriter = BasetenLLM(api_key="test", base_url=server.base_url, max_tokens=16000)
+        rag = BasetenLLM(api_key="test", base_url=server.base_url, temperature=0.0)
+        assert rewriter._get_client() is rag._get_client()
+
+        rewriter.complete("hola")
+        rag.complete("hola de nuevo")
+
+        stats = get_pool_stats()
+        assert len(stats["pools"]) == 1
+        pool = stats["pools"][0]
+        assert pool["base_url"] == server.base_url
+        # Keep-alive: ambas llamadas reutilizan una sola conexión
+        assert pool["connections"] == 1
+        assert pool["idle"] == 1
+
+
+def test_timeout_por_llamada():
+    with FakeLLMServer(latency=1.0) as server:
+        llm = BasetenLLM(api_key="test", base_url=server.base_url, request_timeout=0.2)
+        with pytest.raises(ErrorLLM):
+            llm.complete("prompt lento")
+
+        respuesta = llm.complete("prompt lento", timeout=5.0)
+        assert respuesta.text.startswith("Respuesta simulada")
+
+
+def test_acomplete_concurrente_sin_hilos(monkeypatch):
+    def complete_prohibido(self, prompt, **kwargs):
+        raise AssertionError("acomplete no debe delegar en complete() vía executor")
+
+    monkeypatch.setattr(BasetenLLM, "complete", complete_prohibido)
+
+    async def escenario():
+        with FakeLLMServer(latency=0.5) as server:
+            llm = BasetenLLM(api_key="test", base_url=server.base_url)
+            inicio = time.monotonic()
+            respuestas = await asyncio.gather(*[llm.acomplete(f"prompt {i}") for i in range(40)])
+            transcurrido = time.monotonic() - inicio
+            await shared_clients.aclose_all()
+            return respuestas, transcurrido
+
+    respuestas, transcurrido = asyncio.run(escenario())
+    assert all(r.text.startswith("Respuesta simulada") for r in respuestas)
+    assert transcurrido < 3.0
+
+
+def test_acomplete_deadline_y_cancelacion():
+    async def escenario():
+        with FakeLLMServer(latency=2.0) as server:
+            llm = BasetenLLM(api_key="test", base_url=server.base_url)
+
+            inicio = time.monotonic()
+            with pytest.raises(ErrorLLM):
+                await llm.acomplete("lento", deadline=time.monotonic() + 0.3)
+            assert time.monotonic() - inicio < 1.5
+
+            tarea = asyncio.create_task(llm.acomplete("lento"))
+            await asyncio.sleep(0.2)
+            tarea.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await tarea
+            await shared_clients.aclose_all()
+
+    asyncio.run(escenario())
+
+
+def test_astream_complete_entrega_tokens():
+    async def escenario():
+        with FakeLLMServer(responder=lambda p: "uno dos tres cuatro") as server:
+            llm = BasetenLLM(api_key="test", base_url=server.base_url)
+            deltas = [r.delta async for r in llm.astream_complete("hola")]
+            await shared_clients.aclose_all()
+            return deltas
+
+    deltas = asyncio.run(escenario())
+    assert deltas == ["uno", " dos", " tres", " cuatro"]
+
+
+def test_stream_complete_sincronico():
+    with FakeLLMServer(responder=lambda p: "uno dos tres") as server:
+        llm = BasetenLLM(api_key="test", base_url=server.base_url)
+        respuestas = list(llm.stream_complete("hola"))
+    assert [r.delta for r in respuestas] == ["uno", " dos", " tres"]
+    assert respuestas[-1].text == "uno dos tres"
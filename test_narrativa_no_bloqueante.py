@@ -0,0 +1,43 @@
+"""
+Regresión: la generación narrativa no debe congelar el event loop de uvicorn.
+Mientras una narrativa lenta corre contra el LLM falso, /health debe seguir respondiendo.
+"""
+
+import time
+import asyncio
+
+import httpx
+
+import app as app_module
+
+
+def test_health_responde_durante_narrativa_lenta(interpretador, fake_llm, carta_real, monkeypatch):
+    fake_llm.latency = 2.0
+    monkeypatch.setattr(app_module, "interpretador", interpretador)
+
+    async def escenario():
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            narrativa = asyncio.create_task(client.post("/interpretar", json={
+                "carta_natal": {"nombre": "Test", **carta_real},
+                "genero": "femenino",
+                "tipo": "tropical",
+            }, timeout=30))
+            await asyncio.sleep(0.3)
+
+            latencias = []
+            for _ in range(5):
+                inicio = time.monotonic()
+                health = await client.get("/health")
+                latencias.append(time.monotonic() - inicio)
+                assert health.status_code == 200
+                await asyncio.sleep(0.1)
+
+            assert not narrativa.done()
+            respuesta = await narrativa
+            return latencias, respuesta
+
+    latencias, respuesta = asyncio.run(escenario())
+    assert max(latencias) < 0.5
+    assert respuesta.status_code == 200
+    assert respuesta.json()["interpretacion_narrativa"].startswith("Respuesta simulada")
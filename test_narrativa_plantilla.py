@@ -0,0 +1,45 @@
+"""
+Tests de la narrativa determinista por plantillas (modo_narrativa="plantilla").
+"""
+
+import time
+import asyncio
+
+from narrativa_plantilla import concordar_genero, generar_narrativa_plantilla, recortar_oraciones
+
+
+def test_concordancia_de_genero():
+    texto = "Eres optimista y generoso en lo afectivo. Te sientes atraído por el arte y eres el centro de atención."
+    femenino = concordar_genero(texto, "femenino")
+    assert "optimista y generosa en lo afectivo" in femenino
+    assert "Te sientes atraída" in femenino
+    assert "el centro de atención" in femenino
+    assert concordar_genero(texto, "masculino") == texto
+    assert concordar_genero("Eres muy curioso, intuitivo y leal.", "femenino") == "Eres muy curiosa, intuitiva y leal."
+
+
+def test_recorte_por_profundidad():
+    texto = "Primera oración. Segunda oración. Tercera oración."
+    assert recortar_oraciones(texto, 2) == "Primera oración. Segunda oración."
+    assert recortar_oraciones(texto) == texto
+
+
+def test_plantilla_sin_llamadas_al_llm(interpretador, fake_llm, carta_real):
+    async def escenario():
+        inicio = time.perf_counter()
+        resultado = await interpretador.generar_interpretacion_completa(carta_real, "femenino", "tropical", "plantilla")
+        return resultado, time.perf_counter() - inicio
+
+    resultado, demora = asyncio.run(escenario())
+    narrativa = resultado["interpretacion_narrativa"]
+    items = resultado["interpretaciones_individuales"]
+
+    assert fake_llm.request_count == 0
+    assert demora < 1.0
+    assert narrativa.startswith("Empecemos") or narrativa.startswith("El Sol, la Luna")
+    assert "**Tu Sol en Capricornio.**" in narrativa
+    assert narrativa.count("**") == 2 * len(items)
+    # Determinista: la misma carta produce el mismo texto
+    assert narrativa == generar_narrativa_plantilla(items, "femenino", "tropical")
+    breve = generar_narrativa_plantilla(items, "femenino", "tropical", "breve")
+    assert len(breve) < len(narrativa)
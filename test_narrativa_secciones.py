@@ -0,0 +1,89 @@
+"""
+Tests de la narrativa por secciones en paralelo (modo_narrativa="secciones").
+"""
+
+import re
+import time
+import asyncio
+
+import pytest
+
+from narrativa_secciones import agrupar_en_secciones, clasificar_item
+from resiliencia import ErrorLLM
+
+
+def test_clasificacion_de_items():
+    assert clasificar_item({"titulo": "Sol en Capricornio", "tipo": "PlanetaEnSigno"}) == "luminares"
+    assert clasificar_item({"titulo": "Ascendente en Cáncer", "tipo": "AnguloEnSigno"}) == "luminares"
+    assert clasificar_item({"titulo": "Marte en Virgo", "tipo": "PlanetaEnSigno"}) == "planetas"
+    assert clasificar_item({"titulo": "Sol en Casa 6", "tipo": "PlanetaEnCasa"}) == "casas"
+    assert clasificar_item({"titulo": "Sol Cuadratura a Saturno", "tipo": "Aspecto"}) == "aspectos"
+    assert clasificar_item({"titulo": "Luna Dracónico en Tauro",
+                            "tipo": "Draconica ['draconica', 'planeta', 'moon']"}) == "luminares"
+    assert clasificar_item({"titulo": "Casa 1 Dracónica en Casa 12 Trópica",
+                            "tipo": "Draconica ['draconica', 'casa', 'superposicion']"}) == "casas"
+    assert clasificar_item({"titulo": "Venus Dracónico Conjuncion Marte Trópico",
+                            "tipo": "Draconica ['draconica', 'contacto', 'Conjunction']"}) == "contactos_draconicos"
+
+
+def test_secciones_en_orden_y_sin_vacias():
+    items = [
+        {"titulo": "Sol en Casa 6", "tipo": "PlanetaEnCasa"},
+        {"titulo": "Marte en Virgo", "tipo": "PlanetaEnSigno"},
+        {"titulo": "Sol en Capricornio", "tipo": "PlanetaEnSigno"},
+    ]
+    secciones = agrupar_en_secciones(items)
+    assert [clave for clave, _, _ in secciones] == ["luminares", "planetas", "casas"]
+
+
+def test_secciones_se_generan_en_paralelo(interpretador, fake_llm, carta_real):
+    fake_llm.latency = 1.0
+    fake_llm.responder = lambda prompt: "Sección " + re.search(r"sección '([^']+)'", prompt).group(1)
+
+    async def escenario():
+        inicio = time.monotonic()
+        resultado = await interpretador.generar_interpretacion_completa(
+            carta_real, genero="femenino", tipo_carta="tropical", modo_narrativa="secciones")
+        return resultado, time.monotonic() - inicio
+
+    resultado, transcurrido = asyncio.run(escenario())
+    assert resultado["interpretacion_narrativa"].split("\n\n") == [
+        "Sección Luminares y Ascendente", "Sección Planetas en signos", "Sección Casas"]
+    assert fake_llm.request_count == 3
+    # En paralelo: ~1 sección de latencia, no la suma de las tres
+    assert transcurrido < 2.5
+
+
+def test_si_una_seccion_falla_se_cancelan_las_demas(interpretador):
+    canceladas = []
+
+    class LLMFalso:
+        max_tokens = 4096
+
+        async def acomplete(self, prompt, **kwargs):
+            if "sección 'Casas'" in prompt:
+                await asyncio.sleep(0.05)
+                raise ErrorLLM("fallo de la sección")
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                canceladas.append(prompt)
+                raise
+
+    interpretador.llm_rewriter = LLMFalso()
+    items = [
+        {"titulo": "Sol en Capricornio", "tipo": "PlanetaEnSigno", "interpretacion": "Texto del Sol"},
+        {"titulo": "Marte en Virgo", "tipo": "PlanetaEnSigno", "interpretacion": "Texto de Marte"},
+        {"titulo": "Sol en Casa 6", "tipo": "PlanetaEnCasa", "interpretacion": "Texto de la casa"},
+    ]
+
+    async def escenario():
+        inicio = time.monotonic()
+        with pytest.raises(ErrorLLM):
+            await interpretador._generar_narrativa_por_secciones(items, "femenino")
+        # Al propagarse el error las otras secciones ya están canceladas (no al cerrar el loop)
+        return time.monotonic() - inicio, len(canceladas)
+
+    transcurrido, canceladas_al_fallar = asyncio.run(escenario())
+    assert transcurrido < 1.0
+    assert canceladas_al_fallar == 2
@@ -0,0 +1,80 @@
+"""
+Tests de la pre-generación offline de párrafos y del modo narrativo "pregenerada".
+"""
+
+import json
+import asyncio
+
+from parrafos_pregenerados import (
+    ParrafosPregenerados, cargar_vocabulario, clave_pregenerada, pregenerar
+)
+
+
+def _responder(prompt: str) -> str:
+    if "frases de transición" in prompt:
+        cantidad = int(prompt.split("Escribe exactamente ")[1].split(" ")[0])
+        return "\n".join(f"Transición {n}." for n in range(1, cantidad + 1))
+    return f"Párrafo pre-generado ({len(prompt)})"
+
+
+def test_vocabulario_cubre_natal_y_draco():
+    vocabulario = cargar_vocabulario()
+    tipos = {item["tipo_carta"] for item in vocabulario}
+    assert tipos == {"tropical", "draco"}
+    assert sum(1 for item in vocabulario if item["tipo_carta"] == "tropical") > 500
+    assert sum(1 for item in vocabulario if item["tipo_carta"] == "draco") > 400
+
+
+def test_pregeneracion_reanudable(interpretador, fake_llm, tmp_path):
+    fake_llm.responder = _responder
+    vocabulario = cargar_vocabulario()[:10]
+    salida = str(tmp_path / "parrafos.json.gz")
+
+    # Primera corrida: las 5 primeras llamadas fallan y quedan pendientes
+    fake_llm.fail_first = 5
+    fake_llm.error_status = 400  # error no reintentable
+    resumen = asyncio.run(pregenerar(interpretador, salida, vocabulario, concurrencia=4))
+    assert resumen["total"] == 20 and resumen["errores"] == 5
+    assert (tmp_path / "parrafos.json.gz.parcial.jsonl").exists()
+
+    # Reanudación: solo se piden las 5 que faltaban
+    llamadas = fake_llm.request_count
+    resumen = asyncio.run(pregenerar(interpretador, salida, vocabulario, concurrencia=4))
+    assert resumen == {**resumen, "generados": 5, "reanudados": 15, "errores": 0}
+    assert fake_llm.request_count - llamadas == 5
+    assert not (tmp_path / "parrafos.json.gz.parcial.jsonl").exists()
+
+    artefacto = ParrafosPregenerados.cargar(salida, modelo=interpretador.llm_rewriter.model)
+    assert len(artefacto) == 20
+    item = vocabulario[0]
+    assert artefacto.get(item["interpretacion"], "masculino", item["tipo_carta"]).startswith("Párrafo pre-generado")
+    assert ParrafosPregenerados.cargar(salida, prompt_version="otra-version") is None
+
+
+def test_modo_pregenerada_una_sola_llamada(interpretador, fake_llm, carta_real, tmp_path):
+    fake_llm.responder = _responder
+
+    async def escenario():
+        items = await interpretador._obtener_interpretaciones_individuales(carta_real, "tropical")
+        vocabulario = [{**item, "tipo_carta": "tropical", "clave_mapa": item["titulo"]} for item in items[:-1]]
+        salida = str(tmp_path / "parrafos.json.gz")
+        await pregenerar(interpretador, salida, vocabulario, generos=("femenino",))
+        interpretador.parrafos_pregenerados = ParrafosPregenerados.cargar(salida)
+        interpretador.cache_parrafos = None
+
+        llamadas = fake_llm.request_count
+        narrativa = await interpretador._generar_narrativa_por_parrafos(items, "femenino", "tropical", generar_faltantes=False)
+        return items, narrativa, fake_llm.request_count - llamadas
+
+    items, narrativa, llamadas = asyncio.run(escenario())
+    assert llamadas == 1  # solo la pasada de transiciones
+    assert narrativa.count("Párrafo pre-generado") == len(items) - 1
+    assert items[-1]["interpretacion"] in narrativa  # el faltante usa su texto fuente
+    assert interpretador.parrafos_pregenerados.stats()["hits"] == len(items) - 1
+
+
+def test_clave_pregenerada_depende_de_genero_y_tipo():
+    base = clave_pregenerada("texto", "femenino", "tropical")
+    assert clave_pregenerada("texto", "masculino", "tropical") != base
+    assert clave_pregenerada("texto", "femenino", "draco") != base
+    assert len(base) == 24
@@ -0,0 +1,123 @@
+"""
+Tests de la planificación por clases de prioridad (calendario, natal, prefetch).
+"""
+
+import time
+import asyncio
+
+import pytest
+
+from llm_client import shared_clients
+from limitador import get_limitador, reset_limitador
+from planificador import (
+    Planificador, CALENDARIO, NATAL, PREFETCH, clase_actual, con_prioridad, cancelacion_solicitada
+)
+from interpretador_refactored import BasetenLLM
+
+
+def test_la_clase_viaja_al_pool_de_hilos():
+    planificador = Planificador(hilos={CALENDARIO: 1, NATAL: 1, PREFETCH: 1})
+
+    async def escenario():
+        with con_prioridad(PREFETCH):
+            assert clase_actual() == PREFETCH
+            calendario = await planificador.ejecutar(CALENDARIO, clase_actual)
+        assert clase_actual() == NATAL
+        return calendario, await planificador.ejecutar(NATAL, clase_actual)
+
+    assert asyncio.run(escenario()) == (CALENDARIO, NATAL)
+    assert planificador.stats()[CALENDARIO]["submitted"] == 1
+    planificador.shutdown()
+    with pytest.raises(ValueError):
+        with con_prioridad("urgente"):
+            pass
+
+
+def test_calendario_no_espera_detras_de_las_narrativas(fake_llm, monkeypatch):
+    monkeypatch.setenv("LLM_CONCURRENCY_NATAL_INITIAL", "1")
+    monkeypatch.setenv("LLM_CONCURRENCY_NATAL_MAX", "1")
+    reset_limitador()
+    planificador = Planificador(hilos={CALENDARIO: 2, NATAL: 1, PREFETCH: 1})
+
+    def responder(prompt):
+        if "narrativa" in prompt:
+            time.sleep(0.5)
+        return "ok"
+
+    fake_llm.responder = responder
+    llm = BasetenLLM(api_key="test", base_url=fake_llm.base_url)
+
+    async def escenario():
+        # Tres narrativas ocupan el único lugar natal (y su único hilo) durante ~1.5s
+        narrativas = [asyncio.create_task(llm.acomplete(f"narrativa {i}")) for i in range(3)]
+        await asyncio.sleep(0.1)
+        assert get_limitador(NATAL).stats()["queue_depth"] == 2
+        inicio = time.monotonic()
+        respuesta = await planificador.ejecutar(CALENDARIO, lambda: llm.complete("evento de calendario").text)
+        demora = time.monotonic() - inicio
+        await asyncio.gather(*narrativas)
+        await shared_clients.aclose_all()
+        return respuesta, demora
+
+    respuesta, demora = asyncio.run(escenario())
+    planificador.shutdown()
+    assert respuesta == "ok"
+    assert demora < 0.4
+    assert get_limitador(CALENDARIO).stats()["granted"] == 1
+    assert get_limitador(NATAL).stats()["granted"] == 3
+
+
+def test_cancelar_la_espera_descarta_la_cola_y_avisa_al_hilo_en_curso():
+    planificador = Planificador(hilos={CALENDARIO: 1, NATAL: 1, PREFETCH: 1})
+    ejecutadas = []
+
+    def consulta_rag(nombre):
+        ejecutadas.append(nombre)
+        # Un hilo no se puede matar: consulta la señal entre pasos (como BasetenLLM antes de llamar)
+        for _ in range(100):
+            if cancelacion_solicitada():
+                return "abandonada"
+            time.sleep(0.01)
+        return "completa"
+
+    async def escenario():
+        en_curso = asyncio.ensure_future(planificador.ejecutar(NATAL, consulta_rag, "primera"))
+        en_cola = asyncio.ensure_future(planificador.ejecutar(NATAL, consulta_rag, "segunda"))
+        await asyncio.sleep(0.1)
+        inicio = time.monotonic()
+        en_curso.cancel()
+        en_cola.cancel()
+        await asyncio.gather(en_curso, en_cola, return_exceptions=True)
+        # El único hilo queda libre enseguida para el pedido siguiente
+        siguiente = await planificador.ejecutar(NATAL, lambda: "libre")
+        return siguiente, time.monotonic() - inicio
+
+    siguiente, demora = asyncio.run(escenario())
+    stats = planificador.stats()[NATAL]
+    planificador.shutdown()
+    assert siguiente == "libre"
+    assert demora < 0.3
+    assert ejecutadas == ["primera"]
+    assert stats["cancelled_running"] == 1
+    assert stats["cancelled_queued"] == 1
+
+
+def test_rag_se_inicializa_una_sola_vez_con_busquedas_concurrentes(interpretador, monkeypatch):
+    planificador = Planificador(hilos={CALENDARIO: 8, NATAL: 1, PREFETCH: 1})
+    construcciones = []
+
+    def construir():
+        construcciones.append(1)
+        time.sleep(0.1)
+
+    monkeypatch.setattr(interpretador, "_setup_llm_and_embeddings", lambda: None)
+    monkeypatch.setattr(interpretador, "_load_and_index_documents", construir)
+
+    async def escenario():
+        await asyncio.gather(*[
+            planificador.ejecutar(CALENDARIO, interpretador._ensure_rag_initialized) for _ in range(8)
+        ])
+
+    asyncio.run(escenario())
+    assert len(construcciones) == 1 and interpretador._rag_initialized
+    planificador.shutdown()
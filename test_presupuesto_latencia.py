@@ -0,0 +1,84 @@
+"""
+Tests del presupuesto de latencia del cliente (max_latency_ms) con degradación controlada.
+"""
+
+import time
+import asyncio
+
+import pytest
+
+from interpretador_refactored import LatenciaExcedidaError
+
+
+def _generar(interpretador, carta, modo, max_latency_ms):
+    async def escenario():
+        inicio = time.perf_counter()
+        resultado = await interpretador.generar_interpretacion_completa(
+            carta, "femenino", "tropical", modo, max_latency_ms=max_latency_ms
+        )
+        return resultado, time.perf_counter() - inicio
+
+    return asyncio.run(escenario())
+
+
+def test_narrativa_parcial_si_el_stream_no_termina_a_tiempo(interpretador, fake_llm, carta_real):
+    fake_llm.chunk_delay = 0.02
+    fake_llm.responder = lambda prompt: "**Tu Sol** primero.\n\n**Tu Luna** segundo.\n\n" + "sigue " * 200
+
+    resultado, demora = _generar(interpretador, carta_real, "completa", 800)
+
+    assert demora < 1.0
+    assert resultado["degradada"] is True
+    assert resultado["motivo_degradacion"] == "parcial:sin_tiempo"
+    assert resultado["interpretacion_narrativa"] == "**Tu Sol** primero.\n\n**Tu Luna** segundo."
+    assert resultado["interpretaciones_individuales"]
+    # Lo cortado no se guarda en caché
+    assert interpretador.cache_narrativas.stats()["entries"] == 0
+
+
+def test_plantilla_si_no_hay_nada_parcial(interpretador, fake_llm, carta_real):
+    fake_llm.latency = 2.0
+
+    resultado, demora = _generar(interpretador, carta_real, "secciones", 500)
+
+    assert demora < 0.8
+    assert resultado["motivo_degradacion"] == "plantilla:sin_tiempo"
+    assert "**Tu Sol en Capricornio.**" in resultado["interpretacion_narrativa"]
+    assert interpretador.degradaciones["plantilla"] == 1
+
+
+def test_sin_degradacion_si_alcanza_el_tiempo(interpretador, fake_llm, carta_real):
+    fake_llm.responder = lambda prompt: "Narrativa completa."
+
+    resultado, _ = _generar(interpretador, carta_real, "completa", 5000)
+
+    assert resultado["degradada"] is False and resultado["motivo_degradacion"] is None
+    assert resultado["interpretacion_narrativa"] == "Narrativa completa."
+
+
+def test_error_explicito_si_ni_los_items_llegan(interpretador, fake_llm, carta_real, monkeypatch):
+    async def lento(*args):
+        await asyncio.sleep(1)
+
+    monkeypatch.setattr(interpretador, "_obtener_interpretaciones_individuales", lento)
+    with pytest.raises(LatenciaExcedidaError):
+        _generar(interpretador, carta_real, "completa", 100)
+
+
+def test_el_arranque_en_frio_del_rag_no_pasa_del_plazo(interpretador, fake_llm, carta_real, monkeypatch):
+    # Sin motor JSON se va al RAG de respaldo, cuya inicialización tarda más que el presupuesto
+    monkeypatch.setattr(interpretador, "interpretador_astrologico", None)
+    monkeypatch.setattr(interpretador, "_setup_llm_and_embeddings", lambda: time.sleep(1.5))
+    monkeypatch.setattr(interpretador, "_load_and_index_documents", lambda: None)
+
+    async def escenario():
+        inicio = time.perf_counter()
+        latido = asyncio.create_task(asyncio.sleep(0.05))
+        with pytest.raises(LatenciaExcedidaError):
+            await interpretador.generar_interpretacion_completa(carta_real, "femenino", "tropical", max_latency_ms=300)
+        demora = time.perf_counter() - inicio
+        # El loop siguió atendiendo otras corutinas durante la inicialización
+        assert latido.done()
+        return demora
+
+    assert asyncio.run(escenario()) < 0.8
@@ -0,0 +1,95 @@
+"""
+Tests del presupuesto de salida adaptativo (max_tokens y contrato de extensión por carta).
+"""
+
+import asyncio
+
+import httpx
+import pytest
+
+import app as app_module
+from presupuesto_tokens import ContextoExcedidoError, PresupuestoSalida, estimar_tokens
+
+
+def _items(cantidad: int, tipo: str = "Aspecto"):
+    return [{"titulo": f"Sol conjunción Marte {n}", "interpretacion": "Texto fuente.", "tipo": tipo} for n in range(cantidad)]
+
+
+def test_presupuesto_escala_con_la_cantidad_y_el_tipo_de_items():
+    chica = PresupuestoSalida(_items(8)).ajustar("prompt")
+    grande = PresupuestoSalida(_items(60)).ajustar("prompt")
+    luminares = PresupuestoSalida(_items(8, tipo="AnguloEnSigno")).ajustar("prompt")
+
+    assert chica.max_tokens < luminares.max_tokens < grande.max_tokens < 16000
+    assert grande.salida_prevista == pytest.approx(chica.salida_prevista * 60 / 8, rel=0.01)
+    assert "Aspectos: 3 a 5 oraciones" in chica.regla_profundidad()
+    assert "Son 60 elementos" in grande.regla_profundidad()
+    # El tope absoluto sigue aplicando a cartas enormes
+    assert PresupuestoSalida(_items(500)).ajustar("prompt", tope=4000).max_tokens == 4000
+
+
+def test_nunca_excede_la_ventana_de_contexto(monkeypatch):
+    monkeypatch.setenv("LLM_CONTEXT_WINDOW", "3000")
+    prompt = "x" * 7000  # ~2000 tokens estimados
+    assert estimar_tokens(prompt) == pytest.approx(2000, rel=0.01)
+    presupuesto = PresupuestoSalida(_items(60)).ajustar(prompt)
+    assert presupuesto.max_tokens <= 3000 - presupuesto.entrada_estimada
+    with pytest.raises(ContextoExcedidoError):
+        PresupuestoSalida(_items(8)).ajustar("x" * 12000)
+
+
+def test_informe_incluye_tokens_previstos_y_reales(interpretador, fake_llm, carta_real):
+    fake_llm.responder = lambda prompt: "Narrativa " * 200
+
+    resultado = asyncio.run(interpretador.generar_interpretacion_completa(carta_real, "femenino", "tropical", "completa"))
+    items = resultado["interpretaciones_individuales"]
+    tokens = resultado["tokens"]
+    pedido = fake_llm.requests[-1]
+
+    assert tokens["llamadas"] == 1
+    assert tokens["max_tokens"] == pedido["max_tokens"] < 16000
+    assert tokens["salida_prevista"] == PresupuestoSalida(items).salida_prevista
+    # El servidor falso informa len(texto) // 4 como completion_tokens
+    assert tokens["salida_real"] == len("Narrativa " * 200) // 4
+    assert tokens["entrada_real"] and tokens["entrada_estimada"]
+    assert f"Son {len(items)} elementos" in pedido["messages"][0]["content"]
+
+
+def test_profundidad_breve_usa_otro_prompt_presupuesto_y_cache(interpretador, fake_llm, carta_real):
+    fake_llm.responder = lambda prompt: "Narrativa " * 50
+
+    async def escenario():
+        profunda = await interpretador.generar_interpretacion_completa(carta_real, "femenino", "tropical", "completa")
+        breve = await interpretador.generar_interpretacion_completa(carta_real, "femenino", "tropical", "completa", "breve")
+        # Segunda vez: cada profundidad tiene su propia entrada en la caché
+        de_nuevo = await interpretador.generar_interpretacion_completa(carta_real, "femenino", "tropical", "completa", "breve")
+        return profunda, breve, de_nuevo
+
+    profunda, breve, de_nuevo = asyncio.run(escenario())
+    pedido_profunda, pedido_breve = fake_llm.requests
+    assert fake_llm.request_count == 2
+    assert de_nuevo["tokens"]["llamadas"] == 0
+    assert breve["tokens"]["max_tokens"] < profunda["tokens"]["max_tokens"] / 3
+    assert "visión general" in pedido_breve["messages"][0]["content"]
+    assert "visión general" not in pedido_profunda["messages"][0]["content"]
+
+
+def test_profundidad_o_modo_mal_escritos_responden_422(interpretador, carta_real, monkeypatch):
+    monkeypatch.setattr(app_module, "interpretador", interpretador)
+
+    async def escenario():
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            pedido = {"carta_natal": {"nombre": "Test", **carta_real}, "genero": "femenino"}
+            return [
+                await client.post(ruta, json={**pedido, **extra})
+                for ruta in ("/interpretar", "/interpretar/stream")
+                for extra in ({"profundidad": "brief"}, {"modo_narrativa": "seccion"})
+            ]
+
+    assert [r.status_code for r in asyncio.run(escenario())] == [422, 422, 422, 422]
+    # Fuera de la API un valor pedido desconocido es un error; solo el defecto del entorno se corrige
+    with pytest.raises(ValueError):
+        interpretador._resolver_profundidad("brief")
+    interpretador.NARRATIVA_PROFUNDIDAD_DEFECTO = "brief"
+    assert interpretador._resolver_profundidad(None) == "profunda"
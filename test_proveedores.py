@@ -0,0 +1,101 @@
+"""
+Tests del enrutamiento entre proveedores LLM con dos servidores locales de distinta latencia.
+"""
+
+import asyncio
+
+import pytest
+
+from fake_llm_server import FakeLLMServer
+from llm_client import shared_clients
+from resiliencia import ErrorLLM, reset_resiliencia
+from limitador import reset_limitador
+from proveedores import get_provider_stats, get_registro_proveedores, reset_proveedores
+from interpretador_refactored import BasetenLLM
+
+
+@pytest.fixture
+def dos_proveedores(monkeypatch):
+    """'lento' (primero en la configuración) y 'rapido', con nombres de modelo propios."""
+    reset_resiliencia()
+    reset_limitador()
+    reset_proveedores()
+    with FakeLLMServer(latency=0.3) as lento, FakeLLMServer() as rapido:
+        monkeypatch.setenv("LLM_PROVIDERS", "lento,rapido")
+        monkeypatch.setenv("LLM_ROUTING_MIN_SAMPLES", "2")
+        monkeypatch.setenv("LLM_MAX_RETRIES", "0")
+        for nombre, servidor in (("LENTO", lento), ("RAPIDO", rapido)):
+            monkeypatch.setenv(f"LLM_PROVIDER_{nombre}_BASE_URL", servidor.base_url)
+            monkeypatch.setenv(f"LLM_PROVIDER_{nombre}_API_KEY", "test")
+        monkeypatch.setenv("LLM_PROVIDER_RAPIDO_MODELS", "moonshotai/Kimi-K2.5=kimi-rapido")
+        yield lento, rapido
+    shared_clients.close_all()
+    reset_resiliencia()
+    reset_limitador()
+    reset_proveedores()
+
+
+def test_prefiere_el_proveedor_de_mejor_p95(dos_proveedores, monkeypatch):
+    lento, rapido = dos_proveedores
+    # Todo el tráfico de sondeo va al proveedor sin medir hasta que junta sus muestras
+    monkeypatch.setenv("LLM_ROUTING_PROBE_RATIO", "1")
+    llm = BasetenLLM(api_key="test")
+
+    async def escenario():
+        for _ in range(8):
+            await llm.acomplete("hola")
+        await shared_clients.aclose_all()
+
+    asyncio.run(escenario())
+    # Cada proveedor se mide con LLM_ROUTING_MIN_SAMPLES llamadas; después todo va al más rápido
+    assert lento.request_count == 2
+    assert rapido.request_count == 6
+    assert rapido.requests[-1]["model"] == "kimi-rapido"
+    assert lento.requests[-1]["model"] == "moonshotai/Kimi-K2.5"
+    stats = get_provider_stats()
+    assert stats["routing_order"] == {"general:moonshotai/Kimi-K2.5": ["rapido", "lento"]}
+    assert stats["providers"]["lento"]["latency_p95"] >= 0.3 > stats["providers"]["rapido"]["latency_p95"]
+
+
+def test_failover_ante_errores_y_timeouts(dos_proveedores):
+    lento, rapido = dos_proveedores
+    lento.fail_first, lento.latency = 1, 0.0
+
+    # 503 en el primer proveedor: la llamada sigue en el segundo
+    assert BasetenLLM(api_key="test").complete("hola").text.startswith("Respuesta simulada")
+    # Timeout en el primer proveedor (el orden se mantiene mientras no haya muestras suficientes)
+    lento.latency = 1.0
+    reset_resiliencia()
+    assert BasetenLLM(api_key="test", request_timeout=0.2).complete("hola").text.startswith("Respuesta simulada")
+
+    stats = get_registro_proveedores().stats()["providers"]
+    assert stats["lento"]["failovers"] == 2
+    assert stats["rapido"]["successes"] == 1
+    assert lento.request_count == 2 and rapido.request_count == 2
+
+
+def test_error_del_pedido_no_hace_failover(dos_proveedores):
+    lento, rapido = dos_proveedores
+    lento.fail_first, lento.error_status, lento.latency = 1, 400, 0.0
+    with pytest.raises(ErrorLLM):
+        BasetenLLM(api_key="test").complete("hola")
+    assert rapido.request_count == 0
+
+
+def test_proveedor_sin_medir_solo_recibe_sondeos_y_latencias_por_clase(dos_proveedores, monkeypatch):
+    lento, rapido = dos_proveedores
+    lento.latency = 0.0
+    monkeypatch.setenv("LLM_ROUTING_PROBE_RATIO", "0")
+    for _ in range(4):
+        BasetenLLM(api_key="test").complete("hola")
+    # Con el primario ya medido, el respaldo sin muestras no pasa adelante
+    assert lento.request_count == 4 and rapido.request_count == 0
+
+    registro = get_registro_proveedores()
+    for proveedor in registro.proveedores:
+        for _ in range(2):
+            proveedor.resiliencia()._registrar_latencia(0.1 if proveedor.nombre == "lento" else 5.0, "extraccion:m")
+            proveedor.resiliencia()._registrar_latencia(9.0 if proveedor.nombre == "lento" else 1.0, "narrativa:m")
+    # Cada clase se enruta con sus propias latencias
+    assert [p.nombre for p in registro.candidatos("extraccion:m")] == ["lento", "rapido"]
+    assert [p.nombre for p in registro.candidatos("narrativa:m")] == ["rapido", "lento"]
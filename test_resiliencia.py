@@ -0,0 +1,233 @@
+"""
+Tests de la capa de resiliencia del LLM (reintentos, breaker, pedidos duplicados, deadline)
+contra el servidor local falso.
+"""
+
+import time
+import asyncio
+import threading
+
+import pytest
+
+from fake_llm_server import FakeLLMServer
+from llm_client import shared_clients
+from resiliencia import ErrorLLM, CircuitoAbiertoError, CircuitBreaker, get_resiliencia, reset_resiliencia
+from limitador import LimitadorAdaptativo
+from interpretador_refactored import BasetenLLM
+
+
+@pytest.fixture(autouse=True)
+def politica_rapida(monkeypatch):
+    monkeypatch.setenv("LLM_RETRY_BASE_DELAY", "0.01")
+    monkeypatch.setenv("LLM_RETRY_MAX_DELAY", "0.05")
+    reset_resiliencia()
+    yield
+    shared_clients.close_all()
+    reset_resiliencia()
+
+
+def _acomplete(llm, prompt="hola", **kwargs):
+    async def escenario():
+        try:
+            return await llm.acomplete(prompt, **kwargs)
+        finally:
+            await shared_clients.aclose_all()
+    return asyncio.run(escenario())
+
+
+def test_reintenta_errores_transitorios():
+    with FakeLLMServer(fail_first=2, error_status=503) as server:
+        llm = BasetenLLM(api_key="test", base_url=server.base_url)
+        respuesta = _acomplete(llm)
+        assert respuesta.text.startswith("Respuesta simulada")
+        assert server.request_count == 3
+        stats = get_resiliencia(server.base_url).stats()
+        assert stats["retries"] == 2 and stats["successes"] == 1
+
+
+def test_error_no_reintentable_falla_enseguida():
+    with FakeLLMServer(fail_first=5, error_status=400) as server:
+        llm = BasetenLLM(api_key="test", base_url=server.base_url)
+        with pytest.raises(ErrorLLM):
+            llm.complete("hola")
+        assert server.request_count == 1
+        assert get_resiliencia(server.base_url).breaker.estado == "closed"
+
+
+def test_circuit_breaker_falla_rapido_y_se_recupera(monkeypatch):
+    monkeypatch.setenv("LLM_MAX_RETRIES", "0")
+    monkeypatch.setenv("LLM_BREAKER_FAILURE_THRESHOLD", "2")
+    monkeypatch.setenv("LLM_BREAKER_RESET_TIMEOUT", "0.3")
+    with FakeLLMServer(fail_first=100) as server:
+        llm = BasetenLLM(api_key="test", base_url=server.base_url)
+        for _ in range(2):
+            with pytest.raises(ErrorLLM):
+                llm.complete("hola")
+        inicio = time.monotonic()
+        with pytest.raises(CircuitoAbiertoError):
+            llm.complete("hola")
+        assert time.monotonic() - inicio < 0.05
+        assert server.request_count == 2
+
+        stats = get_resiliencia(server.base_url).stats()
+        assert stats["breaker"]["state"] == "open" and stats["short_circuited"] == 1
+
+        # Pasado el reset_timeout, una llamada de prueba exitosa cierra el circuito
+        server.fail_first = 0
+        time.sleep(0.35)
+        assert llm.complete("hola").text.startswith("Respuesta simulada")
+        assert get_resiliencia(server.base_url).breaker.estado == "closed"
+
+
+def test_pedido_duplicado_cuando_supera_el_percentil(monkeypatch):
+    monkeypatch.setenv("LLM_HEDGE_ENABLED", "true")
+    monkeypatch.setenv("LLM_HEDGE_MIN_SAMPLES", "3")
+    monkeypatch.setenv("LLM_HEDGE_MIN_DELAY", "0.1")
+    lento = threading.Event()
+
+    def responder(prompt):
+        # El primer pedido marcado como "lento" se demora; su duplicado responde enseguida
+        if "lento" in prompt and not lento.is_set():
+            lento.set()
+            time.sleep(2.0)
+        return "ok"
+
+    with FakeLLMServer(responder=responder) as server:
+        llm = BasetenLLM(api_key="test", base_url=server.base_url)
+
+        async def escenario():
+            for _ in range(3):
+                await llm.acomplete("rapido")
+            inicio = time.monotonic()
+            respuesta = await llm.acomplete("lento")
+            transcurrido = time.monotonic() - inicio
+            await shared_clients.aclose_all()
+            return respuesta, transcurrido
+
+        respuesta, transcurrido = asyncio.run(escenario())
+        assert respuesta.text == "ok"
+        assert transcurrido < 1.0
+        stats = get_resiliencia(server.base_url).stats()
+        assert stats["hedges"] == 1 and stats["hedge_wins"] == 1
+
+
+def test_deadline_acota_todos_los_reintentos():
+    with FakeLLMServer(latency=1.0) as server:
+        llm = BasetenLLM(api_key="test", base_url=server.base_url)
+        inicio = time.monotonic()
+        with pytest.raises(ErrorLLM):
+            _acomplete(llm, deadline=time.monotonic() + 0.3)
+        assert time.monotonic() - inicio < 0.8
+
+
+def test_la_cobertura_usa_las_latencias_de_su_clase(monkeypatch):
+    monkeypatch.setenv("LLM_HEDGE_ENABLED", "true")
+    monkeypatch.setenv("LLM_HEDGE_MIN_SAMPLES", "3")
+    monkeypatch.setenv("LLM_HEDGE_MIN_DELAY", "0.01")
+    resiliencia = get_resiliencia("clases")
+    for _ in range(5):
+        resiliencia._registrar_latencia(120.0, "narrativa:kimi")
+    for _ in range(3):
+        resiliencia._registrar_latencia(2.0, "extraccion:gpt-oss")
+
+    # Las narrativas lentas no fijan el umbral de las extracciones cortas
+    assert resiliencia.retraso_cobertura("extraccion:gpt-oss") == 2.0
+    assert resiliencia.retraso_cobertura("narrativa:kimi") == 120.0
+    assert resiliencia.retraso_cobertura("calendario:gpt-oss") is None
+    assert resiliencia.stats()["latency_by_class"]["extraccion:gpt-oss"]["samples"] == 3
+
+
+def test_un_400_no_cierra_el_breaker_semiabierto(monkeypatch):
+    monkeypatch.setenv("LLM_MAX_RETRIES", "0")
+    monkeypatch.setenv("LLM_BREAKER_FAILURE_THRESHOLD", "1")
+    monkeypatch.setenv("LLM_BREAKER_RESET_TIMEOUT", "0.1")
+    with FakeLLMServer(fail_first=1, error_status=503) as server:
+        llm = BasetenLLM(api_key="test", base_url=server.base_url)
+        with pytest.raises(ErrorLLM):
+            llm.complete("hola")
+        breaker = get_resiliencia(server.base_url).breaker
+        assert breaker.estado == CircuitBreaker.ABIERTO
+
+        # La llamada de prueba recibe un 400: error del pedido, no del proveedor
+        server.fail_first = 2
+        server.error_status = 400
+        time.sleep(0.15)
+        with pytest.raises(ErrorLLM):
+            llm.complete("hola")
+        assert breaker.estado == CircuitBreaker.SEMIABIERTO
+        # La prueba quedó libre: la siguiente llamada pasa y, si sale bien, cierra el circuito
+        server.fail_first = 0
+        assert llm.complete("hola").text.startswith("Respuesta simulada")
+        assert breaker.estado == CircuitBreaker.CERRADO
+
+
+def test_la_espera_en_el_limitador_no_cuenta_como_latencia():
+    resiliencia = get_resiliencia("cola")
+    limitador = LimitadorAdaptativo(inicial=1, minimo=1, maximo=1, max_cola=10)
+
+    async def intento():
+        async with limitador.permiso():
+            await asyncio.sleep(0.05)
+            return "ok"
+
+    async def escenario():
+        ocupado = await limitador.adquirir()
+        llamada = asyncio.create_task(resiliencia.ejecutar(intento, time.monotonic() + 5, clase="narrativa:kimi"))
+        await asyncio.sleep(0.3)
+        limitador.liberar(ocupado)
+        return await llamada
+
+    assert asyncio.run(escenario()) == "ok"
+    # ~0.35s desde el pedido, pero solo ~0.05s desde el turno del limitador
+    assert resiliencia.percentil(0.5, "narrativa:kimi") < 0.2
+
+
+def _resiliencia_con_cobertura(monkeypatch, nombre):
+    monkeypatch.setenv("LLM_HEDGE_ENABLED", "true")
+    monkeypatch.setenv("LLM_HEDGE_MIN_SAMPLES", "3")
+    monkeypatch.setenv("LLM_HEDGE_MIN_DELAY", "0.05")
+    resiliencia = get_resiliencia(nombre)
+    for _ in range(3):
+        resiliencia._registrar_latencia(0.05, "narrativa:kimi")
+    return resiliencia
+
+
+def test_la_rama_perdedora_termina_antes_de_devolver(monkeypatch):
+    resiliencia = _resiliencia_con_cobertura(monkeypatch, "perdedora")
+    llamadas = []
+    perdedora_cerrada = []
+
+    async def intento():
+        llamadas.append(1)
+        if len(llamadas) == 1:
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                await asyncio.sleep(0.05)  # p.ej. devolver el turno del limitador
+                perdedora_cerrada.append(1)
+                raise
+        return "ok"
+
+    async def escenario():
+        resultado = await resiliencia.ejecutar(intento, time.monotonic() + 5, cobertura=True, clase="narrativa:kimi")
+        return resultado, len(perdedora_cerrada)
+
+    assert asyncio.run(escenario()) == ("ok", 1)
+
+
+def test_una_rama_cancelada_desde_afuera_no_corta_la_cobertura(monkeypatch):
+    resiliencia = _resiliencia_con_cobertura(monkeypatch, "cancelada")
+    llamadas = []
+
+    async def intento():
+        llamadas.append(1)
+        if len(llamadas) == 1:
+            await asyncio.sleep(0.15)
+            asyncio.current_task().cancel()
+            await asyncio.sleep(1)
+        await asyncio.sleep(0.3)
+        return "ok"
+
+    resultado = asyncio.run(resiliencia.ejecutar(intento, time.monotonic() + 5, cobertura=True, clase="narrativa:kimi"))
+    assert resultado == "ok"
+    assert resiliencia.stats()["hedge_wins"] == 1
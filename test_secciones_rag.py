@@ -0,0 +1,89 @@
+"""
+Tests del almacén de secciones por título: consultas canónicas sin búsqueda vectorial.
+"""
+
+from typing import List
+
+from llama_index.core import Settings
+from llama_index.core.callbacks import CallbackManager
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.prompts import PromptTemplate
+
+from secciones_rag import AlmacenSecciones
+
+MARTE = """# marte: la acción y la voluntad
+## marte en los signos
+### marte en aries
+Marte en Aries actúa con impulso directo.
+### marte en tauro
+Marte en Tauro actúa con constancia.
+## aspectos de marte
+### marte cuadratura u oposición a júpiter
+Exceso de confianza en la acción.
+"""
+
+
+class EmbeddingContado(MockEmbedding):
+    """Embeddings falsos que cuentan las consultas embebidas (en producción, llamadas de red)."""
+
+    consultas: int = 0
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        self.consultas += 1
+        return super()._get_query_embedding(query)
+
+
+def test_encabezados_normalizados_y_alias_de_aspectos(tmp_path):
+    archivo = tmp_path / "8 - marte.md"
+    archivo.write_text(MARTE, encoding="utf-8")
+    almacen = AlmacenSecciones.desde_archivos([archivo], [])
+
+    seccion = almacen.buscar("Marte en Aries", "tropical")
+    assert seccion.texto == "### marte en aries\nMarte en Aries actúa con impulso directo."
+    # Misma normalización que _normalize_title y sin tildes, como _flexible_title_match
+    assert almacen.buscar("marte oposicion a jupiter", "tropical").titulo == "marte cuadratura u oposición a júpiter"
+    assert almacen.buscar("marte cuadratura a júpiter", "tropical") is not None
+    # Otro tipo de carta o un título inexistente van al respaldo vectorial
+    assert almacen.buscar("marte en aries", "draco") is None
+    assert almacen.buscar("marte en casa 3", "tropical") is None
+    assert almacen.stats()["hits"] == 3 and almacen.stats()["vector_fallbacks"] == 2
+
+
+def test_consulta_canonica_usa_la_seccion_exacta_sin_embeddings(interpretador, fake_llm, monkeypatch, tmp_path):
+    (tmp_path / "data" / "draco").mkdir(parents=True)
+    (tmp_path / "data" / "8 - marte.md").write_text(MARTE, encoding="utf-8")
+    monkeypatch.setenv("RAG_INDEX_DIR", str(tmp_path / "indices"))
+    interpretador._setup_llm_and_embeddings()
+    modelo = EmbeddingContado(embed_dim=8)
+    monkeypatch.setattr(Settings, "_embed_model", modelo)
+    interpretador._create_all_engines(sorted((tmp_path / "data").glob("[0-9]*.md")), [])
+
+    motor = interpretador._get_query_engine("tropical", llm=interpretador.llm_calendario)
+    motor.query("marte en tauro")
+    assert modelo.consultas == 0
+    prompt = fake_llm.requests[-1]["messages"][-1]["content"]
+    assert "Marte en Tauro actúa con constancia." in prompt and "impulso directo" not in prompt
+
+    # Sin encabezado: búsqueda vectorial sobre el índice
+    motor.query("la energía de marte")
+    assert modelo.consultas == 1
+    assert interpretador.secciones_rag.stats()["vector_fallbacks"] == 1
+
+
+def test_kwargs_del_motor_no_llegan_al_retriever(interpretador, fake_llm, monkeypatch, tmp_path):
+    (tmp_path / "data" / "draco").mkdir(parents=True)
+    (tmp_path / "data" / "8 - marte.md").write_text(MARTE, encoding="utf-8")
+    monkeypatch.setenv("RAG_INDEX_DIR", str(tmp_path / "indices"))
+    interpretador._setup_llm_and_embeddings()
+    monkeypatch.setattr(Settings, "_embed_model", EmbeddingContado(embed_dim=8))
+    interpretador._create_all_engines(sorted((tmp_path / "data").glob("[0-9]*.md")), [])
+
+    plantilla = PromptTemplate("PLANTILLA PROPIA\n{context_str}\n{query_str}")
+    # callback_manager en as_retriever() chocaría con el del índice (TypeError)
+    motor = interpretador._crear_motor_rag(
+        "tropical", similarity_top_k=1, text_qa_template=plantilla, llm=interpretador.llm_calendario,
+        callback_manager=CallbackManager()
+    )
+    assert motor.retriever._respaldo._similarity_top_k == 1
+    motor.query("marte en aries")
+    assert fake_llm.requests[-1]["messages"][-1]["content"].startswith("PLANTILLA PROPIA")
@@ -0,0 +1,98 @@
+"""
+Tests de la coalescencia single-flight de pedidos /interpretar idénticos.
+"""
+
+import asyncio
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def test_pedidos_identicos_comparten_una_generacion(interpretador, fake_llm, carta_real):
+    fake_llm.latency = 0.5
+
+    async def escenario():
+        return await asyncio.gather(
+            *[interpretador.generar_interpretacion_completa(carta_real, "femenino", "tropical") for _ in range(5)],
+            interpretador.generar_interpretacion_completa(carta_real, "masculino", "tropical"),
+        )
+
+    resultados = asyncio.run(escenario())
+    # Una generación para los 5 pedidos femeninos y otra para el masculino
+    assert fake_llm.request_count == 2
+    assert len({r["interpretacion_narrativa"] for r in resultados[:5]}) == 1
+    assert resultados[0] is not resultados[1]
+    assert interpretador.vuelos_interpretacion.stats()["coalesced"] == 4
+    assert interpretador.vuelos_interpretacion.en_curso() == 0
+
+
+def test_cancelar_un_pedido_no_cancela_a_los_demas():
+    vuelos = SingleFlight("test")
+    ejecuciones = []
+
+    async def trabajo():
+        ejecuciones.append(1)
+        await asyncio.sleep(0.3)
+        return "listo"
+
+    async def escenario():
+        primero = asyncio.create_task(vuelos.run("k", trabajo))
+        segundo = asyncio.create_task(vuelos.run("k", trabajo))
+        await asyncio.sleep(0.05)
+        primero.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await primero
+        return await segundo
+
+    assert asyncio.run(escenario()) == "listo"
+    assert len(ejecuciones) == 1
+    assert vuelos.stats()["cancelled"] == 0
+
+
+def test_la_tarea_se_cancela_cuando_no_queda_nadie():
+    vuelos = SingleFlight("test")
+    estado = {}
+
+    async def trabajo():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            estado["cancelada"] = True
+            raise
+
+    async def escenario():
+        pedidos = [asyncio.create_task(vuelos.run("k", trabajo)) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        for pedido in pedidos:
+            pedido.cancel()
+        await asyncio.gather(*pedidos, return_exceptions=True)
+        await asyncio.sleep(0)
+
+    asyncio.run(escenario())
+    assert estado.get("cancelada") is True
+    assert vuelos.stats() == {**vuelos.stats(), "executed": 1, "coalesced": 2, "cancelled": 1, "in_flight": 0}
+
+
+def test_pedido_identico_tras_cancelar_el_ultimo_abre_un_vuelo_nuevo():
+    vuelos = SingleFlight("test")
+    ejecuciones = []
+
+    async def trabajo():
+        ejecuciones.append(1)
+        await asyncio.sleep(0.1)
+        return "listo"
+
+    async def escenario():
+        primero = asyncio.create_task(vuelos.run("k", trabajo))
+        await asyncio.sleep(0.05)
+        primero.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await primero
+        # Misma clave en la misma iteración: el done-callback de la tarea cancelada aún no corrió
+        return await vuelos.run("k", trabajo)
+
+    assert asyncio.run(escenario()) == "listo"
+    assert len(ejecuciones) == 2
+    assert vuelos.stats()["cancelled"] == 1
+    assert vuelos.en_curso() == 0
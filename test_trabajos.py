@@ -0,0 +1,161 @@
+"""
+Tests de la API de trabajos asíncronos (/interpretar/jobs) contra el LLM local falso.
+"""
+
+import time
+import asyncio
+
+import httpx
+
+import app as app_module
+from fake_llm_server import FakeLLMServer
+from trabajos import AlmacenTrabajos, ColaTrabajos, EN_CURSO, COMPLETADO, PENDIENTE, vista_publica
+
+
+def _pedido(carta_real, **extra):
+    return {"carta_natal": {"nombre": "Test", **carta_real}, "genero": "femenino", "tipo": "tropical", **extra}
+
+
+async def _esperar_estado(client, job_id, estado, limite=10.0, campo="estado"):
+    inicio = time.monotonic()
+    while time.monotonic() - inicio < limite:
+        trabajo = (await client.get(f"/interpretar/jobs/{job_id}")).json()
+        if trabajo[campo] == estado:
+            return trabajo
+        await asyncio.sleep(0.05)
+    raise AssertionError(f"El trabajo {job_id} no llegó a '{estado}'")
+
+
+def test_trabajo_responde_enseguida_y_notifica_al_terminar(interpretador, fake_llm, carta_real, monkeypatch, tmp_path):
+    fake_llm.latency = 1.0
+    fake_llm.responder = lambda prompt: "Narrativa del trabajo"
+    monkeypatch.setattr(app_module, "interpretador", interpretador)
+    # El receptor local es http: solo en el test se relaja el requisito de https
+    monkeypatch.setenv("JOBS_CALLBACK_ALLOWED_HOSTS", "127.0.0.1")
+    monkeypatch.setenv("JOBS_CALLBACK_REQUIRE_HTTPS", "false")
+
+    with FakeLLMServer() as receptor:
+        async def escenario():
+            cola = ColaTrabajos(interpretador, AlmacenTrabajos(str(tmp_path / "trabajos.sqlite3")), workers=2)
+            await cola.iniciar()
+            monkeypatch.setattr(app_module, "cola_trabajos", cola)
+            transport = httpx.ASGITransport(app=app_module.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                inicio = time.monotonic()
+                creado = await client.post("/interpretar/jobs", json=_pedido(carta_real, callback_url=f"{receptor.base_url}/callback"))
+                tiempo_respuesta = time.monotonic() - inicio
+                # El callback se envía después de marcar el trabajo como completado
+                final = await _esperar_estado(client, creado.json()["job_id"], "entregado", campo="callback_estado")
+                no_existe = await client.get("/interpretar/jobs/inexistente")
+            await cola.detener()
+            return creado, tiempo_respuesta, final, no_existe
+
+        creado, tiempo_respuesta, final, no_existe = asyncio.run(escenario())
+
+        assert creado.status_code == 202
+        assert tiempo_respuesta < 0.5
+        assert creado.json()["estado"] == "pendiente"
+        # Las interpretaciones deterministas vuelven ya en la respuesta del POST
+        assert creado.json()["interpretaciones_individuales"]
+        assert any(item["titulo"] == "Sol en Capricornio" for item in creado.json()["interpretaciones_individuales"])
+        assert final["estado"] == COMPLETADO
+        assert any(item["titulo"] == "Sol en Capricornio" for item in final["interpretaciones_individuales"])
+        assert final["interpretacion_narrativa"] == "Narrativa del trabajo"
+        assert no_existe.status_code == 404
+        assert receptor.requests[0]["estado"] == COMPLETADO
+        assert receptor.requests[0]["job_id"] == creado.json()["job_id"]
+
+
+def test_reinicio_retoma_trabajos_sin_terminar(interpretador, fake_llm, carta_real, tmp_path):
+    fake_llm.responder = lambda prompt: "Narrativa recuperada"
+    path = str(tmp_path / "trabajos.sqlite3")
+
+    async def escenario():
+        # Un trabajo que quedó "en_curso" cuando el proceso anterior se cortó
+        items = await interpretador._obtener_interpretaciones_individuales(carta_real, "tropical")
+        almacen = AlmacenTrabajos(path)
+        trabajo_id = almacen.crear(_pedido(carta_real), items)
+        almacen.actualizar(trabajo_id, estado=EN_CURSO)
+        almacen.close()
+
+        cola = ColaTrabajos(interpretador, AlmacenTrabajos(path), workers=1)
+        await cola.iniciar()
+        await asyncio.wait_for(cola._cola.join(), timeout=10)
+        await cola.detener()
+        return cola.almacen.obtener(trabajo_id)
+
+    trabajo = asyncio.run(escenario())
+    assert trabajo["estado"] == COMPLETADO
+    assert trabajo["interpretacion_narrativa"] == "Narrativa recuperada"
+
+
+def test_callback_fuera_de_la_lista_o_sin_https_se_rechaza(interpretador, carta_real, monkeypatch, tmp_path):
+    monkeypatch.setattr(app_module, "interpretador", interpretador)
+    monkeypatch.setenv("JOBS_CALLBACK_ALLOWED_HOSTS", "hooks.ejemplo.com")
+
+    async def escenario():
+        cola = ColaTrabajos(interpretador, AlmacenTrabajos(str(tmp_path / "trabajos.sqlite3")), workers=1)
+        await cola.iniciar()
+        monkeypatch.setattr(app_module, "cola_trabajos", cola)
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            respuestas = [
+                await client.post("/interpretar/jobs", json=_pedido(carta_real, callback_url=url))
+                for url in ("https://169.254.169.254/latest/meta-data", "http://hooks.ejemplo.com/cb", "no-es-una-url")
+            ]
+        await cola.detener()
+        return respuestas, cola.almacen.contar(PENDIENTE)
+
+    respuestas, pendientes = asyncio.run(escenario())
+    assert [r.status_code for r in respuestas] == [422, 422, 422]
+    assert pendientes == 0
+
+
+def test_max_latency_ms_del_trabajo_degrada_la_narrativa(interpretador, fake_llm, carta_real, tmp_path):
+    fake_llm.latency = 3.0
+
+    async def escenario():
+        cola = ColaTrabajos(interpretador, AlmacenTrabajos(str(tmp_path / "trabajos.sqlite3")), workers=1)
+        await cola.iniciar()
+        creado = await cola.encolar(_pedido(carta_real, max_latency_ms=300))
+        inicio = time.monotonic()
+        await asyncio.wait_for(cola._cola.join(), timeout=10)
+        transcurrido = time.monotonic() - inicio
+        await cola.detener()
+        return vista_publica(cola.almacen.obtener(creado["id"])), transcurrido
+
+    trabajo, transcurrido = asyncio.run(escenario())
+    assert trabajo["estado"] == COMPLETADO
+    assert trabajo["degradada"] is True
+    assert trabajo["motivo_degradacion"] == "plantilla:sin_tiempo"
+    assert trabajo["interpretacion_narrativa"]
+    assert transcurrido < 1.5
+
+
+def test_callback_fallido_no_retiene_al_worker(interpretador, fake_llm, carta_real, monkeypatch, tmp_path):
+    fake_llm.responder = lambda prompt: "Narrativa"
+    monkeypatch.setenv("JOBS_CALLBACK_ALLOWED_HOSTS", "127.0.0.1")
+    monkeypatch.setenv("JOBS_CALLBACK_REQUIRE_HTTPS", "false")
+
+    with FakeLLMServer(latency=0.5, fail_first=100) as receptor:
+        async def escenario():
+            cola = ColaTrabajos(interpretador, AlmacenTrabajos(str(tmp_path / "trabajos.sqlite3")), workers=1,
+                                callback_reintentos=2)
+            await cola.iniciar()
+            creado = await cola.encolar(_pedido(carta_real), f"{receptor.base_url}/callback")
+            await asyncio.wait_for(cola._cola.join(), timeout=10)
+            # El worker ya volvió a la cola mientras el callback sigue reintentando
+            estado_al_liberar = cola.almacen.obtener(creado["id"])["callback_estado"]
+            inicio = time.monotonic()
+            await asyncio.wait_for(asyncio.gather(*cola._notificaciones), timeout=10)
+            espera_callback = time.monotonic() - inicio
+            await cola.detener()
+            return estado_al_liberar, espera_callback, cola.almacen.obtener(creado["id"])["callback_estado"]
+
+        estado_al_liberar, espera_callback, estado_final = asyncio.run(escenario())
+
+    assert estado_al_liberar is None
+    assert estado_final == "fallido: HTTP 500"
+    assert receptor.request_count == 2
+    # Dos intentos de ~0.5s y un solo backoff (≤0.5s): sin espera tras el último intento
+    assert espera_callback < 1.6
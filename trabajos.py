@@ -0,0 +1,332 @@
+"""
+Trabajos asíncronos de interpretación (POST /interpretar/jobs, GET /interpretar/jobs/{id}).
+- El pedido se responde enseguida con el id del trabajo y las interpretaciones deterministas (motor JSON)
+- La narrativa (y el RAG de respaldo, si el motor JSON no cubre la carta) se genera en un pool acotado de workers
+- max_latency_ms acota la generación desde que un worker toma el trabajo: la narrativa puede
+  quedar degradada (parcial o por plantilla) y el trabajo lo informa en degradada/motivo_degradacion
+- Estado persistido en SQLite: un reinicio vuelve a encolar lo pendiente y lo que estaba en curso
+- Callback opcional (POST JSON) al terminar, con reintentos, solo a hosts https de una lista permitida
+
+    JOBS_CALLBACK_ALLOWED_HOSTS=hooks.ejemplo.com,.interno.ejemplo.com
+    JOBS_CALLBACK_REQUIRE_HTTPS=true
+"""
+
+import os
+import json
+import time
+import uuid
+import random
+import asyncio
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+from urllib.parse import urlsplit
+
+import httpx
+
+PENDIENTE = "pendiente"
+EN_CURSO = "en_curso"
+COMPLETADO = "completado"
+ERROR = "error"
+
+
+class ColaLlenaError(RuntimeError):
+    """Hay demasiados trabajos sin terminar: el cliente debe reintentar más tarde."""
+
+
+class CallbackNoPermitidoError(ValueError):
+    """El callback_url no es https o su host no está en JOBS_CALLBACK_ALLOWED_HOSTS."""
+
+
+def hosts_callback_permitidos() -> List[str]:
+    """Hosts de JOBS_CALLBACK_ALLOWED_HOSTS; '.dominio' permite también sus subdominios."""
+    return [h.strip().lower() for h in os.getenv("JOBS_CALLBACK_ALLOWED_HOSTS", "").split(",") if h.strip()]
+
+
+def validar_callback_url(url: str, hosts: Optional[List[str]] = None, requiere_https: Optional[bool] = None):
+    """Rechazar callbacks que permitirían al servicio hacer POST a destinos arbitrarios (SSRF)."""
+    hosts = hosts if hosts is not None else hosts_callback_permitidos()
+    if requiere_https is None:
+        requiere_https = os.getenv("JOBS_CALLBACK_REQUIRE_HTTPS", "true").lower() == "true"
+    partes = urlsplit(url)
+    esquemas = ("https",) if requiere_https else ("https", "http")
+    if partes.scheme not in esquemas:
+        raise CallbackNoPermitidoError(f"callback_url debe usar {' o '.join(esquemas)}")
+    host = (partes.hostname or "").lower()
+    if not host:
+        raise CallbackNoPermitidoError("callback_url sin host")
+    if not any(host == h or (h.startswith(".") and host.endswith(h)) for h in hosts):
+        raise CallbackNoPermitidoError(f"Host de callback no permitido: {host} (ver JOBS_CALLBACK_ALLOWED_HOSTS)")
+
+
+class AlmacenTrabajos:
+    """Tabla de trabajos en SQLite, segura para usar desde varios hilos."""
+
+    def __init__(self, path: Optional[str] = None, max_age_seconds: Optional[float] = None):
+        self.path = path or os.getenv("JOBS_DB_PATH", "cache/trabajos.sqlite3")
+        self.max_age_seconds = max_age_seconds if max_age_seconds is not None else float(os.getenv("JOBS_RETENTION", 7 * 24 * 3600))
+        self._lock = threading.Lock()
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS trabajos ("
+            " id TEXT PRIMARY KEY,"
+            " estado TEXT NOT NULL,"
+            " pedido TEXT NOT NULL,"
+            " interpretaciones_individuales TEXT NOT NULL,"
+            " interpretacion_narrativa TEXT,"
+            " error TEXT,"
+            " tiempo_generacion REAL,"
+            " callback_url TEXT,"
+            " callback_estado TEXT,"
+            " degradada INTEGER NOT NULL DEFAULT 0,"
+            " motivo_degradacion TEXT,"
+            " creado REAL NOT NULL,"
+            " actualizado REAL NOT NULL)"
+        )
+        # Bases creadas antes de max_latency_ms en los trabajos
+        columnas = {fila["name"] for fila in self._conn.execute("PRAGMA table_info(trabajos)")}
+        if "degradada" not in columnas:
+            self._conn.execute("ALTER TABLE trabajos ADD COLUMN degradada INTEGER NOT NULL DEFAULT 0")
+        if "motivo_degradacion" not in columnas:
+            self._conn.execute("ALTER TABLE trabajos ADD COLUMN motivo_degradacion TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_trabajos_estado ON trabajos (estado, creado)")
+        self._conn.commit()
+
+    def crear(self, pedido: Dict[str, Any], interpretaciones_individuales: Optional[List[Dict[str, Any]]] = None,
+              callback_url: Optional[str] = None) -> str:
+        ahora = time.time()
+        trabajo_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO trabajos (id, estado, pedido, interpretaciones_individuales, callback_url, creado, actualizado)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (trabajo_id, PENDIENTE, json.dumps(pedido, ensure_ascii=False),
+                 json.dumps(interpretaciones_individuales or [], ensure_ascii=False), callback_url, ahora, ahora)
+            )
+            self._purgar(ahora)
+            self._conn.commit()
+        return trabajo_id
+
+    def obtener(self, trabajo_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            fila = self._conn.execute("SELECT * FROM trabajos WHERE id = ?", (trabajo_id,)).fetchone()
+        if fila is None:
+            return None
+        trabajo = dict(fila)
+        trabajo["pedido"] = json.loads(trabajo["pedido"])
+        trabajo["interpretaciones_individuales"] = json.loads(trabajo["interpretaciones_individuales"])
+        trabajo["degradada"] = bool(trabajo["degradada"])
+        return trabajo
+
+    def actualizar(self, trabajo_id: str, **campos):
+        campos["actualizado"] = time.time()
+        columnas = ", ".join(f"{nombre} = ?" for nombre in campos)
+        with self._lock:
+            self._conn.execute(f"UPDATE trabajos SET {columnas} WHERE id = ?", (*campos.values(), trabajo_id))
+            self._conn.commit()
+
+    def sin_terminar(self) -> List[str]:
+        """Ids pendientes o en curso (estos últimos quedaron cortados por un reinicio), por antigüedad."""
+        with self._lock:
+            filas = self._conn.execute(
+                "SELECT id FROM trabajos WHERE estado IN (?, ?) ORDER BY creado", (PENDIENTE, EN_CURSO)
+            ).fetchall()
+        return [fila["id"] for fila in filas]
+
+    def contar(self, estado: str) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM trabajos WHERE estado = ?", (estado,)).fetchone()[0]
+
+    def _purgar(self, ahora: float):
+        """Borrar trabajos terminados más viejos que JOBS_RETENTION."""
+        self._conn.execute(
+            "DELETE FROM trabajos WHERE estado IN (?, ?) AND actualizado < ?",
+            (COMPLETADO, ERROR, ahora - self.max_age_seconds)
+        )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ColaTrabajos:
+    """Pool acotado de workers asyncio que generan las narrativas de los trabajos."""
+
+    def __init__(self, interpretador, almacen: AlmacenTrabajos, workers: Optional[int] = None,
+                 max_pendientes: Optional[int] = None, callback_timeout: float = 10.0, callback_reintentos: int = 3):
+        self.interpretador = interpretador
+        self.almacen = almacen
+        self.workers = workers if workers is not None else int(os.getenv("JOBS_WORKERS", 4))
+        self.max_pendientes = max_pendientes if max_pendientes is not None else int(os.getenv("JOBS_QUEUE_MAX", 1000))
+        self.callback_timeout = callback_timeout
+        self.callback_reintentos = callback_reintentos
+        self._cola: Optional[asyncio.Queue] = None
+        self._tareas: List[asyncio.Task] = []
+        # Callbacks en entrega: corren aparte para que sus reintentos no retengan a un worker
+        self._notificaciones: Set[asyncio.Task] = set()
+        self.completados = 0
+        self.fallidos = 0
+
+    async def iniciar(self):
+        """Lanzar los workers y volver a encolar lo que quedó sin terminar en la base."""
+        self._cola = asyncio.Queue()
+        pendientes = self.almacen.sin_terminar()
+        for trabajo_id in pendientes:
+            self.almacen.actualizar(trabajo_id, estado=PENDIENTE)
+            self._cola.put_nowait(trabajo_id)
+        self._tareas = [asyncio.create_task(self._worker(n)) for n in range(self.workers)]
+        print(f"🧵 Cola de trabajos iniciada: {self.workers} workers, {len(pendientes)} trabajos recuperados")
+
+    async def detener(self):
+        """Cancelar los workers y los callbacks en entrega; los trabajos en curso quedan 'en_curso' y se retoman al reiniciar."""
+        tareas = [*self._tareas, *self._notificaciones]
+        for tarea in tareas:
+            tarea.cancel()
+        await asyncio.gather(*tareas, return_exceptions=True)
+        self._tareas = []
+        self._notificaciones.clear()
+
+    async def encolar(self, pedido: Dict[str, Any], callback_url: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Registrar un trabajo con las interpretaciones deterministas (motor JSON, sin RAG ni LLM)
+        y dejarlo en cola; el RAG de respaldo y la narrativa quedan para el worker.
+        """
+        if self._cola is None:
+            raise RuntimeError("La cola de trabajos no está iniciada")
+        if self._cola.qsize() >= self.max_pendientes:
+            raise ColaLlenaError(f"Hay {self._cola.qsize()} trabajos en cola (máximo {self.max_pendientes})")
+        if callback_url:
+            validar_callback_url(callback_url)
+        interpretaciones_individuales = self.interpretador._interpretaciones_deterministas(
+            pedido["carta_natal"], pedido.get("tipo", "tropical")
+        )
+        trabajo_id = self.almacen.crear(pedido, interpretaciones_individuales, callback_url=callback_url)
+        self._cola.put_nowait(trabajo_id)
+        return self.almacen.obtener(trabajo_id)
+
+    async def _worker(self, numero: int):
+        while True:
+            trabajo_id = await self._cola.get()
+            try:
+                await self._procesar(trabajo_id)
+            except Exception as e:
+                print(f"❌ Worker {numero}: error inesperado en el trabajo {trabajo_id}: {e}")
+            finally:
+                self._cola.task_done()
+
+    async def _procesar(self, trabajo_id: str):
+        trabajo = self.almacen.obtener(trabajo_id)
+        if trabajo is None or trabajo["estado"] not in (PENDIENTE, EN_CURSO):
+            return
+        pedido = trabajo["pedido"]
+        self.almacen.actualizar(trabajo_id, estado=EN_CURSO)
+        inicio = time.time()
+        # max_latency_ms acota el cómputo del trabajo desde que un worker lo toma (no la espera en cola)
+        max_latency_ms = pedido.get("max_latency_ms")
+        deadline = None if not max_latency_ms else time.monotonic() + max_latency_ms / 1000
+        motivo_degradacion = None
+        try:
+            interpretaciones_individuales = trabajo["interpretaciones_individuales"]
+            if not interpretaciones_individuales:
+                # El motor JSON no cubre esta carta (o el trabajo es anterior): RAG de respaldo
+                try:
+                    async with asyncio.timeout(None if deadline is None else deadline - time.monotonic()):
+                        interpretaciones_individuales = await self.interpretador._obtener_interpretaciones_individuales(
+                            pedido["carta_natal"], pedido.get("tipo", "tropical")
+                        )
+                except TimeoutError:
+                    raise TimeoutError("El presupuesto de latencia se agotó antes de tener las interpretaciones individuales")
+                self.almacen.actualizar(trabajo_id, interpretaciones_individuales=json.dumps(
+                    interpretaciones_individuales, ensure_ascii=False))
+            if deadline is None:
+                narrativa = await self.interpretador._generar_narrativa(
+                    interpretaciones_individuales,
+                    pedido["genero"],
+                    pedido.get("tipo", "tropical"),
+                    pedido.get("modo_narrativa"),
+                    pedido.get("profundidad")
+                )
+            else:
+                narrativa, motivo_degradacion = await self.interpretador._generar_narrativa_con_deadline(
+                    interpretaciones_individuales,
+                    pedido["genero"],
+                    pedido.get("tipo", "tropical"),
+                    pedido.get("modo_narrativa"),
+                    pedido.get("profundidad"),
+                    deadline
+                )
+        except Exception as e:
+            print(f"❌ Trabajo {trabajo_id} falló: {e}")
+            self.fallidos += 1
+            self.almacen.actualizar(trabajo_id, estado=ERROR, error=str(e) or type(e).__name__,
+                                    tiempo_generacion=time.time() - inicio)
+        else:
+            self.completados += 1
+            self.almacen.actualizar(trabajo_id, estado=COMPLETADO, interpretacion_narrativa=narrativa,
+                                    degradada=int(motivo_degradacion is not None),
+                                    motivo_degradacion=motivo_degradacion,
+                                    tiempo_generacion=time.time() - inicio)
+            print(f"✅ Trabajo {trabajo_id} completado en {time.time() - inicio:.2f} segundos")
+        if trabajo["callback_url"]:
+            tarea = asyncio.create_task(self._notificar(trabajo_id, trabajo["callback_url"]))
+            self._notificaciones.add(tarea)
+            tarea.add_done_callback(self._notificaciones.discard)
+
+    async def _notificar(self, trabajo_id: str, url: str):
+        """POST del estado final al callback; reintenta con backoff y registra el resultado."""
+        try:
+            # De nuevo aquí: los trabajos recuperados tras un reinicio pueden venir de otra configuración
+            validar_callback_url(url)
+        except CallbackNoPermitidoError as e:
+            print(f"⚠️ Callback del trabajo {trabajo_id} descartado: {e}")
+            self.almacen.actualizar(trabajo_id, callback_estado=f"rechazado: {e}")
+            return
+        cuerpo = vista_publica(self.almacen.obtener(trabajo_id))
+        ultimo_error = ""
+        async with httpx.AsyncClient(timeout=self.callback_timeout) as client:
+            for intento in range(self.callback_reintentos):
+                try:
+                    respuesta = await client.post(url, json=cuerpo)
+                    if respuesta.status_code < 400:
+                        self.almacen.actualizar(trabajo_id, callback_estado="entregado")
+                        return
+                    ultimo_error = f"HTTP {respuesta.status_code}"
+                except httpx.HTTPError as e:
+                    ultimo_error = str(e) or type(e).__name__
+                if intento < self.callback_reintentos - 1:
+                    await asyncio.sleep(random.uniform(0, 0.5 * (2 ** intento)))
+        print(f"⚠️ Callback del trabajo {trabajo_id} no entregado: {ultimo_error}")
+        self.almacen.actualizar(trabajo_id, callback_estado=f"fallido: {ultimo_error}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "queue_depth": self._cola.qsize() if self._cola is not None else 0,
+            "queue_max": self.max_pendientes,
+            "in_progress": self.almacen.contar(EN_CURSO),
+            "callbacks_pending": len(self._notificaciones),
+            "completed": self.completados,
+            "failed": self.fallidos,
+        }
+
+
+def vista_publica(trabajo: Dict[str, Any]) -> Dict[str, Any]:
+    """Campos del trabajo que se devuelven al cliente (sin el pedido original)."""
+    return {
+        "job_id": trabajo["id"],
+        "estado": trabajo["estado"],
+        "interpretaciones_individuales": trabajo["interpretaciones_individuales"],
+        "interpretacion_narrativa": trabajo["interpretacion_narrativa"],
+        "error": trabajo["error"],
+        "tiempo_generacion": trabajo["tiempo_generacion"],
+        "degradada": trabajo["degradada"],
+        "motivo_degradacion": trabajo["motivo_degradacion"],
+        "callback_estado": trabajo["callback_estado"],
+        "creado": trabajo["creado"],
+        "actualizado": trabajo["actualizado"],
+    }